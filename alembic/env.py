@@ -11,6 +11,11 @@ sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from app.database import Base
 from app.models.user import User
 from app.models.cita import Cita
+from app.models.recurso import Recurso
+from app.models.idempotencia import RespuestaIdempotente
+from app.models.recordatorio import Recordatorio
+from app.models.liderazgo import Liderazgo
+from app.models.cita_archivada import CitaArchivada
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -0,0 +1,63 @@
+"""esquema inicial: users y citas
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('username', sa.String(length=50), nullable=False),
+        sa.Column('email', sa.String(length=100), nullable=False),
+        sa.Column('full_name', sa.String(length=100), nullable=False),
+        sa.Column('hashed_password', sa.String(length=255), nullable=False),
+        sa.Column('role', sa.String(length=20), nullable=False),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_users_id', 'users', ['id'], unique=False)
+    op.create_index('ix_users_username', 'users', ['username'], unique=True)
+    op.create_index('ix_users_email', 'users', ['email'], unique=True)
+
+    op.create_table(
+        'citas',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('motivo', sa.String(length=100), nullable=False),
+        sa.Column('fecha_hora', sa.DateTime(), nullable=False),
+        sa.Column('paciente_id', sa.Integer(), nullable=True),
+        sa.Column('estado', sa.String(length=20), nullable=True),
+        sa.Column('notas', sa.String(length=500), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['paciente_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_citas_id', 'citas', ['id'], unique=False)
+    op.create_index('ix_citas_fecha_hora', 'citas', ['fecha_hora'], unique=False)
+    op.create_index('ix_citas_paciente_id', 'citas', ['paciente_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_citas_paciente_id', table_name='citas')
+    op.drop_index('ix_citas_fecha_hora', table_name='citas')
+    op.drop_index('ix_citas_id', table_name='citas')
+    op.drop_table('citas')
+    op.drop_index('ix_users_email', table_name='users')
+    op.drop_index('ix_users_username', table_name='users')
+    op.drop_index('ix_users_id', table_name='users')
+    op.drop_table('users')
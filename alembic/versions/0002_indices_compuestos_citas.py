@@ -0,0 +1,41 @@
+"""índices compuestos y parcial de citas para las consultas del servicio
+
+- (estado, fecha_hora): verificación de conflictos de horario y filtros admin
+- (paciente_id, estado, fecha_hora): citas del paciente, citas de hoy y
+  verificación de cita en el mismo día
+- (fecha_hora, id): paginación keyset del listado admin
+- fecha_hora WHERE estado = 'programada': conflicto de horario solo sobre
+  citas activas, sin indexar el histórico completado/cancelado
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_citas_estado_fecha_hora', 'citas', ['estado', 'fecha_hora'], unique=False)
+    op.create_index('ix_citas_paciente_estado_fecha_hora', 'citas', ['paciente_id', 'estado', 'fecha_hora'], unique=False)
+    op.create_index('ix_citas_fecha_hora_id', 'citas', ['fecha_hora', 'id'], unique=False)
+    op.create_index(
+        'ix_citas_programadas_fecha_hora', 'citas', ['fecha_hora'], unique=False,
+        postgresql_where=sa.text("estado = 'programada'"),
+        sqlite_where=sa.text("estado = 'programada'")
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_citas_programadas_fecha_hora', table_name='citas')
+    op.drop_index('ix_citas_fecha_hora_id', table_name='citas')
+    op.drop_index('ix_citas_paciente_estado_fecha_hora', table_name='citas')
+    op.drop_index('ix_citas_estado_fecha_hora', table_name='citas')
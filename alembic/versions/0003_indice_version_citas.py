@@ -0,0 +1,27 @@
+"""índice (paciente_id, estado, updated_at) para la versión de las citas de un paciente
+
+Con If-None-Match, GET /citas y /citas/hoy comparan count(*) y
+max(updated_at) de las citas activas del paciente; con este índice la
+consulta de /citas no toca la tabla.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 18:10:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_citas_paciente_estado_updated_at', 'citas', ['paciente_id', 'estado', 'updated_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_citas_paciente_estado_updated_at', table_name='citas')
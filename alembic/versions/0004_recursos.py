@@ -0,0 +1,57 @@
+"""recursos (doctores y salas) y agenda por recurso en citas
+
+- recursos: servicio (motivo) que atiende, capacidad y horario de cada
+  doctor o sala
+- citas.recurso_id: nulo para las citas existentes, que siguen en la agenda
+  general del hospital
+- (recurso_id, estado, fecha_hora): verificación de conflictos por recurso
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'recursos',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('nombre', sa.String(length=100), nullable=False),
+        sa.Column('tipo', sa.String(length=20), nullable=False),
+        sa.Column('motivo', sa.String(length=100), nullable=False),
+        sa.Column('capacidad', sa.Integer(), nullable=False),
+        sa.Column('hora_inicio', sa.Time(), nullable=False),
+        sa.Column('hora_fin', sa.Time(), nullable=False),
+        sa.Column('activo', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_recursos_id', 'recursos', ['id'], unique=False)
+    op.create_index('ix_recursos_motivo_activo', 'recursos', ['motivo', 'activo'], unique=False)
+
+    # batch_alter_table para que la clave foránea también se pueda añadir en SQLite
+    with op.batch_alter_table('citas') as batch_op:
+        batch_op.add_column(sa.Column('recurso_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_citas_recurso_id', 'recursos', ['recurso_id'], ['id'])
+    op.create_index('ix_citas_recurso_estado_fecha_hora', 'citas', ['recurso_id', 'estado', 'fecha_hora'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_citas_recurso_estado_fecha_hora', table_name='citas')
+    with op.batch_alter_table('citas') as batch_op:
+        batch_op.drop_constraint('fk_citas_recurso_id', type_='foreignkey')
+        batch_op.drop_column('recurso_id')
+    op.drop_index('ix_recursos_motivo_activo', table_name='recursos')
+    op.drop_index('ix_recursos_id', table_name='recursos')
+    op.drop_table('recursos')
@@ -0,0 +1,83 @@
+"""exclusividad de la agenda en la base de datos
+
+crear_cita verifica conflictos y luego inserta; sin ayuda de la base de
+datos dos reservas simultáneas del mismo horario pasan ambas la
+verificación. Dos citas programadas del mismo recurso y plaza a 30 minutos
+o menos quedan prohibidas:
+
+- citas.plaza: puesto del recurso (0 .. capacidad - 1); las programadas
+  existentes de un recurso a la misma hora reciben plazas consecutivas
+- PostgreSQL: restricción de exclusión ex_citas_agenda_programada sobre
+  (recurso, plaza, tsrange cerrado de 30 minutos) con btree_gist
+- SQLite: triggers BEFORE INSERT/UPDATE que abortan con ese mismo nombre
+
+Si la tabla ya tiene citas programadas que chocan (reservas concurrentes
+anteriores a esta migración), hay que cancelar una de cada par antes de
+aplicarla.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 21:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+CHOQUE_SQLITE = """
+    SELECT RAISE(ABORT, 'ex_citas_agenda_programada') WHERE EXISTS (
+        SELECT 1 FROM citas
+        WHERE recurso_id IS NEW.recurso_id AND estado = 'programada' AND plaza = NEW.plaza{otra}
+          AND fecha_hora BETWEEN datetime(NEW.fecha_hora, '-31 minutes') AND datetime(NEW.fecha_hora, '+31 minutes')
+          AND abs(julianday(fecha_hora) - julianday(NEW.fecha_hora)) <= 30.0 / 1440 + 1e-8
+    );
+"""
+
+
+def upgrade() -> None:
+    op.add_column('citas', sa.Column('plaza', sa.Integer(), nullable=False, server_default='0'))
+    op.execute("""
+        UPDATE citas SET plaza = (
+            SELECT count(*) FROM citas AS otra
+            WHERE otra.recurso_id = citas.recurso_id AND otra.estado = 'programada'
+              AND otra.fecha_hora = citas.fecha_hora AND otra.id < citas.id
+        )
+        WHERE recurso_id IS NOT NULL AND estado = 'programada'
+    """)
+
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+        op.execute("""
+            ALTER TABLE citas ADD CONSTRAINT ex_citas_agenda_programada EXCLUDE USING gist (
+                (COALESCE(recurso_id, 0)) WITH =,
+                plaza WITH =,
+                tsrange(fecha_hora, fecha_hora + interval '30 minutes', '[]') WITH &&
+            ) WHERE (estado = 'programada')
+        """)
+    elif op.get_bind().dialect.name == 'sqlite':
+        op.execute(f"""
+            CREATE TRIGGER ex_citas_agenda_programada_insert BEFORE INSERT ON citas
+            WHEN NEW.estado = 'programada'
+            BEGIN {CHOQUE_SQLITE.format(otra="")} END
+        """)
+        op.execute(f"""
+            CREATE TRIGGER ex_citas_agenda_programada_update BEFORE UPDATE OF fecha_hora, estado, recurso_id, plaza ON citas
+            WHEN NEW.estado = 'programada'
+            BEGIN {CHOQUE_SQLITE.format(otra=" AND id != NEW.id")} END
+        """)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('ALTER TABLE citas DROP CONSTRAINT IF EXISTS ex_citas_agenda_programada')
+    elif op.get_bind().dialect.name == 'sqlite':
+        op.execute('DROP TRIGGER IF EXISTS ex_citas_agenda_programada_insert')
+        op.execute('DROP TRIGGER IF EXISTS ex_citas_agenda_programada_update')
+    with op.batch_alter_table('citas') as batch_op:
+        batch_op.drop_column('plaza')
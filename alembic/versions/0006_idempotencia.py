@@ -0,0 +1,39 @@
+"""respuestas guardadas por Idempotency-Key
+
+Tabla idempotencia para IDEMPOTENCIA_BACKEND=db: todos los workers ven la
+respuesta (o la reserva en curso) de cada clave. expira indexada para
+borrar las caducadas.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 23:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'idempotencia',
+        sa.Column('clave', sa.String(length=320), nullable=False),
+        sa.Column('huella', sa.String(length=64), nullable=False),
+        sa.Column('estado', sa.Integer(), nullable=True),
+        sa.Column('cabeceras', sa.Text(), nullable=True),
+        sa.Column('cuerpo', sa.LargeBinary(), nullable=True),
+        sa.Column('expira', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('clave')
+    )
+    op.create_index('ix_idempotencia_expira', 'idempotencia', ['expira'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_idempotencia_expira', table_name='idempotencia')
+    op.drop_table('idempotencia')
@@ -0,0 +1,50 @@
+"""recordatorios y arriendos del planificador
+
+Tabla recordatorios (uno por cita y hora, generados por INSERT ... SELECT)
+con índice (estado, fecha_hora) para quien los envíe, y tabla liderazgo con
+el arriendo de cada tarea periódica entre workers.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 23:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'recordatorios',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('cita_id', sa.Integer(), nullable=False),
+        sa.Column('paciente_id', sa.Integer(), nullable=False),
+        sa.Column('fecha_hora', sa.DateTime(), nullable=False),
+        sa.Column('estado', sa.String(length=20), server_default='pendiente', nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('enviado_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['cita_id'], ['citas.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('cita_id', 'fecha_hora', name='uq_recordatorios_cita_fecha_hora')
+    )
+    op.create_index('ix_recordatorios_estado_fecha_hora', 'recordatorios', ['estado', 'fecha_hora'], unique=False)
+    op.create_table(
+        'liderazgo',
+        sa.Column('tarea', sa.String(length=100), nullable=False),
+        sa.Column('titular', sa.String(length=200), nullable=False),
+        sa.Column('expira', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('tarea')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('liderazgo')
+    op.drop_index('ix_recordatorios_estado_fecha_hora', table_name='recordatorios')
+    op.drop_table('recordatorios')
@@ -0,0 +1,168 @@
+"""citas particionada por mes y tabla de archivo
+
+- citas_archivo: citas antiguas fuera de la tabla viva, mismas columnas y
+  clave primaria (id, fecha_hora). La llena archivo_service.
+- PostgreSQL: citas pasa a estar particionada por rango de fecha_hora, una
+  partición por mes (citas_pAAAAMM) desde la cita más antigua hasta tres
+  meses después del actual, más citas_default para lo que quede fuera. Las
+  consultas con límites de fecha_hora solo recorren las particiones de esos
+  meses. La clave primaria pasa a ser (id, fecha_hora) y la exclusividad de
+  agenda se declara en cada partición. recordatorios.cita_id pierde su clave
+  foránea: no hay un índice único solo sobre citas.id. citas_archivo también
+  está particionada, para recibir las particiones antiguas sin copiar filas.
+- SQLite: se crea citas_archivo y recordatorios.cita_id pierde también su
+  clave foránea, como en el modelo.
+
+La conversión copia todas las citas a la tabla nueva: en bases grandes,
+aplícala en una ventana de mantenimiento.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19 00:30:00.000000
+
+"""
+from datetime import datetime, timezone
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+MESES_FUTUROS = 3
+
+INDICES = (
+    ("ix_citas_id", "(id)"),
+    ("ix_citas_fecha_hora", "(fecha_hora)"),
+    ("ix_citas_paciente_id", "(paciente_id)"),
+    ("ix_citas_estado_fecha_hora", "(estado, fecha_hora)"),
+    ("ix_citas_paciente_estado_fecha_hora", "(paciente_id, estado, fecha_hora)"),
+    ("ix_citas_fecha_hora_id", "(fecha_hora, id)"),
+    ("ix_citas_paciente_estado_updated_at", "(paciente_id, estado, updated_at)"),
+    ("ix_citas_recurso_estado_fecha_hora", "(recurso_id, estado, fecha_hora)"),
+    ("ix_citas_programadas_fecha_hora", "(fecha_hora) WHERE estado = 'programada'"),
+)
+
+EXCLUSIVIDAD = """
+    ALTER TABLE {tabla} ADD CONSTRAINT {nombre} EXCLUDE USING gist (
+        (COALESCE(recurso_id, 0)) WITH =,
+        plaza WITH =,
+        tsrange(fecha_hora, fecha_hora + interval '30 minutes', '[]') WITH &&
+    ) WHERE (estado = 'programada')
+"""
+
+COLUMNAS = "id, motivo, fecha_hora, paciente_id, recurso_id, plaza, estado, notas, created_at, updated_at"
+
+# La clave foránea de recordatorios.cita_id se creó sin nombre en 0007; en
+# SQLite, batch_alter_table la reconoce con esta convención
+CONVENCION_SQLITE = {"fk": "fk_%(table_name)s_%(column_0_name)s"}
+
+
+def sumar_meses(mes, meses):
+    indice = mes.year * 12 + mes.month - 1 + meses
+    return mes.replace(year=indice // 12, month=indice % 12 + 1)
+
+
+def crear_archivo(particionada):
+    op.create_table(
+        'citas_archivo',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('motivo', sa.String(length=100), nullable=False),
+        sa.Column('fecha_hora', sa.DateTime(), nullable=False),
+        sa.Column('paciente_id', sa.Integer(), nullable=True),
+        sa.Column('recurso_id', sa.Integer(), nullable=True),
+        sa.Column('plaza', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('estado', sa.String(length=20), nullable=True),
+        sa.Column('notas', sa.String(length=500), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id', 'fecha_hora'),
+        **({'postgresql_partition_by': 'RANGE (fecha_hora)'} if particionada else {})
+    )
+    op.create_index('ix_citas_archivo_fecha_hora', 'citas_archivo', ['fecha_hora'], unique=False)
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        crear_archivo(particionada=False)
+        with op.batch_alter_table('recordatorios', naming_convention=CONVENCION_SQLITE) as batch_op:
+            batch_op.drop_constraint('fk_recordatorios_cita_id', type_='foreignkey')
+        return
+
+    conn = op.get_bind()
+    crear_archivo(particionada=True)
+
+    # La tabla actual queda como origen de la copia y libera sus nombres
+    op.execute('ALTER TABLE recordatorios DROP CONSTRAINT IF EXISTS recordatorios_cita_id_fkey')
+    op.execute('ALTER TABLE citas DROP CONSTRAINT IF EXISTS ex_citas_agenda_programada')
+    for nombre, _ in INDICES:
+        op.execute(f'DROP INDEX IF EXISTS {nombre}')
+    op.execute('ALTER TABLE citas RENAME TO citas_sin_particionar')
+    op.execute('ALTER TABLE citas_sin_particionar RENAME CONSTRAINT citas_pkey TO citas_sin_particionar_pkey')
+
+    op.execute('CREATE TABLE citas (LIKE citas_sin_particionar INCLUDING DEFAULTS) PARTITION BY RANGE (fecha_hora)')
+    op.execute('ALTER TABLE citas ADD CONSTRAINT citas_pkey PRIMARY KEY (id, fecha_hora)')
+    op.execute('ALTER TABLE citas ADD CONSTRAINT citas_paciente_id_fkey FOREIGN KEY (paciente_id) REFERENCES users (id)')
+    op.execute('ALTER TABLE citas ADD CONSTRAINT fk_citas_recurso_id FOREIGN KEY (recurso_id) REFERENCES recursos (id)')
+    op.execute('ALTER SEQUENCE citas_id_seq OWNED BY citas.id')
+
+    actual = datetime.now(timezone.utc).replace(tzinfo=None, day=1, hour=0, minute=0, second=0, microsecond=0)
+    mas_antigua = conn.execute(sa.text("SELECT date_trunc('month', min(fecha_hora)) FROM citas_sin_particionar")).scalar()
+    mes, ultimo = min(mas_antigua or actual, actual), sumar_meses(actual, MESES_FUTUROS)
+    particiones = ['citas_default']
+    op.execute('CREATE TABLE citas_default PARTITION OF citas DEFAULT')
+    while mes <= ultimo:
+        nombre = f'citas_p{mes:%Y%m}'
+        op.execute(
+            f"CREATE TABLE {nombre} PARTITION OF citas "
+            f"FOR VALUES FROM ('{mes:%Y-%m-%d}') TO ('{sumar_meses(mes, 1):%Y-%m-%d}')"
+        )
+        particiones.append(nombre)
+        mes = sumar_meses(mes, 1)
+
+    # Copia sin índices; los índices del padre se crean después en todas las particiones
+    op.execute(f'INSERT INTO citas ({COLUMNAS}) SELECT {COLUMNAS} FROM citas_sin_particionar')
+    op.execute('DROP TABLE citas_sin_particionar')
+    for nombre, definicion in INDICES:
+        op.execute(f'CREATE INDEX {nombre} ON citas {definicion}')
+    for particion in particiones:
+        op.execute(EXCLUSIVIDAD.format(
+            tabla=particion, nombre=f"ex_citas_agenda_programada_{particion.removeprefix('citas_')}"
+        ))
+    op.execute('ANALYZE citas')
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        # Las citas archivadas vuelven a la tabla viva
+        op.execute(f'INSERT INTO citas ({COLUMNAS}) SELECT {COLUMNAS} FROM citas_archivo')
+        op.drop_index('ix_citas_archivo_fecha_hora', table_name='citas_archivo')
+        op.drop_table('citas_archivo')
+        op.execute('DELETE FROM recordatorios WHERE cita_id NOT IN (SELECT id FROM citas)')
+        with op.batch_alter_table('recordatorios', naming_convention=CONVENCION_SQLITE) as batch_op:
+            batch_op.create_foreign_key(
+                'fk_recordatorios_cita_id', 'citas', ['cita_id'], ['id'], ondelete='CASCADE'
+            )
+        return
+
+    op.execute('CREATE TABLE citas_plana (LIKE citas INCLUDING DEFAULTS)')
+    op.execute(f'INSERT INTO citas_plana ({COLUMNAS}) SELECT {COLUMNAS} FROM citas')
+    op.execute(f'INSERT INTO citas_plana ({COLUMNAS}) SELECT {COLUMNAS} FROM citas_archivo')
+    op.execute('ALTER SEQUENCE citas_id_seq OWNED BY citas_plana.id')
+    op.execute('DROP TABLE citas CASCADE')
+    op.execute('DROP TABLE citas_archivo CASCADE')
+    op.execute('ALTER TABLE citas_plana RENAME TO citas')
+    op.execute('ALTER TABLE citas ADD CONSTRAINT citas_pkey PRIMARY KEY (id)')
+    op.execute('ALTER TABLE citas ADD CONSTRAINT citas_paciente_id_fkey FOREIGN KEY (paciente_id) REFERENCES users (id)')
+    op.execute('ALTER TABLE citas ADD CONSTRAINT fk_citas_recurso_id FOREIGN KEY (recurso_id) REFERENCES recursos (id)')
+    for nombre, definicion in INDICES:
+        op.execute(f'CREATE INDEX {nombre} ON citas {definicion}')
+    op.execute(EXCLUSIVIDAD.format(tabla='citas', nombre='ex_citas_agenda_programada'))
+    op.execute('DELETE FROM recordatorios WHERE cita_id NOT IN (SELECT id FROM citas)')
+    op.execute(
+        'ALTER TABLE recordatorios ADD CONSTRAINT recordatorios_cita_id_fkey '
+        'FOREIGN KEY (cita_id) REFERENCES citas (id) ON DELETE CASCADE'
+    )
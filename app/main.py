@@ -1,14 +1,38 @@
-from fastapi import FastAPI, Request
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, Request
+from fastapi.exception_handlers import http_exception_handler
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.openapi.utils import get_openapi
-from fastapi.responses import Response
-from app.routers import auth_routes, user_routes, cita_routes
+from fastapi.responses import Response, JSONResponse
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from app.routers import auth_routes, user_routes, cita_routes, recurso_routes
+import time
+from app.utils.hasher import hasher, HasherSaturadoError
+from app.utils import metricas, perfilador
+from app.utils.idempotencia import idempotencia
+from app.utils.eventos import broker_citas
+from app.utils.planificador import PLANIFICADOR, planificador
+from app.utils.respuestas import respuesta_error
 from app.utils.logging_config import get_logger
 
 logger = get_logger("main")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Cierre de citas vencidas y recordatorios; con varios workers solo trabaja el titular de cada tarea
+    if PLANIFICADOR:
+        planificador.iniciar()
+    yield
+    await planificador.detener()
+    # Liberar los procesos del pool de hashing al apagar el worker
+    hasher.cerrar()
+    metricas.cerrar_proceso()
+    broker_citas.cerrar()
+
 app = FastAPI(
+    lifespan=lifespan,
+    dependencies=[Depends(metricas.peticion_en_curso)],
     title="Hospital API",
     description="API para gestión de citas médicas",
     version="2.0.0",
@@ -16,6 +40,12 @@ app = FastAPI(
     redoc_url="/redoc"
 )
 
+# Idempotency-Key en POST/PUT/DELETE de /citas: los reintentos reciben la respuesta original.
+# Es el middleware más interno, así que las respuestas repetidas también pasan por los demás
+@app.middleware("http")
+async def aplicar_idempotencia(request: Request, call_next):
+    return await idempotencia.procesar(request, call_next)
+
 # Middleware de seguridad
 @app.middleware("http")
 async def add_security_headers(request: Request, call_next):
@@ -31,6 +61,59 @@ async def add_security_headers(request: Request, call_next):
     
     return response
 
+# Middleware de métricas: latencia por ruta y código de estado
+@app.middleware("http")
+async def medir_peticiones(request: Request, call_next):
+    inicio = time.perf_counter()
+    estado = 500
+    try:
+        response = await call_next(request)
+        estado = response.status_code
+        return response
+    finally:
+        # La ruta se conoce después del enrutado; las peticiones en curso las cuenta la dependencia global
+        metricas.observar_peticion(request.method, metricas.ruta_de(request.scope), estado, time.perf_counter() - inicio)
+
+# Perfilado de SQL por petición: con PERFIL_SQL=true o cabecera X-Perfil-SQL de un admin.
+# Con la cabecera el perfil empieza inactivo y solo lo activa la autenticación de un admin
+@app.middleware("http")
+async def perfilar_sql(request: Request, call_next):
+    if not (perfilador.PERFIL_SQL or request.headers.get(perfilador.CABECERA_PERFIL) == "1"):
+        return await call_next(request)
+    perfil = perfilador.iniciar(request.method, request.url.path, activo=perfilador.PERFIL_SQL)
+    response = await call_next(request)
+    if not perfil.activo:
+        return response
+    # En respuestas en streaming solo se cuenta lo ejecutado antes de enviar el cuerpo
+    perfil.ruta = metricas.ruta_de(request.scope)
+    perfilador.terminar(perfil)
+    if perfilador.PERFIL_SQL or perfil.es_admin:
+        response.headers["Server-Timing"] = perfil.server_timing()
+    return response
+
+@app.get("/metrics", include_in_schema=False)
+async def exportar_metricas():
+    contenido, tipo = metricas.exportar_metricas()
+    return Response(content=contenido, media_type=tipo)
+
+# Respuesta rápida cuando el pool de hashing no admite más trabajo
+@app.exception_handler(HasherSaturadoError)
+async def hasher_saturado_handler(request: Request, exc: HasherSaturadoError):
+    logger.warning("Pool de hashing saturado en %s", request.url.path)
+    return JSONResponse(
+        status_code=503,
+        content=respuesta_error(str(exc)),
+        headers={"Retry-After": "1"}
+    )
+
+# Las rutas lanzan HTTPException(detail=respuesta_error(...)): el sobre se devuelve como
+# cuerpo, igual que las respuestas de éxito, en todos los routers
+@app.exception_handler(StarletteHTTPException)
+async def error_http_handler(request: Request, exc: StarletteHTTPException):
+    if isinstance(exc.detail, dict) and "mensaje" in exc.detail:
+        return JSONResponse(status_code=exc.status_code, content=exc.detail, headers=exc.headers)
+    return await http_exception_handler(request, exc)
+
 # Middleware de hosts confiables
 app.add_middleware(
     TrustedHostMiddleware, 
@@ -41,6 +124,7 @@ app.add_middleware(
 app.include_router(auth_routes.router, prefix="/auth", tags=["auth"])
 app.include_router(user_routes.router, prefix="/users", tags=["users"])
 app.include_router(cita_routes.router, prefix="/citas", tags=["citas"])
+app.include_router(recurso_routes.router, prefix="/recursos", tags=["recursos"])
 
 # Configuración de CORS
 app.add_middleware(
@@ -1,20 +1,130 @@
 # app/models/cita.py
 
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import DDL, Column, Integer, String, DateTime, ForeignKey, Index, event, text
 from sqlalchemy.orm import relationship
 from app.database import Base
 from datetime import datetime
 
 class Cita(Base):
     __tablename__ = "citas"
+    # Índices ajustados a las consultas de cita_service (ver migraciones 0002 a 0005)
+    __table_args__ = (
+        Index("ix_citas_estado_fecha_hora", "estado", "fecha_hora"),
+        Index("ix_citas_paciente_estado_fecha_hora", "paciente_id", "estado", "fecha_hora"),
+        Index("ix_citas_fecha_hora_id", "fecha_hora", "id"),
+        Index("ix_citas_paciente_estado_updated_at", "paciente_id", "estado", "updated_at"),
+        Index("ix_citas_recurso_estado_fecha_hora", "recurso_id", "estado", "fecha_hora"),
+        Index(
+            "ix_citas_programadas_fecha_hora", "fecha_hora",
+            postgresql_where=text("estado = 'programada'"),
+            sqlite_where=text("estado = 'programada'")
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     motivo = Column(String(100), nullable=False)
     fecha_hora = Column(DateTime, nullable=False, index=True)
     paciente_id = Column(Integer, ForeignKey("users.id"), index=True)
-    estado = Column(String(20), default="programada")  # programada, completada, cancelada
+    # Doctor o sala asignado; sin recurso la cita va a la agenda general del hospital
+    recurso_id = Column(Integer, ForeignKey("recursos.id"), nullable=True)
+    # Puesto del recurso que ocupa la cita (0 .. capacidad - 1), ver EXCLUSIVIDAD_AGENDA
+    plaza = Column(Integer, nullable=False, default=0, server_default="0")
+    estado = Column(String(20), default="programada")  # programada, completada, cancelada, no_asistio
     notas = Column(String(500), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     paciente = relationship("User", back_populates="citas")
+
+
+# Exclusividad de la agenda impuesta por la base de datos: dos citas programadas
+# del mismo recurso y plaza no pueden estar a 30 minutos o menos. Así dos
+# reservas simultáneas del mismo horario no pueden pasar ambas la verificación
+# de crear_cita (ver migración 0005). En PostgreSQL es una restricción de
+# exclusión (btree_gist); en SQLite, triggers que abortan el INSERT/UPDATE.
+EXCLUSIVIDAD_AGENDA = "ex_citas_agenda_programada"
+
+_CHOQUE_SQLITE = """
+    SELECT RAISE(ABORT, '{nombre}') WHERE EXISTS (
+        SELECT 1 FROM citas
+        WHERE recurso_id IS NEW.recurso_id AND estado = 'programada' AND plaza = NEW.plaza{otra}
+          AND fecha_hora BETWEEN datetime(NEW.fecha_hora, '-31 minutes') AND datetime(NEW.fecha_hora, '+31 minutes')
+          AND abs(julianday(fecha_hora) - julianday(NEW.fecha_hora)) <= 30.0 / 1440 + 1e-8
+    );
+"""
+
+def exclusividad_postgresql(tabla: str = "citas", nombre: str = EXCLUSIVIDAD_AGENDA) -> str:
+    return f"""ALTER TABLE {tabla} ADD CONSTRAINT {nombre} EXCLUDE USING gist (
+            (COALESCE(recurso_id, 0)) WITH =,
+            plaza WITH =,
+            tsrange(fecha_hora, fecha_hora + interval '30 minutes', '[]') WITH &&
+        ) WHERE (estado = 'programada')"""
+
+DDL_EXCLUSIVIDAD = {
+    "postgresql": (
+        "CREATE EXTENSION IF NOT EXISTS btree_gist",
+        exclusividad_postgresql(),
+    ),
+    "sqlite": (
+        f"""CREATE TRIGGER {EXCLUSIVIDAD_AGENDA}_insert BEFORE INSERT ON citas
+        WHEN NEW.estado = 'programada'
+        BEGIN {_CHOQUE_SQLITE.format(nombre=EXCLUSIVIDAD_AGENDA, otra="")} END""",
+        f"""CREATE TRIGGER {EXCLUSIVIDAD_AGENDA}_update BEFORE UPDATE OF fecha_hora, estado, recurso_id, plaza ON citas
+        WHEN NEW.estado = 'programada'
+        BEGIN {_CHOQUE_SQLITE.format(nombre=EXCLUSIVIDAD_AGENDA, otra=" AND id != NEW.id")} END""",
+    ),
+}
+
+DDL_SIN_EXCLUSIVIDAD = {
+    "postgresql": (f"ALTER TABLE citas DROP CONSTRAINT IF EXISTS {EXCLUSIVIDAD_AGENDA}",),
+    "sqlite": (
+        f"DROP TRIGGER IF EXISTS {EXCLUSIVIDAD_AGENDA}_insert",
+        f"DROP TRIGGER IF EXISTS {EXCLUSIVIDAD_AGENDA}_update",
+    ),
+}
+
+for _dialecto, _sentencias in DDL_EXCLUSIVIDAD.items():
+    for _sentencia in _sentencias:
+        event.listen(Cita.__table__, "after_create", DDL(_sentencia).execute_if(dialect=_dialecto))
+
+
+# Con citas particionada por mes (PostgreSQL, migración 0008) la restricción de
+# exclusión no puede declararse en la tabla padre: cada partición tiene la suya.
+# Dos citas solo podrían chocar sin detectarse a ambos lados de la medianoche
+# de un cambio de mes, fuera de cualquier horario de atención.
+
+def particiones_citas(conn) -> list:
+    """Particiones de citas (vacía si la tabla no está particionada)"""
+    if conn.dialect.name != "postgresql":
+        return []
+    return conn.exec_driver_sql(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'citas'::regclass ORDER BY c.relname"
+    ).scalars().all()
+
+def nombre_exclusividad(particion: str) -> str:
+    """ex_citas_agenda_programada_p202610 para citas_p202610 (es_conflicto_agenda la reconoce)"""
+    return f"{EXCLUSIVIDAD_AGENDA}_{particion.removeprefix('citas_')}"
+
+
+def crear_exclusividad(conn):
+    """Vuelve a crear la exclusividad de la agenda (p. ej. tras una carga masiva)"""
+    particiones = particiones_citas(conn)
+    if particiones:
+        conn.exec_driver_sql(DDL_EXCLUSIVIDAD["postgresql"][0])
+        for particion in particiones:
+            conn.exec_driver_sql(exclusividad_postgresql(particion, nombre_exclusividad(particion)))
+        return
+    for sentencia in DDL_EXCLUSIVIDAD.get(conn.dialect.name, ()):
+        conn.exec_driver_sql(sentencia)
+
+def quitar_exclusividad(conn):
+    for particion in particiones_citas(conn):
+        conn.exec_driver_sql(f"ALTER TABLE {particion} DROP CONSTRAINT IF EXISTS {nombre_exclusividad(particion)}")
+    for sentencia in DDL_SIN_EXCLUSIVIDAD.get(conn.dialect.name, ()):
+        conn.exec_driver_sql(sentencia)
+
+
+def es_conflicto_agenda(error) -> bool:
+    """IntegrityError causado por EXCLUSIVIDAD_AGENDA (y no por otra restricción)"""
+    return EXCLUSIVIDAD_AGENDA in str(getattr(error, "orig", error))
@@ -0,0 +1,27 @@
+# app/models/cita_archivada.py
+
+from sqlalchemy import Column, DateTime, Index, Integer, String
+from app.database import Base
+
+class CitaArchivada(Base):
+    """
+    Citas anteriores a CITAS_ARCHIVO_MESES (si está definido), fuera de la tabla viva (ver
+    app/services/archivo_service.py). Mismas columnas que citas; en PostgreSQL
+    está particionada por mes como citas (migración 0008) y recibe sus
+    particiones antiguas enteras, por eso la clave primaria incluye fecha_hora.
+    """
+    __tablename__ = "citas_archivo"
+    __table_args__ = (
+        Index("ix_citas_archivo_fecha_hora", "fecha_hora"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    motivo = Column(String(100), nullable=False)
+    fecha_hora = Column(DateTime, primary_key=True)
+    paciente_id = Column(Integer)
+    recurso_id = Column(Integer, nullable=True)
+    plaza = Column(Integer, nullable=False, default=0, server_default="0")
+    estado = Column(String(20))
+    notas = Column(String(500), nullable=True)
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
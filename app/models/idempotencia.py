@@ -0,0 +1,18 @@
+# app/models/idempotencia.py
+
+from sqlalchemy import Column, Float, Integer, LargeBinary, String, Text
+from app.database import Base
+
+class RespuestaIdempotente(Base):
+    """
+    Respuesta guardada para una Idempotency-Key (IDEMPOTENCIA_BACKEND=db),
+    compartida por todos los workers
+    """
+    __tablename__ = "idempotencia"
+
+    clave = Column(String(320), primary_key=True)  # usuario + ":" + Idempotency-Key
+    huella = Column(String(64), nullable=False)  # sha256 de método, ruta y cuerpo
+    estado = Column(Integer, nullable=True)  # código HTTP; nulo mientras la petición original está en curso
+    cabeceras = Column(Text, nullable=True)  # JSON [[nombre, valor], ...]
+    cuerpo = Column(LargeBinary, nullable=True)
+    expira = Column(Float, nullable=False, index=True)  # epoch
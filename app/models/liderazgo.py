@@ -0,0 +1,12 @@
+# app/models/liderazgo.py
+
+from sqlalchemy import Column, Float, String
+from app.database import Base
+
+class Liderazgo(Base):
+    """Arriendo de una tarea programada: solo su titular la ejecuta hasta que expira (ver app/utils/planificador.py)"""
+    __tablename__ = "liderazgo"
+
+    tarea = Column(String(100), primary_key=True)
+    titular = Column(String(200), nullable=False)  # host:pid:token del proceso
+    expira = Column(Float, nullable=False)  # epoch
@@ -0,0 +1,27 @@
+# app/models/recordatorio.py
+
+from sqlalchemy import Column, DateTime, Index, Integer, String, UniqueConstraint
+from app.database import Base
+
+class Recordatorio(Base):
+    """
+    Recordatorio pendiente de enviar al paciente de una cita próxima.
+
+    Se genera uno por cita y hora (si la cita cambia de hora se genera otro);
+    quien los envíe debe descartar los que ya no coinciden con la cita o cuya
+    cita ya no existe o no está programada.
+    """
+    __tablename__ = "recordatorios"
+    __table_args__ = (
+        UniqueConstraint("cita_id", "fecha_hora", name="uq_recordatorios_cita_fecha_hora"),
+        Index("ix_recordatorios_estado_fecha_hora", "estado", "fecha_hora"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    # Sin clave foránea: citas particionada no tiene un índice único solo sobre id (migración 0008)
+    cita_id = Column(Integer, nullable=False)
+    paciente_id = Column(Integer, nullable=False)
+    fecha_hora = Column(DateTime, nullable=False)  # hora de la cita al generar el recordatorio
+    estado = Column(String(20), nullable=False, default="pendiente", server_default="pendiente")  # pendiente, enviado
+    created_at = Column(DateTime, nullable=False)
+    enviado_at = Column(DateTime, nullable=True)
@@ -0,0 +1,24 @@
+# app/models/recurso.py
+
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Time, Index
+from app.database import Base
+from datetime import datetime, time
+
+class Recurso(Base):
+    """Doctor o sala que atiende un servicio (motivo); cada uno tiene su propia agenda"""
+    __tablename__ = "recursos"
+    __table_args__ = (
+        Index("ix_recursos_motivo_activo", "motivo", "activo"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    nombre = Column(String(100), nullable=False)
+    tipo = Column(String(20), nullable=False)  # doctor, sala
+    motivo = Column(String(100), nullable=False)  # servicio que atiende (MotivoEnum)
+    # Citas que puede atender a la vez dentro del margen de conflicto
+    capacidad = Column(Integer, nullable=False, default=1)
+    hora_inicio = Column(Time, nullable=False, default=time(8, 0))
+    hora_fin = Column(Time, nullable=False, default=time(18, 0))
+    activo = Column(Boolean, default=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
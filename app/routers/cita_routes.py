@@ -1,64 +1,203 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import date, datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
-from app.database import get_db
-from app.models.user import User
-from app.schemas.cita import CitaCreate, CitaOut, CitaUpdate
+from app.database import cerrar_sesion, get_db
+from app.schemas.user import UserOut
+from app.schemas.cita import CitaCreate, CitaOut, CitaUpdate, CitaLote, CitaLoteItem, EstadoEnum, MotivoEnum
 from app.utils.seguridad import obtener_usuario_actual, verificar_admin
 from app.utils.respuestas import respuesta_exito, respuesta_error
-from app.services.cita_service import (
-    crear_cita, obtener_citas_paciente, obtener_todas_las_citas,
-    eliminar_cita, eliminar_cita_paciente, editar_cita, editar_cita_paciente,
-    obtener_citas_de_hoy
+from app.utils.serializacion import filas, negociar_formato, respuesta_exito_formato
+from app.utils.condicional import con_etag, etag, no_modificado, variante_listado, versiones_conocidas
+from app.utils.database_utils import ServicioDual
+from app.utils.eventos import broker_citas
+from app.utils.exportacion import FORMATOS_EXPORTACION, generar_exportacion
+from app.services import (
+    cita_service, cita_service_async, disponibilidad_service, disponibilidad_service_async,
+    recurso_service, recurso_service_async
 )
 
 router = APIRouter(tags=["Citas"])
 
+servicio_citas = ServicioDual(cita_service, cita_service_async)
+servicio_disponibilidad = ServicioDual(disponibilidad_service, disponibilidad_service_async)
+servicio_recursos = ServicioDual(recurso_service, recurso_service_async)
+
 @router.post("/", summary="Agendar una cita médica")
-def crear_cita_endpoint(cita: CitaCreate, db: Session = Depends(get_db), usuario: User = Depends(obtener_usuario_actual)):
-    nueva_cita, error = crear_cita(cita.motivo, cita.fecha_hora, usuario.id, cita.notas, db)
+async def crear_cita_endpoint(cita: CitaCreate, db: Session = Depends(get_db), usuario: UserOut = Depends(obtener_usuario_actual)):
+    nueva_cita, error = await servicio_citas.crear_cita(
+        cita.motivo, cita.fecha_hora, usuario.id, cita.notas, db, recurso_id=cita.recurso_id
+    )
     if error:
         raise HTTPException(status_code=400, detail=respuesta_error(error))
-    return respuesta_exito("Cita agendada exitosamente", {"cita": nueva_cita.id})
+    return respuesta_exito("Cita agendada exitosamente", {"cita": nueva_cita.id, "recurso_id": nueva_cita.recurso_id})
+
+@router.post("/batch", summary="Agendar varias citas en una sola transacción")
+async def crear_citas_lote_endpoint(lote: CitaLote, db: Session = Depends(get_db), usuario: UserOut = Depends(obtener_usuario_actual)):
+    items, rechazadas = [], {}
+    for indice, bruto in enumerate(lote.citas):
+        try:
+            datos = CitaLoteItem.model_validate(bruto)
+        except ValidationError as e:
+            rechazadas[indice] = "; ".join(error["msg"] for error in e.errors())
+            continue
+        paciente_id = datos.paciente_id or usuario.id
+        if paciente_id != usuario.id and usuario.role != "admin":
+            rechazadas[indice] = "Solo un administrador puede agendar citas para otros pacientes"
+            continue
+        items.append((indice, datos, paciente_id))
+
+    creadas = []
+    if items:
+        verificar_pacientes = any(paciente_id != usuario.id for _, _, paciente_id in items)
+        creadas, error = await servicio_citas.crear_citas_lote(items, db, verificar_pacientes)
+        if error:
+            raise HTTPException(status_code=400, detail=respuesta_error(error))
+
+    resultados = creadas + [{"indice": i, "success": False, "mensaje": m} for i, m in rechazadas.items()]
+    resultados.sort(key=lambda r: r["indice"])
+    total_creadas = sum(1 for r in resultados if r["success"])
+    return respuesta_exito("Lote de citas procesado", {
+        "resultados": resultados,
+        "creadas": total_creadas,
+        "rechazadas": len(resultados) - total_creadas
+    })
 
 @router.get("/", summary="Consultar mis citas")
-def obtener_mis_citas(db: Session = Depends(get_db), usuario: User = Depends(obtener_usuario_actual)):
-    citas = obtener_citas_paciente(usuario.id, db)
-    return respuesta_exito("Citas obtenidas exitosamente", {"citas": citas})
+async def obtener_mis_citas(
+    request: Request,
+    desde: Optional[datetime] = Query(None, description="Solo citas a partir de esta fecha"),
+    db: Session = Depends(get_db),
+    usuario: UserOut = Depends(obtener_usuario_actual)
+):
+    # Con If-None-Match de la versión actual se responde 304 sin cargar ni serializar las citas
+    formato = negociar_formato(request)
+    variante = variante_listado("citas", formato)
+    version, citas = await servicio_citas.obtener_citas_paciente_versionadas(
+        usuario.id, versiones_conocidas(request, variante), db, desde=desde
+    )
+    if citas is None:
+        return no_modificado(etag(variante, version))
+    respuesta = respuesta_exito_formato(formato, "Citas obtenidas exitosamente", {"citas": filas(citas, CitaOut)})
+    return con_etag(respuesta, etag(variante, version))
+
+@router.get("/disponibilidad", summary="Consultar horarios libres")
+async def obtener_disponibilidad_endpoint(
+    fecha: Optional[date] = Query(None, description="Día del que se quieren los horarios libres"),
+    despues_de: Optional[datetime] = Query(None, description="Buscar el siguiente horario libre a partir de este momento"),
+    motivo: Optional[MotivoEnum] = Query(None, description="Horarios en los que algún recurso del servicio está libre"),
+    recurso_id: Optional[int] = Query(None, description="Horarios libres de un doctor o sala"),
+    db: Session = Depends(get_db),
+    usuario: UserOut = Depends(obtener_usuario_actual)
+):
+    agendas, error = await servicio_recursos.resolver_agendas(motivo, recurso_id, db)
+    if error:
+        raise HTTPException(status_code=404, detail=respuesta_error(error))
+    datos = {}
+    if fecha is not None:
+        datos["fecha"] = fecha
+        datos["slots_libres"] = await servicio_disponibilidad.obtener_slots_libres(fecha, db, agendas)
+    if despues_de is not None or fecha is None:
+        datos["siguiente_libre"] = await servicio_disponibilidad.obtener_siguiente_libre(despues_de, db, agendas)
+    return respuesta_exito("Disponibilidad obtenida", datos)
 
 @router.get("/admin", summary="Ver todas las citas (admin)")
-def obtener_todas_las_citas_endpoint(db: Session = Depends(get_db), admin: User = Depends(verificar_admin)):
-    citas = obtener_todas_las_citas(db)
-    return respuesta_exito("Todas las citas obtenidas", {"citas": citas})
+async def obtener_todas_las_citas_endpoint(
+    request: Request,
+    limite: int = Query(50, ge=1, le=500, description="Citas por página"),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en `siguiente_cursor`"),
+    estado: Optional[EstadoEnum] = None,
+    motivo: Optional[MotivoEnum] = None,
+    paciente_id: Optional[int] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+    admin: UserOut = Depends(verificar_admin)
+):
+    try:
+        citas, siguiente_cursor = await servicio_citas.obtener_citas_paginadas(
+            db, limite, cursor,
+            estado=estado.value if estado else None,
+            motivo=motivo.value if motivo else None,
+            paciente_id=paciente_id, desde=desde, hasta=hasta
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=respuesta_error(str(e)))
+    return respuesta_exito_formato(
+        negociar_formato(request), "Todas las citas obtenidas",
+        {"citas": filas(citas, CitaOut), "siguiente_cursor": siguiente_cursor}
+    )
+
+@router.get("/admin/exportar", summary="Exportar citas en streaming (admin)")
+async def exportar_citas_endpoint(
+    formato: str = Query("ndjson", pattern="^(ndjson|csv)$", description="ndjson o csv"),
+    origen: str = Query("activas", pattern="^(activas|archivo)$", description="activas o archivo (citas archivadas)"),
+    estado: Optional[EstadoEnum] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+    admin: UserOut = Depends(verificar_admin)
+):
+    lotes = await servicio_citas.exportar_citas(
+        db, estado=estado.value if estado else None, desde=desde, hasta=hasta, origen=origen
+    )
+    columnas = [c.key for c in cita_service.COLUMNAS_EXPORTACION]
+    return StreamingResponse(
+        generar_exportacion(lotes, columnas, formato),
+        media_type=FORMATOS_EXPORTACION[formato],
+        headers={"Content-Disposition": f'attachment; filename="citas.{formato}"'}
+    )
 
 @router.delete("/admin/{cita_id}", summary="Eliminar una cita (admin)")
-def eliminar_cita_endpoint(cita_id: int, db: Session = Depends(get_db), admin: User = Depends(verificar_admin)):
-    cita, error = eliminar_cita(cita_id, db)
+async def eliminar_cita_endpoint(cita_id: int, db: Session = Depends(get_db), admin: UserOut = Depends(verificar_admin)):
+    cita, error = await servicio_citas.eliminar_cita(cita_id, db)
     if error:
         raise HTTPException(status_code=404, detail=respuesta_error(error))
     return respuesta_exito("Cita eliminada correctamente", {"cita_id": cita_id})
 
 @router.delete("/{cita_id}", summary="Cancelar mi propia cita")
-def cancelar_mi_cita(cita_id: int, db: Session = Depends(get_db), usuario: User = Depends(obtener_usuario_actual)):
-    cita, error = eliminar_cita_paciente(cita_id, usuario.id, db)
+async def cancelar_mi_cita(cita_id: int, db: Session = Depends(get_db), usuario: UserOut = Depends(obtener_usuario_actual)):
+    cita, error = await servicio_citas.eliminar_cita_paciente(cita_id, usuario.id, db)
     if error:
         raise HTTPException(status_code=404, detail=respuesta_error(error))
     return respuesta_exito("Cita cancelada exitosamente", {"cita_id": cita_id})
 
 @router.put("/{cita_id}", summary="Editar mi cita")
-def editar_mi_cita_endpoint(cita_id: int, datos: CitaUpdate, db: Session = Depends(get_db), usuario: User = Depends(obtener_usuario_actual)):
-    cita, error = editar_cita_paciente(cita_id, usuario.id, datos, db)
+async def editar_mi_cita_endpoint(cita_id: int, datos: CitaUpdate, db: Session = Depends(get_db), usuario: UserOut = Depends(obtener_usuario_actual)):
+    cita, error = await servicio_citas.editar_cita_paciente(cita_id, usuario.id, datos, db)
     if error:
         raise HTTPException(status_code=400, detail=respuesta_error(error))
     return respuesta_exito("Cita editada exitosamente", {"cita": cita.id})
 
 @router.put("/admin/{cita_id}", summary="Editar cita (admin)")
-def editar_cita_admin_endpoint(cita_id: int, datos: CitaUpdate, db: Session = Depends(get_db), admin: User = Depends(verificar_admin)):
-    cita, error = editar_cita(cita_id, datos, db)
+async def editar_cita_admin_endpoint(cita_id: int, datos: CitaUpdate, db: Session = Depends(get_db), admin: UserOut = Depends(verificar_admin)):
+    cita, error = await servicio_citas.editar_cita(cita_id, datos, db)
     if error:
         raise HTTPException(status_code=400, detail=respuesta_error(error))
     return respuesta_exito("Cita editada exitosamente", {"cita": cita.id})
 
+@router.get("/stream", summary="Cambios de citas en tiempo real (Server-Sent Events)")
+async def stream_citas_endpoint(db: Session = Depends(get_db), usuario: UserOut = Depends(obtener_usuario_actual)):
+    # La sesión solo hacía falta para autenticar: los clientes conectados no retienen conexiones del pool
+    await cerrar_sesion(db)
+    # Los administradores reciben todos los cambios; el resto, solo los de sus citas
+    suscripcion = broker_citas.suscribir(None if usuario.role == "admin" else usuario.id)
+    return StreamingResponse(
+        broker_citas.flujo_sse(suscripcion),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/hoy", summary="Ver mis citas de hoy")
-def obtener_citas_de_hoy_endpoint(db: Session = Depends(get_db), usuario: User = Depends(obtener_usuario_actual)):
-    citas = obtener_citas_de_hoy(usuario.id, db)
-    return respuesta_exito("Citas de hoy obtenidas exitosamente", {"citas": citas})
\ No newline at end of file
+async def obtener_citas_de_hoy_endpoint(request: Request, db: Session = Depends(get_db), usuario: UserOut = Depends(obtener_usuario_actual)):
+    formato = negociar_formato(request)
+    variante = variante_listado("hoy", formato)
+    version, citas = await servicio_citas.obtener_citas_de_hoy_versionadas(
+        usuario.id, versiones_conocidas(request, variante), db
+    )
+    if citas is None:
+        return no_modificado(etag(variante, version))
+    respuesta = respuesta_exito_formato(formato, "Citas de hoy obtenidas exitosamente", {"citas": filas(citas, CitaOut)})
+    return con_etag(respuesta, etag(variante, version))
\ No newline at end of file
@@ -0,0 +1,42 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from app.database import get_db
+from app.schemas.user import UserOut
+from app.schemas.cita import MotivoEnum
+from app.schemas.recurso import RecursoCreate, RecursoOut, RecursoUpdate
+from app.utils.seguridad import obtener_usuario_actual, verificar_admin
+from app.utils.respuestas import respuesta_exito, respuesta_error
+from app.utils.serializacion import filas
+from app.utils.database_utils import ServicioDual
+from app.services import recurso_service, recurso_service_async
+
+router = APIRouter(tags=["Recursos"])
+
+servicio_recursos = ServicioDual(recurso_service, recurso_service_async)
+
+@router.post("/", summary="Crear un doctor o sala (admin)")
+async def crear_recurso_endpoint(datos: RecursoCreate, db: Session = Depends(get_db), admin: UserOut = Depends(verificar_admin)):
+    recurso, error = await servicio_recursos.crear_recurso(datos, db)
+    if error:
+        raise HTTPException(status_code=400, detail=respuesta_error(error))
+    return respuesta_exito("Recurso creado exitosamente", {"recurso": RecursoOut.model_validate(recurso)})
+
+@router.get("/", summary="Consultar doctores y salas")
+async def obtener_recursos_endpoint(
+    motivo: Optional[MotivoEnum] = Query(None, description="Solo los recursos de este servicio"),
+    db: Session = Depends(get_db),
+    usuario: UserOut = Depends(obtener_usuario_actual)
+):
+    # Los pacientes solo ven los recursos activos; el admin ve también los inactivos
+    recursos = await servicio_recursos.obtener_recursos(
+        db, motivo.value if motivo else None, solo_activos=usuario.role != "admin"
+    )
+    return respuesta_exito("Recursos obtenidos", {"recursos": filas(recursos, RecursoOut)})
+
+@router.put("/{recurso_id}", summary="Editar capacidad, horario o estado de un recurso (admin)")
+async def editar_recurso_endpoint(recurso_id: int, datos: RecursoUpdate, db: Session = Depends(get_db), admin: UserOut = Depends(verificar_admin)):
+    recurso, error = await servicio_recursos.editar_recurso(recurso_id, datos, db)
+    if error:
+        raise HTTPException(status_code=400, detail=respuesta_error(error))
+    return respuesta_exito("Recurso editado exitosamente", {"recurso": RecursoOut.model_validate(recurso)})
@@ -1,14 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile, status
 from sqlalchemy.orm import Session
-from app.utils.seguridad import verificar_admin, obtener_hash_contraseña
+from app.utils.seguridad import verificar_admin, obtener_hash_contraseña, obtener_hashes_contraseñas
 from app.database import get_db
 from app.models.user import User
 from app.schemas.user import UserCreate, UserOut
 from app.utils.respuestas import respuesta_exito, respuesta_error
-from app.services.user_service import crear_usuario_por_admin, crear_usuario_admin
+from app.utils.database_utils import ServicioDual
+from app.utils.importacion import detectar_formato, leer_usuarios, IMPORTACION_MAX_FILAS
+from app.services import user_service, user_service_async
 
 router = APIRouter(tags=["Users"])
 
+servicio_usuarios = ServicioDual(user_service, user_service_async)
+
 ##@router.get("/perfil", summary="Obtener perfil del usuario autenticado")
 ##def obtener_perfil(usuario: User = Depends(obtener_usuario_actual)):
 ##    return {
@@ -20,15 +25,36 @@ router = APIRouter(tags=["Users"])
 ##    }
 
 @router.post("/admin/crear", response_model=UserOut, summary="Crear usuario (solo admin)")
-def crear_usuario_por_admin_endpoint(usuario: UserCreate, db: Session = Depends(get_db), admin: User = Depends(verificar_admin)):
-    nuevo_usuario, error = crear_usuario_por_admin(usuario, db, obtener_hash_contraseña)
+async def crear_usuario_por_admin_endpoint(usuario: UserCreate, db: Session = Depends(get_db), admin: UserOut = Depends(verificar_admin)):
+    nuevo_usuario, error = await servicio_usuarios.crear_usuario_por_admin(usuario, db, obtener_hash_contraseña)
     if error:
         raise HTTPException(status_code=400, detail=respuesta_error(error))
-    return respuesta_exito("Usuario creado exitosamente", {"usuario": nuevo_usuario.username})
+    return nuevo_usuario
 
 @router.post("/crear_admin", summary="Crear usuario administrador", dependencies=[Depends(verificar_admin)])
-def crear_usuario_admin_endpoint(datos: UserCreate, db: Session = Depends(get_db)):
-    nuevo_usuario, error = crear_usuario_admin(datos, db, obtener_hash_contraseña)
+async def crear_usuario_admin_endpoint(datos: UserCreate, db: Session = Depends(get_db)):
+    nuevo_usuario, error = await servicio_usuarios.crear_usuario_admin(datos, db, obtener_hash_contraseña)
+    if error:
+        raise HTTPException(status_code=400, detail=respuesta_error(error))
+    return respuesta_exito("Usuario administrador creado exitosamente", {"usuario": nuevo_usuario.username})
+
+@router.post("/admin/importar", summary="Importar usuarios en bloque desde CSV o JSONL (solo admin)", dependencies=[Depends(verificar_admin)])
+async def importar_usuarios_endpoint(
+    archivo: UploadFile = File(..., description="CSV con encabezado o JSONL con username, email, password, full_name y role"),
+    formato: Optional[str] = Query(None, pattern="^(csv|jsonl)$", description="Por defecto se deduce de la extensión"),
+    db: Session = Depends(get_db)
+):
+    try:
+        formato = detectar_formato(archivo.filename, formato)
+        filas = leer_usuarios((await archivo.read()).decode("utf-8-sig"), formato)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=respuesta_error(str(e)))
+    if not filas:
+        raise HTTPException(status_code=400, detail=respuesta_error("El archivo no contiene usuarios"))
+    if len(filas) > IMPORTACION_MAX_FILAS:
+        raise HTTPException(status_code=400, detail=respuesta_error(f"Máximo {IMPORTACION_MAX_FILAS} usuarios por importación"))
+
+    reporte, error = await servicio_usuarios.importar_usuarios(filas, db, obtener_hashes_contraseñas)
     if error:
         raise HTTPException(status_code=400, detail=respuesta_error(error))
-    return respuesta_exito("Usuario administrador creado exitosamente", {"usuario": nuevo_usuario.username})
\ No newline at end of file
+    return respuesta_exito("Importación de usuarios procesada", reporte)
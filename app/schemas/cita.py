@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field, field_validator
 from datetime import datetime, timezone, time
-from typing import Optional
+from typing import Any, Optional
 from enum import Enum
 
 fecha_actual = datetime.now(timezone.utc)
@@ -17,11 +17,13 @@ class EstadoEnum(str, Enum):
     programada = "programada"
     completada = "completada"
     cancelada = "cancelada"
+    no_asistio = "no_asistio"
 
 class CitaCreate(BaseModel):
     motivo: MotivoEnum = Field(..., description="Seleccione un servicio del hospital")
     fecha_hora: datetime = Field(..., description="Fecha y hora de la cita")
     notas: Optional[str] = Field(None, max_length=500, description="Notas adicionales")
+    recurso_id: Optional[int] = Field(None, description="Doctor o sala; por defecto el menos ocupado del servicio")
     
     @field_validator('fecha_hora')
     @classmethod
@@ -44,11 +46,19 @@ class CitaCreate(BaseModel):
         
         return v
 
+class CitaLoteItem(CitaCreate):
+    paciente_id: Optional[int] = Field(None, description="Paciente de la cita (solo admin); por defecto el usuario autenticado")
+
+class CitaLote(BaseModel):
+    # Cada elemento se valida por separado para informar errores por ítem
+    citas: list[dict[str, Any]] = Field(..., min_length=1, max_length=200, description="Citas a agendar (CitaCreate + paciente_id opcional)")
+
 class CitaOut(BaseModel):
     id: int
     motivo: str
     fecha_hora: datetime
     paciente_id: int
+    recurso_id: Optional[int] = None
     estado: str
     notas: Optional[str]
     created_at: datetime
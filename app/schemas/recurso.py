@@ -0,0 +1,56 @@
+from pydantic import BaseModel, Field, model_validator
+from datetime import datetime, time
+from typing import Optional
+from enum import Enum
+from app.schemas.cita import MotivoEnum
+
+class TipoRecursoEnum(str, Enum):
+    doctor = "doctor"
+    sala = "sala"
+
+def validar_horario(hora_inicio, hora_fin):
+    # Dentro del horario de atención del hospital (8:00 AM - 6:00 PM)
+    if hora_inicio is not None and hora_fin is not None and hora_inicio >= hora_fin:
+        raise ValueError('La hora de inicio debe ser anterior a la hora de fin')
+    for hora in (hora_inicio, hora_fin):
+        if hora is not None and not (time(8, 0) <= hora <= time(18, 0)):
+            raise ValueError('El horario del recurso debe estar entre las 8:00 AM y 6:00 PM')
+
+class RecursoCreate(BaseModel):
+    nombre: str = Field(..., min_length=2, max_length=100, description="Nombre del doctor o de la sala")
+    tipo: TipoRecursoEnum = Field(..., description="doctor o sala")
+    motivo: MotivoEnum = Field(..., description="Servicio del hospital que atiende")
+    capacidad: int = Field(1, ge=1, le=50, description="Citas que puede atender a la vez")
+    hora_inicio: time = Field(time(8, 0), description="Inicio de su horario (UTC)")
+    hora_fin: time = Field(time(18, 0), description="Fin de su horario (UTC)")
+
+    @model_validator(mode='after')
+    def validate_horario(self):
+        validar_horario(self.hora_inicio, self.hora_fin)
+        return self
+
+class RecursoUpdate(BaseModel):
+    nombre: Optional[str] = Field(None, min_length=2, max_length=100)
+    capacidad: Optional[int] = Field(None, ge=1, le=50)
+    hora_inicio: Optional[time] = None
+    hora_fin: Optional[time] = None
+    activo: Optional[bool] = None
+
+    @model_validator(mode='after')
+    def validate_horario(self):
+        validar_horario(self.hora_inicio, self.hora_fin)
+        return self
+
+class RecursoOut(BaseModel):
+    id: int
+    nombre: str
+    tipo: str
+    motivo: str
+    capacidad: int
+    hora_inicio: time
+    hora_fin: time
+    activo: bool
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
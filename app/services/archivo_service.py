@@ -0,0 +1,189 @@
+import os
+from datetime import datetime, timezone
+from typing import Optional
+from sqlalchemy import delete, insert, select, text
+from sqlalchemy.orm import Session
+from app.models.cita import Cita, exclusividad_postgresql, nombre_exclusividad, particiones_citas
+from app.models.cita_archivada import CitaArchivada
+from app.models.recordatorio import Recordatorio
+from app.services.ciclo_service import CICLO_LOTE
+from app.services.disponibilidad_service import normalizar
+from app.utils.logging_config import get_logger
+
+logger = get_logger("archivo_service")
+
+# Particiones mensuales de citas y archivo de las antiguas (las ejecuta app/utils/planificador.py)
+# Meses completos que se conservan en citas además del actual; los anteriores pasan a
+# citas_archivo. Sin definir, el archivo está desactivado: nada sale de citas
+CITAS_ARCHIVO_MESES = int(os.getenv("CITAS_ARCHIVO_MESES")) if os.getenv("CITAS_ARCHIVO_MESES") else None
+# Particiones mensuales que se crean por adelantado después de la del mes actual
+CITAS_PARTICIONES_FUTURAS = int(os.getenv("CITAS_PARTICIONES_FUTURAS", "3"))
+# Espera máxima por los bloqueos del DDL; si se agota, la tarea se reintenta en la siguiente ejecución
+PARTICIONES_LOCK_TIMEOUT = os.getenv("PARTICIONES_LOCK_TIMEOUT", "5s")
+
+PARTICION_DEFECTO = "citas_default"
+COLUMNAS_ARCHIVO = [columna.name for columna in CitaArchivada.__table__.columns]
+
+
+def inicio_mes(fecha: datetime) -> datetime:
+    return fecha.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def sumar_meses(mes: datetime, meses: int) -> datetime:
+    indice = mes.year * 12 + mes.month - 1 + meses
+    return mes.replace(year=indice // 12, month=indice % 12 + 1)
+
+def nombre_particion(mes: datetime, tabla: str = "citas") -> str:
+    return f"{tabla}_p{mes:%Y%m}"
+
+def mes_de_particion(nombre: str) -> Optional[datetime]:
+    """Mes de citas_p202610 (None para la partición por defecto)"""
+    sufijo = nombre.rpartition("_p")[2]
+    if len(sufijo) != 6 or not sufijo.isdigit():
+        return None
+    return datetime(int(sufijo[:4]), int(sufijo[4:]), 1)
+
+def _limites(mes: datetime) -> str:
+    return f"FROM ('{mes:%Y-%m-%d}') TO ('{sumar_meses(mes, 1):%Y-%m-%d}')"
+
+
+def crear_particion(conn, mes: datetime, exclusividad: bool = True):
+    """
+    Crea la partición de `mes` como tabla suelta, le mueve las filas de ese
+    mes que hubiera en citas_default y la engancha con ATTACH PARTITION, que
+    no bloquea las lecturas ni escrituras de citas (CREATE TABLE ... PARTITION OF
+    sí, y falla si la partición por defecto tiene filas del rango).
+    """
+    nombre = nombre_particion(mes)
+    conn.exec_driver_sql(f"SET LOCAL lock_timeout = '{PARTICIONES_LOCK_TIMEOUT}'")
+    # Ninguna fila de ese mes puede entrar en la partición por defecto hasta el ATTACH
+    conn.exec_driver_sql(f"LOCK TABLE {PARTICION_DEFECTO} IN SHARE ROW EXCLUSIVE MODE")
+    conn.exec_driver_sql(f"CREATE TABLE {nombre} (LIKE citas INCLUDING DEFAULTS)")
+    conn.execute(
+        text(f"WITH movidas AS (DELETE FROM {PARTICION_DEFECTO} WHERE fecha_hora >= :desde AND fecha_hora < :hasta "
+             f"RETURNING *) INSERT INTO {nombre} SELECT * FROM movidas"),
+        {"desde": mes, "hasta": sumar_meses(mes, 1)}
+    )
+    if exclusividad:
+        conn.exec_driver_sql(exclusividad_postgresql(nombre, nombre_exclusividad(nombre)))
+    conn.exec_driver_sql(f"ALTER TABLE citas ATTACH PARTITION {nombre} FOR VALUES {_limites(mes)}")
+
+def crear_particiones(db: Session, ahora=None, futuras: int = CITAS_PARTICIONES_FUTURAS,
+                      exclusividad: bool = True) -> int:
+    """
+    Crea las particiones del mes actual y de los `futuras` siguientes, y las
+    de los meses que tengan filas en citas_default (citas más allá del último
+    mes creado o cargadas en bloque). Sin particionar (SQLite o una base
+    creada sin la migración 0008) no hace nada.
+    """
+    conn = db.connection()
+    existentes = set(particiones_citas(conn))
+    if not existentes:
+        return 0
+    actual = inicio_mes(normalizar(ahora or datetime.now(timezone.utc)))
+    meses = {sumar_meses(actual, n) for n in range(futuras + 1)}
+    meses.update(
+        inicio_mes(fecha) for fecha in conn.execute(
+            text(f"SELECT DISTINCT date_trunc('month', fecha_hora) FROM {PARTICION_DEFECTO}")
+        ).scalars()
+    )
+    creadas = 0
+    for mes in sorted(meses):
+        if nombre_particion(mes) in existentes:
+            continue
+        crear_particion(db.connection(), mes, exclusividad)
+        db.commit()
+        creadas += 1
+    db.commit()
+    if creadas:
+        logger.info("%s particiones de citas creadas", creadas)
+    return creadas
+
+
+def archivar_particion(db: Session, nombre: str, mes: datetime) -> int:
+    """
+    Pasa la partición `nombre` de citas a citas_archivo sin copiar filas.
+
+    Primero valida un CHECK con el rango del mes (sin bloquear citas) para que
+    el ATTACH en el archivo no tenga que recorrer la partición; después, en una
+    transacción corta, DETACH de citas (bloqueo exclusivo breve) y ATTACH en el
+    archivo. La partición conserva sus índices; pierde la exclusividad de agenda.
+    """
+    conn = db.connection()
+    comprobacion = f"ck_{nombre}_rango"
+    conn.exec_driver_sql(f"SET LOCAL lock_timeout = '{PARTICIONES_LOCK_TIMEOUT}'")
+    conn.exec_driver_sql(f"ALTER TABLE {nombre} DROP CONSTRAINT IF EXISTS {comprobacion}")
+    conn.exec_driver_sql(
+        f"ALTER TABLE {nombre} ADD CONSTRAINT {comprobacion} "
+        f"CHECK (fecha_hora >= '{mes:%Y-%m-%d}' AND fecha_hora < '{sumar_meses(mes, 1):%Y-%m-%d}') NOT VALID"
+    )
+    db.commit()
+    conn = db.connection()
+    conn.exec_driver_sql(f"ALTER TABLE {nombre} VALIDATE CONSTRAINT {comprobacion}")
+    filas = conn.exec_driver_sql(f"SELECT count(*) FROM {nombre}").scalar()
+    db.commit()
+
+    conn = db.connection()
+    archivada = nombre_particion(mes, "citas_archivo")
+    conn.exec_driver_sql(f"SET LOCAL lock_timeout = '{PARTICIONES_LOCK_TIMEOUT}'")
+    conn.exec_driver_sql(f"ALTER TABLE citas DETACH PARTITION {nombre}")
+    conn.exec_driver_sql(f"ALTER TABLE {nombre} DROP CONSTRAINT IF EXISTS {nombre_exclusividad(nombre)}")
+    conn.exec_driver_sql(f"ALTER TABLE {nombre} RENAME TO {archivada}")
+    conn.exec_driver_sql(f"ALTER TABLE citas_archivo ATTACH PARTITION {archivada} FOR VALUES {_limites(mes)}")
+    db.commit()
+    return filas
+
+def mover_filas(db: Session, corte: datetime, lote: int = CICLO_LOTE) -> int:
+    """Sin particiones: INSERT ... SELECT en citas_archivo y DELETE en citas por trozos de `lote` filas"""
+    citas = Cita.__table__
+    total = 0
+    while True:
+        ids = db.execute(
+            select(citas.c.id).where(citas.c.fecha_hora < corte).order_by(citas.c.id).limit(lote)
+        ).scalars().all()
+        if not ids:
+            break
+        db.execute(insert(CitaArchivada.__table__).from_select(
+            COLUMNAS_ARCHIVO, select(*(citas.c[columna] for columna in COLUMNAS_ARCHIVO)).where(citas.c.id.in_(ids))
+        ))
+        db.execute(delete(citas).where(citas.c.id.in_(ids)))
+        db.commit()
+        total += len(ids)
+        if len(ids) < lote:
+            break
+    return total
+
+def archivar_citas(db: Session, ahora=None, meses: Optional[int] = CITAS_ARCHIVO_MESES, lote: int = CICLO_LOTE) -> int:
+    """
+    Pasa a citas_archivo las citas anteriores al mes actual menos `meses`:
+    particiones enteras si citas está particionada, filas por trozos si no.
+    Borra también los recordatorios de esas fechas. Con `meses` None no hace nada.
+
+    Las citas que estén en citas_default pasan antes a la partición de su mes
+    (crear_particiones), así que también se archivan.
+    """
+    if meses is None:
+        return 0
+    corte = sumar_meses(inicio_mes(normalizar(ahora or datetime.now(timezone.utc))), -meses)
+    particiones = particiones_citas(db.connection())
+    if particiones:
+        crear_particiones(db, ahora)
+        particiones = particiones_citas(db.connection())
+        total = 0
+        for nombre in particiones:
+            mes = mes_de_particion(nombre)
+            if mes is not None and sumar_meses(mes, 1) <= corte:
+                total += archivar_particion(db, nombre, mes)
+    else:
+        total = mover_filas(db, corte, lote)
+    db.execute(delete(Recordatorio).where(Recordatorio.fecha_hora < corte))
+    db.commit()
+    if total:
+        logger.info("%s citas anteriores a %s archivadas", total, corte.date())
+    return total
+
+
+# (nombre, función, intervalo en segundos) para el planificador
+TAREAS = (
+    ("particiones_citas", crear_particiones, 3600),
+    ("archivo_citas", archivar_citas, 3600),
+)
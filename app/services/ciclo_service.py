@@ -0,0 +1,113 @@
+import os
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import and_, insert, literal, select, update
+from sqlalchemy.orm import Session
+from app.models.cita import Cita
+from app.models.recordatorio import Recordatorio
+from app.schemas.cita import EstadoEnum
+from app.services.disponibilidad_service import normalizar
+from app.utils.eventos import CAMPOS_EVENTO, broker_citas
+from app.utils.logging_config import get_logger
+
+logger = get_logger("ciclo_service")
+
+# Tareas periódicas del ciclo de vida de las citas (las ejecuta app/utils/planificador.py)
+# Estado de las citas programadas cuya hora ya pasó: completada o no_asistio
+CITAS_VENCIDAS_ESTADO = os.getenv("CITAS_VENCIDAS_ESTADO", EstadoEnum.completada.value)
+# Minutos después de su hora en que una cita programada se da por vencida
+CITAS_VENCIDAS_MARGEN = timedelta(minutes=float(os.getenv("CITAS_VENCIDAS_MARGEN", "60")))
+# Horas de antelación con que se generan los recordatorios
+RECORDATORIOS_ANTELACION = timedelta(hours=float(os.getenv("RECORDATORIOS_ANTELACION", "24")))
+# Filas por UPDATE/INSERT: cada trozo es una transacción corta
+CICLO_LOTE = int(os.getenv("CICLO_LOTE", "1000"))
+# Segundos entre ejecuciones de cada tarea
+CICLO_INTERVALO = float(os.getenv("CICLO_INTERVALO", "60"))
+
+ESTADOS_VENCIDAS = (EstadoEnum.completada.value, EstadoEnum.no_asistio.value)
+
+
+def _ahora(ahora=None) -> datetime:
+    return normalizar(ahora or datetime.now(timezone.utc))
+
+def consulta_vencidas(limite, lote):
+    """Ids del siguiente trozo de citas programadas anteriores a `limite` (índice parcial de programadas)"""
+    return (
+        select(Cita.id)
+        .where(Cita.estado == "programada", Cita.fecha_hora < limite)
+        .order_by(Cita.fecha_hora)
+        .limit(lote)
+    )
+
+def consulta_recordatorios_pendientes(desde, hasta, lote):
+    """Citas programadas entre `desde` y `hasta` sin recordatorio para su hora actual"""
+    return (
+        select(Cita.id, Cita.paciente_id, Cita.fecha_hora, literal(desde))
+        .outerjoin(Recordatorio, and_(Recordatorio.cita_id == Cita.id, Recordatorio.fecha_hora == Cita.fecha_hora))
+        .where(
+            Cita.estado == "programada",
+            Cita.fecha_hora >= desde,
+            Cita.fecha_hora < hasta,
+            Recordatorio.id.is_(None)
+        )
+        .order_by(Cita.fecha_hora)
+        .limit(lote)
+    )
+
+def cerrar_vencidas(db: Session, ahora=None, estado: str = CITAS_VENCIDAS_ESTADO, lote: int = CICLO_LOTE) -> int:
+    """
+    Pasa a `estado` las citas programadas cuya hora pasó hace más de
+    CITAS_VENCIDAS_MARGEN, por trozos de `lote` filas con un COMMIT cada uno.
+    Publica un evento "editada" por cita en /citas/stream.
+    """
+    if estado not in ESTADOS_VENCIDAS:
+        raise ValueError(f"CITAS_VENCIDAS_ESTADO no soportado: {estado}")
+    momento = _ahora(ahora)
+    limite = momento - CITAS_VENCIDAS_MARGEN
+    columnas = [getattr(Cita, campo) for campo in CAMPOS_EVENTO]
+    total = 0
+    while True:
+        filas = db.execute(
+            update(Cita)
+            .where(Cita.id.in_(consulta_vencidas(limite, lote).scalar_subquery()))
+            .values(estado=estado, updated_at=momento)
+            .returning(*columnas)
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.commit()
+        total += len(filas)
+        broker_citas.publicar("editada", [fila._asdict() for fila in filas])
+        if len(filas) < lote:
+            break
+    if total:
+        logger.info("%s citas vencidas pasadas a %s", total, estado)
+    return total
+
+def generar_recordatorios(db: Session, ahora=None, antelacion: timedelta = RECORDATORIOS_ANTELACION,
+                          lote: int = CICLO_LOTE) -> int:
+    """
+    Crea, con INSERT ... SELECT por trozos, los recordatorios de las citas
+    programadas de las próximas `antelacion` horas que aún no lo tienen
+    """
+    desde = _ahora(ahora)
+    total = 0
+    while True:
+        insertados = db.execute(
+            insert(Recordatorio).from_select(
+                ["cita_id", "paciente_id", "fecha_hora", "created_at"],
+                consulta_recordatorios_pendientes(desde, desde + antelacion, lote)
+            )
+        ).rowcount
+        db.commit()
+        total += insertados
+        if insertados < lote:
+            break
+    if total:
+        logger.info("%s recordatorios generados", total)
+    return total
+
+
+# (nombre, función, intervalo en segundos) para el planificador
+TAREAS = (
+    ("cerrar_vencidas", cerrar_vencidas, CICLO_INTERVALO),
+    ("recordatorios", generar_recordatorios, CICLO_INTERVALO),
+)
@@ -1,82 +1,485 @@
+import hashlib
+import os
+from bisect import bisect_left, bisect_right, insort
+from sqlalchemy import and_, delete, func, insert, or_, select, tuple_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from datetime import datetime, timezone, timedelta
-from app.models.cita import Cita
+from datetime import datetime, timezone
+from app.models.cita import Cita, es_conflicto_agenda
+from app.models.cita_archivada import CitaArchivada
+from app.models.recordatorio import Recordatorio
+from app.models.user import User
+from app.models.recurso import Recurso
+from app.utils.eventos import broker_citas, datos_cita
+from app.utils.paginacion import codificar_cursor, decodificar_cursor
+from app.services.disponibilidad_service import (
+    indice_disponibilidad, obtener_sugerencia, normalizar, condicion_recursos, MARGEN_CONFLICTO
+)
+from app.services.recurso_service import resolver_agendas, agendas_de_recursos, valor_motivo
 from app.utils.logging_config import get_logger
 
 logger = get_logger("cita_service")
 
-def crear_cita(motivo, fecha_hora, paciente_id, notas=None, db: Session = None):
+# Lecturas que pueden servirse desde una réplica (ver ServicioDual). La
+# exportación no está: su cursor se recorre después de devolver la respuesta.
+SOLO_LECTURA = frozenset({
+    "obtener_citas_paciente", "obtener_todas_las_citas", "obtener_citas_paginadas", "obtener_citas_de_hoy",
+    "obtener_citas_paciente_versionadas", "obtener_citas_de_hoy_versionadas"
+})
+
+# Reintentos cuando la exclusividad de la agenda (ver app/models/cita.py) rechaza
+# el INSERT porque otra reserva simultánea tomó el horario
+RESERVA_REINTENTOS = 3
+# true: en PostgreSQL cada reserva toma un pg_advisory_xact_lock por recurso y
+# día antes de verificar, y las reservas de una misma agenda se hacen en fila
+# (menos reintentos con mucha contención sobre pocos recursos)
+RESERVA_BLOQUEO_AGENDA = os.getenv("RESERVA_BLOQUEO_AGENDA", "false").lower() == "true"
+
+def clave_bloqueo(recurso_id, fecha_hora) -> int:
+    """Clave de pg_advisory_xact_lock para la agenda de un recurso (0 = general) en un día"""
+    return (recurso_id or 0) * 1_000_000 + normalizar(fecha_hora).date().toordinal()
+
+def consultas_bloqueo(fecha_hora, agendas, dialecto):
+    """Bloqueos de las agendas candidatas, en orden fijo para no provocar interbloqueos"""
+    if not RESERVA_BLOQUEO_AGENDA or dialecto != "postgresql":
+        return []
+    claves = sorted({clave_bloqueo(agenda.recurso_id, fecha_hora) for agenda in agendas})
+    return [select(func.pg_advisory_xact_lock(clave)) for clave in claves]
+
+def consulta_ocupacion(fecha_hora, agendas, excluir_id=None):
+    """
+    Recurso y plaza de las citas programadas a menos de MARGEN_CONFLICTO
+    (índice recurso_id, estado, fecha_hora). excluir_id: la cita que se edita.
+    """
+    consulta = select(Cita.recurso_id, Cita.plaza).where(
+        Cita.estado == "programada",
+        Cita.fecha_hora.between(fecha_hora - MARGEN_CONFLICTO, fecha_hora + MARGEN_CONFLICTO),
+        condicion_recursos({agenda.recurso_id for agenda in agendas})
+    )
+    if excluir_id is not None:
+        consulta = consulta.where(Cita.id != excluir_id)
+    return consulta
+
+def plazas_por_recurso(filas):
+    plazas = {}
+    for recurso_id, plaza in filas:
+        plazas.setdefault(recurso_id, []).append(plaza)
+    return plazas
+
+def elegir_agenda(agendas, plazas, preferido=None):
+    """
+    La agenda con hueco menos ocupada en proporción a su capacidad, o None si
+    todas están llenas. plazas: {recurso_id: plazas de las citas programadas
+    dentro del margen de conflicto}. preferido: recurso actual de una cita que
+    se edita; si su agenda tiene hueco, la cita no cambia de recurso.
+    """
+    def ocupacion(agenda):
+        return len(plazas.get(agenda.recurso_id, ())) / agenda.capacidad
+    con_hueco = [a for a in agendas if ocupacion(a) < 1]
+    actual = next((a for a in con_hueco if a.recurso_id == preferido), None)
+    return actual or min(con_hueco, key=ocupacion, default=None)
+
+def plaza_libre(agenda, plazas):
+    """Primera plaza del recurso sin cita dentro del margen; existe si la agenda tiene hueco"""
+    return min(set(range(agenda.capacidad)) - set(plazas.get(agenda.recurso_id, ())))
+
+def mensaje_fuera_de_horario(recurso_id):
+    if recurso_id is not None:
+        return "El recurso no atiende en ese horario"
+    return "Ningún recurso de este servicio atiende en ese horario"
+
+def mensaje_conflicto(sugerencia):
+    # La sugerencia sale del índice de disponibilidad recargado para ese día, así que está libre de verdad
+    if sugerencia is None:
+        return "Ya existe una cita programada cerca de este horario y no hay horarios libres próximos"
+    return f"Ya existe una cita programada cerca de este horario. Hora sugerida: {sugerencia}"
+
+def consulta_cita_mismo_dia(paciente_id, fecha_hora, excluir_id=None):
+    """Alguna otra cita programada del paciente el día de fecha_hora"""
+    inicio_dia, fin_dia = _limites_dia(fecha_hora)
+    consulta = select(Cita.id).where(
+        Cita.paciente_id == paciente_id,
+        Cita.fecha_hora.between(inicio_dia, fin_dia),
+        Cita.estado == "programada"
+    )
+    if excluir_id is not None:
+        consulta = consulta.where(Cita.id != excluir_id)
+    return consulta.limit(1)
+
+def crear_cita(motivo, fecha_hora, paciente_id, notas=None, db: Session = None, recurso_id=None):
     try:
-        logger.info(f"Creando cita para paciente {paciente_id} en {fecha_hora}")
+        logger.info("Creando cita para paciente %s en %s", paciente_id, fecha_hora)
         
         fecha_actual = datetime.now(timezone.utc)
         if fecha_hora < fecha_actual:
-            logger.warning(f"Intento de agendar cita en el pasado: {fecha_hora}")
+            logger.warning("Intento de agendar cita en el pasado: %s", fecha_hora)
             return None, "No se puede agendar una cita en el pasado."
         
-        # Verificar conflictos de horario (30 minutos de diferencia)
-        inicio_ventana = fecha_hora - timedelta(minutes=30)
-        fin_ventana = fecha_hora + timedelta(minutes=30)
-        
-        cita_conflicto = db.query(Cita).filter(
-            Cita.fecha_hora.between(inicio_ventana, fin_ventana),
-            Cita.estado == "programada"
-        ).first()
-        
-        if cita_conflicto:
-            logger.warning(f"Conflicto de horario detectado: {fecha_hora}")
-            return None, f"Ya existe una cita programada cerca de este horario. Hora sugerida: {cita_conflicto.fecha_hora + timedelta(hours=1)}"
-        
-        # Verificar si el paciente ya tiene una cita en el mismo día
-        inicio_dia = fecha_hora.replace(hour=0, minute=0, second=0, microsecond=0)
-        fin_dia = fecha_hora.replace(hour=23, minute=59, second=59, microsecond=999999)
-        
-        cita_mismo_dia = db.query(Cita).filter(
-            Cita.paciente_id == paciente_id,
-            Cita.fecha_hora.between(inicio_dia, fin_dia),
-            Cita.estado == "programada"
-        ).first()
-        
-        if cita_mismo_dia:
-            logger.warning(f"Paciente {paciente_id} ya tiene cita en el mismo día")
-            return None, "Ya tienes una cita programada para este día"
-        
-        nueva_cita = Cita(
-            motivo=motivo,
-            fecha_hora=fecha_hora,
-            paciente_id=paciente_id,
-            notas=notas,
-            estado="programada"
-        )
+        # Doctores o salas del servicio (o el recurso pedido); sin recursos, la agenda general
+        agendas, error = resolver_agendas(motivo, recurso_id, db)
+        if error:
+            return None, error
+        en_horario = [agenda for agenda in agendas if agenda.atiende(fecha_hora)]
+        if not en_horario:
+            return None, mensaje_fuera_de_horario(recurso_id)
         
-        db.add(nueva_cita)
-        db.commit()
-        db.refresh(nueva_cita)
+        for intento in range(RESERVA_REINTENTOS + 1):
+            for consulta in consultas_bloqueo(fecha_hora, en_horario, db.get_bind().dialect.name):
+                db.execute(consulta)
+            
+            # Verificar conflictos de horario (30 minutos de diferencia) en la agenda de cada recurso
+            plazas = plazas_por_recurso(db.execute(consulta_ocupacion(fecha_hora, en_horario)).all())
+            agenda = elegir_agenda(en_horario, plazas)
+            
+            if agenda is None:
+                logger.warning("Conflicto de horario detectado: %s", fecha_hora)
+                return None, mensaje_conflicto(obtener_sugerencia(fecha_hora, db, agendas))
+            
+            # Verificar si el paciente ya tiene una cita en el mismo día
+            if db.execute(consulta_cita_mismo_dia(paciente_id, fecha_hora)).first():
+                logger.warning("Paciente %s ya tiene cita en el mismo día", paciente_id)
+                return None, "Ya tienes una cita programada para este día"
+            
+            nueva_cita = Cita(
+                motivo=motivo,
+                fecha_hora=fecha_hora,
+                paciente_id=paciente_id,
+                recurso_id=agenda.recurso_id,
+                plaza=plaza_libre(agenda, plazas),
+                notas=notas,
+                estado="programada"
+            )
+            
+            db.add(nueva_cita)
+            try:
+                db.commit()
+            except IntegrityError as e:
+                # Otra reserva simultánea tomó el horario entre la verificación y el COMMIT
+                db.rollback()
+                if not es_conflicto_agenda(e):
+                    raise
+                logger.info("Horario %s tomado por una reserva simultánea (intento %s)", fecha_hora, intento + 1)
+                continue
+            db.refresh(nueva_cita)
+            
+            indice_disponibilidad.registrar(nueva_cita.fecha_hora, nueva_cita.recurso_id)
+            broker_citas.publicar("creada", [nueva_cita])
+            logger.info("Cita creada exitosamente: ID %s para paciente %s", nueva_cita.id, paciente_id)
+            return nueva_cita, None
         
-        logger.info(f"Cita creada exitosamente: ID {nueva_cita.id} para paciente {paciente_id}")
-        return nueva_cita, None
+        return None, "Ya existe una cita programada cerca de este horario"
         
     except Exception as e:
-        logger.error(f"Error al crear cita para paciente {paciente_id}: {str(e)}")
+        logger.error("Error al crear cita para paciente %s: %s", paciente_id, e)
+        db.rollback()
+        return None, f"Error interno del servidor: {str(e)}"
+
+def _limites_dia(fecha_hora):
+    return (fecha_hora.replace(hour=0, minute=0, second=0, microsecond=0),
+            fecha_hora.replace(hour=23, minute=59, second=59, microsecond=999999))
+
+def consulta_conflictos_lote(items):
+    """
+    Una sola consulta con todas las citas programadas que pueden chocar con el lote.
+
+    items: lista de (indice, datos, paciente_id). Se piden la ventana de ±30
+    minutos de cada cita (de todos los recursos) y el día completo de cada paciente.
+    """
+    condiciones = []
+    for _, datos, paciente_id in items:
+        condiciones.append(Cita.fecha_hora.between(datos.fecha_hora - MARGEN_CONFLICTO, datos.fecha_hora + MARGEN_CONFLICTO))
+        inicio_dia, fin_dia = _limites_dia(datos.fecha_hora)
+        condiciones.append(and_(Cita.paciente_id == paciente_id, Cita.fecha_hora.between(inicio_dia, fin_dia)))
+    return select(Cita.fecha_hora, Cita.paciente_id, Cita.recurso_id, Cita.plaza).where(
+        Cita.estado == "programada", or_(*condiciones)
+    )
+
+def consulta_recursos_lote(items):
+    """Recursos activos de los servicios del lote y los pedidos expresamente"""
+    motivos = {valor_motivo(datos.motivo) for _, datos, _ in items}
+    ids = {datos.recurso_id for _, datos, _ in items if datos.recurso_id is not None}
+    return select(Recurso).where(
+        Recurso.activo.is_(True), or_(Recurso.motivo.in_(motivos), Recurso.id.in_(ids))
+    ).order_by(Recurso.id)
+
+def planificar_lote(items, existentes, pacientes_validos=None, recursos=()):
+    """
+    Decide en memoria qué citas del lote se pueden crear y en qué recurso.
+
+    Aplica las mismas reglas que crear_cita contra las citas existentes y
+    contra las ya aceptadas del propio lote (gana la primera en el orden
+    recibido). Devuelve (aceptadas, errores por índice); cada aceptada es
+    (indice, datos, paciente_id, recurso_id, plaza).
+    """
+    recursos_por_id = {r.id: r for r in recursos}
+    recursos_por_motivo = {}
+    for recurso in recursos:
+        recursos_por_motivo.setdefault(recurso.motivo, []).append(recurso)
+    # Por recurso, (fecha, plaza) ordenadas por fecha
+    ocupadas = {}
+    for fecha, _, recurso_id, plaza in existentes:
+        insort(ocupadas.setdefault(recurso_id, []), (normalizar(fecha), plaza))
+    dias_ocupados = {(paciente_id, normalizar(fecha).date()) for fecha, paciente_id, _, _ in existentes}
+    ocupadas_lote = {}
+    dias_lote = set()
+    aceptadas, errores = [], {}
+
+    def plazas_en_ventana(citas, fecha):
+        inicio = bisect_left(citas, fecha - MARGEN_CONFLICTO, key=lambda c: c[0])
+        fin = bisect_right(citas, fecha + MARGEN_CONFLICTO, key=lambda c: c[0])
+        return [plaza for _, plaza in citas[inicio:fin]]
+
+    for indice, datos, paciente_id in items:
+        fecha = normalizar(datos.fecha_hora)
+        if pacientes_validos is not None and paciente_id not in pacientes_validos:
+            errores[indice] = "Paciente no encontrado"
+            continue
+        if datos.recurso_id is not None:
+            candidatos = [recursos_por_id[datos.recurso_id]] if datos.recurso_id in recursos_por_id else []
+        else:
+            candidatos = recursos_por_motivo.get(valor_motivo(datos.motivo), [])
+        agendas, error = agendas_de_recursos(candidatos, datos.motivo, datos.recurso_id)
+        if error:
+            errores[indice] = error
+            continue
+        en_horario = [agenda for agenda in agendas if agenda.atiende(fecha)]
+        if not en_horario:
+            errores[indice] = mensaje_fuera_de_horario(datos.recurso_id)
+            continue
+
+        previas = {a.recurso_id: plazas_en_ventana(ocupadas.get(a.recurso_id, []), fecha) for a in en_horario}
+        total = {a.recurso_id: previas[a.recurso_id] + plazas_en_ventana(ocupadas_lote.get(a.recurso_id, []), fecha) for a in en_horario}
+        agenda = elegir_agenda(en_horario, total)
+        if agenda is None and elegir_agenda(en_horario, previas) is None:
+            errores[indice] = "Ya existe una cita programada cerca de este horario"
+        elif agenda is None:
+            errores[indice] = "Conflicto de horario con otra cita del mismo lote"
+        elif (paciente_id, fecha.date()) in dias_ocupados:
+            errores[indice] = "El paciente ya tiene una cita programada para este día"
+        elif (paciente_id, fecha.date()) in dias_lote:
+            errores[indice] = "El paciente ya tiene otra cita en este lote para el mismo día"
+        else:
+            plaza = plaza_libre(agenda, total)
+            insort(ocupadas_lote.setdefault(agenda.recurso_id, []), (fecha, plaza))
+            dias_lote.add((paciente_id, fecha.date()))
+            aceptadas.append((indice, datos, paciente_id, agenda.recurso_id, plaza))
+    return aceptadas, errores
+
+def insertar_lote(aceptadas):
+    """
+    INSERT multi-fila que devuelve (id, paciente_id, fecha_hora) de cada cita.
+
+    Un paciente no puede tener dos citas aceptadas el mismo día, así que los
+    ids se asocian por (paciente_id, fecha_hora); así no hace falta garantizar
+    el orden de RETURNING (que en SQLite obligaría a insertar fila por fila).
+    """
+    filas = [
+        {"motivo": datos.motivo.value, "fecha_hora": normalizar(datos.fecha_hora), "paciente_id": paciente_id,
+         "recurso_id": recurso_id, "plaza": plaza, "notas": datos.notas, "estado": "programada"}
+        for _, datos, paciente_id, recurso_id, plaza in aceptadas
+    ]
+    return insert(Cita).returning(Cita.id, Cita.paciente_id, Cita.fecha_hora), filas
+
+def resultados_lote(items, aceptadas, filas_insertadas, errores):
+    ids = {(paciente_id, normalizar(fecha)): cita_id for cita_id, paciente_id, fecha in filas_insertadas}
+    creadas = {
+        indice: (ids[(paciente_id, normalizar(datos.fecha_hora))], recurso_id)
+        for indice, datos, paciente_id, recurso_id, _ in aceptadas
+    }
+    return [
+        {"indice": indice, "success": True, "cita": creadas[indice][0], "recurso_id": creadas[indice][1]} if indice in creadas
+        else {"indice": indice, "success": False, "mensaje": errores[indice]}
+        for indice, _, _ in items
+    ]
+
+def citas_lote(aceptadas, filas_insertadas):
+    """Citas creadas por un lote, con los campos de los eventos de /citas/stream"""
+    ids = {(paciente_id, normalizar(fecha)): cita_id for cita_id, paciente_id, fecha in filas_insertadas}
+    return [
+        {"id": ids[(paciente_id, normalizar(datos.fecha_hora))], "paciente_id": paciente_id, "recurso_id": recurso_id,
+         "motivo": datos.motivo, "fecha_hora": normalizar(datos.fecha_hora), "estado": "programada", "notas": datos.notas}
+        for _, datos, paciente_id, recurso_id, _ in aceptadas
+    ]
+
+def crear_citas_lote(items, db: Session, verificar_pacientes=False):
+    """Crea varias citas con una consulta de conflictos, un INSERT multi-fila y un solo COMMIT"""
+    try:
+        logger.info("Creando lote de %s citas", len(items))
+        pacientes_validos = None
+        if verificar_pacientes:
+            ids_pacientes = {paciente_id for _, _, paciente_id in items}
+            pacientes_validos = set(db.execute(select(User.id).where(User.id.in_(ids_pacientes))).scalars().all())
+
+        for intento in range(RESERVA_REINTENTOS + 1):
+            recursos = db.execute(consulta_recursos_lote(items)).scalars().all()
+            existentes = db.execute(consulta_conflictos_lote(items)).all()
+            aceptadas, errores = planificar_lote(items, existentes, pacientes_validos, recursos)
+
+            insertadas = []
+            if not aceptadas:
+                break
+            try:
+                insertadas = db.execute(*insertar_lote(aceptadas)).all()
+                db.commit()
+                break
+            except IntegrityError as e:
+                # Una reserva simultánea ocupó algún horario del lote: se vuelve a planificar
+                db.rollback()
+                if not es_conflicto_agenda(e) or intento == RESERVA_REINTENTOS:
+                    raise
+                logger.info("Lote en conflicto con una reserva simultánea (intento %s)", intento + 1)
+    except Exception as e:
+        logger.error("Error al crear lote de citas: %s", e)
         db.rollback()
         return None, f"Error interno del servidor: {str(e)}"
 
-def obtener_citas_paciente(paciente_id, db: Session):
-    # Solo mostrar citas activas (programadas y completadas), no canceladas
-    return db.query(Cita).filter(
+    for _, datos, _, recurso_id, _ in aceptadas:
+        indice_disponibilidad.registrar(datos.fecha_hora, recurso_id)
+    broker_citas.publicar("creada", citas_lote(aceptadas, insertadas))
+    logger.info("Lote procesado: %s creadas, %s rechazadas", len(aceptadas), len(errores))
+    return resultados_lote(items, aceptadas, insertadas, errores), None
+
+def obtener_citas_paciente(paciente_id, db: Session, desde=None):
+    return db.query(Cita).filter(*condiciones_citas_paciente(paciente_id, desde)).all()
+
+def condiciones_citas_paciente(paciente_id, desde=None):
+    # Solo citas activas (programadas y completadas), no canceladas. Con `desde`
+    # y citas particionada por mes (migración 0008) PostgreSQL solo recorre las
+    # particiones de ese mes en adelante
+    condiciones = (
         Cita.paciente_id == paciente_id,
-        Cita.estado.in_(["programada", "completada"])
-    ).all()
+        Cita.estado.in_(["programada", "completada"]),
+    )
+    if desde is not None:
+        condiciones += (Cita.fecha_hora >= desde,)
+    return condiciones
+
+def condiciones_citas_de_hoy(paciente_id, hoy):
+    return condiciones_citas_paciente(paciente_id) + (
+        Cita.fecha_hora >= datetime.combine(hoy, datetime.min.time(), tzinfo=timezone.utc),
+        Cita.fecha_hora <= datetime.combine(hoy, datetime.max.time(), tzinfo=timezone.utc),
+    )
+
+def consulta_version(condiciones):
+    """Número de citas y última modificación, sin cargar filas (índice paciente_id, estado, updated_at)"""
+    return select(func.count(Cita.id), func.max(Cita.updated_at)).where(*condiciones)
+
+def version_citas(paciente_id, total, ultima, variante="") -> str:
+    """
+    Versión de un listado de citas. Un alta, edición o cancelación cambia
+    updated_at o el número de citas del listado, y con ello la versión.
+    """
+    clave = f"{paciente_id}:{total}:{ultima.isoformat() if ultima else ''}:{variante}"
+    return hashlib.blake2b(clave.encode(), digest_size=12).hexdigest()
+
+def version_de_filas(paciente_id, citas, variante="") -> str:
+    """La misma versión que consulta_version, calculada sobre las filas ya cargadas"""
+    ultima = max((c.updated_at for c in citas if c.updated_at is not None), default=None)
+    return version_citas(paciente_id, len(citas), ultima, variante)
+
+def obtener_citas_paciente_versionadas(paciente_id, versiones_conocidas, db: Session, desde=None):
+    """
+    (versión, citas). Si el cliente ya tiene la versión actual devuelve
+    (versión, None) tras una consulta agregada, sin cargar las filas. Sin
+    versiones conocidas la versión se calcula de las propias filas.
+    """
+    variante = desde.isoformat() if desde else ""
+    if versiones_conocidas:
+        total, ultima = db.execute(consulta_version(condiciones_citas_paciente(paciente_id, desde))).one()
+        version = version_citas(paciente_id, total, ultima, variante)
+        if version in versiones_conocidas:
+            return version, None
+    citas = obtener_citas_paciente(paciente_id, db, desde)
+    return version_de_filas(paciente_id, citas, variante), citas
 
 def obtener_todas_las_citas(db: Session):
     return db.query(Cita).all()
 
+def consulta_citas_paginadas(limite, cursor=None, estado=None, motivo=None, paciente_id=None, desde=None, hasta=None):
+    """
+    Construye la consulta keyset sobre (fecha_hora, id).
+
+    Pide limite + 1 filas para saber si hay una página siguiente sin hacer
+    un COUNT; el coste es O(limite) sin importar la profundidad del cursor.
+    """
+    consulta = select(Cita)
+    if estado is not None:
+        consulta = consulta.where(Cita.estado == estado)
+    if motivo is not None:
+        consulta = consulta.where(Cita.motivo == motivo)
+    if paciente_id is not None:
+        consulta = consulta.where(Cita.paciente_id == paciente_id)
+    if desde is not None:
+        consulta = consulta.where(Cita.fecha_hora >= desde)
+    if hasta is not None:
+        consulta = consulta.where(Cita.fecha_hora <= hasta)
+    if cursor is not None:
+        fecha_cursor, id_cursor = decodificar_cursor(cursor)
+        consulta = consulta.where(tuple_(Cita.fecha_hora, Cita.id) > tuple_(fecha_cursor, id_cursor))
+    return consulta.order_by(Cita.fecha_hora, Cita.id).limit(limite + 1)
+
+def paginar_citas(filas, limite):
+    """Separa la fila extra y genera el cursor de la página siguiente"""
+    citas = list(filas[:limite])
+    siguiente_cursor = None
+    if len(filas) > limite:
+        ultima = citas[-1]
+        siguiente_cursor = codificar_cursor(ultima.fecha_hora, ultima.id)
+    return citas, siguiente_cursor
+
+def obtener_citas_paginadas(db: Session, limite=50, cursor=None, **filtros):
+    consulta = consulta_citas_paginadas(limite, cursor, **filtros)
+    return paginar_citas(db.execute(consulta).scalars().all(), limite)
+
+# Columnas de la exportación masiva (filas Core, sin instancias ORM ni identity map)
+COLUMNAS_EXPORTACION = [
+    Cita.id, Cita.motivo, Cita.fecha_hora, Cita.paciente_id, Cita.recurso_id,
+    Cita.estado, Cita.notas, Cita.created_at, Cita.updated_at
+]
+
+# Tablas que puede leer la exportación: las citas vivas o las archivadas (ver archivo_service)
+ORIGENES_EXPORTACION = {"activas": Cita, "archivo": CitaArchivada}
+
+def consulta_exportacion(estado=None, desde=None, hasta=None, tamaño_lote=1000, origen="activas"):
+    modelo = ORIGENES_EXPORTACION[origen]
+    consulta = select(*(getattr(modelo, columna.key) for columna in COLUMNAS_EXPORTACION))
+    if estado is not None:
+        consulta = consulta.where(modelo.estado == estado)
+    if desde is not None:
+        consulta = consulta.where(modelo.fecha_hora >= desde)
+    if hasta is not None:
+        consulta = consulta.where(modelo.fecha_hora <= hasta)
+    # yield_per activa stream_results: cursor del lado del servidor en PostgreSQL
+    return consulta.order_by(modelo.id).execution_options(yield_per=tamaño_lote)
+
+def exportar_citas(db: Session, tamaño_lote=1000, **filtros):
+    """Devuelve un iterador de lotes de filas; la memoria no crece con el total"""
+    resultado = db.execute(consulta_exportacion(tamaño_lote=tamaño_lote, **filtros))
+    return resultado.partitions()
+
+def consulta_borrar_recordatorios(cita_id, solo_pendientes=False):
+    """
+    Recordatorios de una cita borrada o cancelada. recordatorios.cita_id no
+    tiene clave foránea (migración 0008): se borran en la misma transacción.
+    """
+    consulta = delete(Recordatorio).where(Recordatorio.cita_id == cita_id)
+    if solo_pendientes:
+        consulta = consulta.where(Recordatorio.estado == "pendiente")
+    return consulta
+
 def eliminar_cita(cita_id, db: Session):
     cita = db.query(Cita).filter(Cita.id == cita_id).first()
     if not cita:
         return None, "Cita no encontrada"
+    fecha_programada = cita.fecha_hora if cita.estado == "programada" else None
+    recurso_id = cita.recurso_id
+    eliminada = datos_cita(cita)
     db.delete(cita)
+    db.execute(consulta_borrar_recordatorios(cita_id))
     db.commit()
+    if fecha_programada is not None:
+        indice_disponibilidad.quitar(fecha_programada, recurso_id)
+    broker_citas.publicar("eliminada", [eliminada])
     return cita, None
 
 def eliminar_cita_paciente(cita_id, paciente_id, db: Session):
@@ -85,50 +488,101 @@ def eliminar_cita_paciente(cita_id, paciente_id, db: Session):
         return None, "Cita no encontrada o no te pertenece"
     
     # En lugar de eliminar, marcar como cancelada para liberar el horario
+    estaba_programada = cita.estado == "programada"
     cita.estado = "cancelada"
     cita.updated_at = datetime.now(timezone.utc)
+    db.execute(consulta_borrar_recordatorios(cita_id, solo_pendientes=True))
     db.commit()
     db.refresh(cita)
+    if estaba_programada:
+        indice_disponibilidad.quitar(cita.fecha_hora, cita.recurso_id)
+    broker_citas.publicar("cancelada", [cita])
     
-    logger.info(f"Cita {cita_id} cancelada por paciente {paciente_id}. Horario liberado.")
+    logger.info("Cita %s cancelada por paciente %s. Horario liberado.", cita_id, paciente_id)
     return cita, None
 
 def editar_cita(cita_id, datos, db: Session):
-    fecha_actual = datetime.now(timezone.utc)
     cita = db.query(Cita).filter(Cita.id == cita_id).first()
     if not cita:
         return None, "Cita no encontrada"
-    if datos.fecha_hora and datos.fecha_hora < fecha_actual:
-        return None, "No puedes poner una cita con fecha pasada."
-    if datos.motivo is not None:
-        cita.motivo = datos.motivo
-    if datos.fecha_hora is not None:
-        cita.fecha_hora = datos.fecha_hora
-    db.commit()
-    db.refresh(cita)
-    return cita, None
+    return aplicar_edicion(cita, datos, db)
 
 def editar_cita_paciente(cita_id, paciente_id, datos, db: Session):
-    fecha_actual = datetime.now(timezone.utc)
     cita = db.query(Cita).filter(Cita.id == cita_id, Cita.paciente_id == paciente_id).first()
     if not cita:
         return None, "Cita no encontrada o no te pertenece"
-    if datos.fecha_hora and datos.fecha_hora < fecha_actual:
+    return aplicar_edicion(cita, datos, db)
+
+def valores_edicion(cita, datos):
+    """(motivo, fecha_hora, reubicar): reubicar si una cita programada cambia de servicio u hora"""
+    motivo = datos.motivo if datos.motivo is not None else cita.motivo
+    fecha_hora = datos.fecha_hora if datos.fecha_hora is not None else cita.fecha_hora
+    reubicar = cita.estado == "programada" and (datos.motivo is not None or datos.fecha_hora is not None)
+    return motivo, fecha_hora, reubicar
+
+def aplicar_edicion(cita, datos, db: Session):
+    """
+    Cambia el motivo y/o la hora. Una cita programada vuelve a pasar por las
+    reglas de crear_cita: recursos del nuevo servicio que atienden a la nueva
+    hora, agenda con hueco (la actual si lo tiene), plaza libre, una sola cita
+    del paciente por día y reintento si una reserva simultánea toma la plaza.
+    """
+    if datos.fecha_hora and datos.fecha_hora < datetime.now(timezone.utc):
         return None, "No puedes poner una cita con fecha pasada."
-    if datos.motivo is not None:
-        cita.motivo = datos.motivo
-    if datos.fecha_hora is not None:
-        cita.fecha_hora = datos.fecha_hora
-    db.commit()
-    db.refresh(cita)
-    return cita, None
+    cita_id, paciente_id = cita.id, cita.paciente_id
+    fecha_anterior, recurso_anterior = cita.fecha_hora, cita.recurso_id
+    motivo, fecha_hora, reubicar = valores_edicion(cita, datos)
+    if reubicar:
+        agendas, error = resolver_agendas(motivo, None, db)
+        if error:
+            return None, error
+        en_horario = [agenda for agenda in agendas if agenda.atiende(fecha_hora)]
+        if not en_horario:
+            return None, mensaje_fuera_de_horario(None)
+
+    for intento in range(RESERVA_REINTENTOS + 1):
+        if reubicar:
+            for consulta in consultas_bloqueo(fecha_hora, en_horario, db.get_bind().dialect.name):
+                db.execute(consulta)
+            plazas = plazas_por_recurso(db.execute(consulta_ocupacion(fecha_hora, en_horario, cita_id)).all())
+            agenda = elegir_agenda(en_horario, plazas, preferido=recurso_anterior)
+            if agenda is None:
+                return None, mensaje_conflicto(obtener_sugerencia(fecha_hora, db, agendas))
+            if datos.fecha_hora is not None and db.execute(consulta_cita_mismo_dia(paciente_id, fecha_hora, cita_id)).first():
+                return None, "Ya tienes una cita programada para este día"
+            cita.recurso_id = agenda.recurso_id
+            cita.plaza = plaza_libre(agenda, plazas)
+        cita.motivo = motivo
+        cita.fecha_hora = fecha_hora
+        try:
+            db.commit()
+        except IntegrityError as e:
+            # Otra reserva simultánea tomó la plaza entre la verificación y el COMMIT
+            db.rollback()
+            if not es_conflicto_agenda(e):
+                raise
+            logger.info("Horario %s tomado por una reserva simultánea (intento %s)", fecha_hora, intento + 1)
+            continue
+        db.refresh(cita)
+        if reubicar:
+            indice_disponibilidad.quitar(fecha_anterior, recurso_anterior)
+            indice_disponibilidad.registrar(cita.fecha_hora, cita.recurso_id)
+        broker_citas.publicar("editada", [cita])
+        return cita, None
+
+    return None, "Ya existe una cita programada cerca de este horario"
 
 def obtener_citas_de_hoy(paciente_id, db: Session):
     hoy = datetime.now(timezone.utc).date()
-    citas = db.query(Cita).filter(
-        Cita.paciente_id == paciente_id,
-        Cita.fecha_hora >= datetime.combine(hoy, datetime.min.time(), tzinfo=timezone.utc),
-        Cita.fecha_hora <= datetime.combine(hoy, datetime.max.time(), tzinfo=timezone.utc),
-        Cita.estado.in_(["programada", "completada"])
-    ).all()
-    return citas
\ No newline at end of file
+    return db.query(Cita).filter(*condiciones_citas_de_hoy(paciente_id, hoy)).all()
+
+def obtener_citas_de_hoy_versionadas(paciente_id, versiones_conocidas, db: Session):
+    """Como obtener_citas_paciente_versionadas; la versión cambia también al cambiar de día"""
+    hoy = datetime.now(timezone.utc).date()
+    if versiones_conocidas:
+        total, ultima = db.execute(consulta_version(condiciones_citas_de_hoy(paciente_id, hoy))).one()
+        version = version_citas(paciente_id, total, ultima, hoy.isoformat())
+        if version in versiones_conocidas:
+            return version, None
+    citas = db.query(Cita).filter(*condiciones_citas_de_hoy(paciente_id, hoy)).all()
+    return version_de_filas(paciente_id, citas, hoy.isoformat()), citas
@@ -0,0 +1,265 @@
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timezone
+from app.models.cita import Cita, es_conflicto_agenda
+from app.models.user import User
+from app.services.cita_service import (
+    consulta_citas_paginadas, paginar_citas, consulta_exportacion,
+    consulta_conflictos_lote, consulta_recursos_lote, planificar_lote, insertar_lote, resultados_lote, citas_lote,
+    consulta_ocupacion, plazas_por_recurso, elegir_agenda, plaza_libre, consultas_bloqueo,
+    mensaje_fuera_de_horario, mensaje_conflicto, RESERVA_REINTENTOS, consulta_cita_mismo_dia, valores_edicion,
+    consulta_borrar_recordatorios, condiciones_citas_paciente, condiciones_citas_de_hoy, consulta_version, version_citas, version_de_filas
+)
+from app.services.disponibilidad_service import indice_disponibilidad
+from app.services.disponibilidad_service_async import obtener_sugerencia
+from app.services.recurso_service_async import resolver_agendas
+from app.utils.eventos import broker_citas, datos_cita
+from app.utils.logging_config import get_logger
+
+logger = get_logger("cita_service_async")
+
+# Versión async de cita_service: mismas reglas y mensajes, pero con AsyncSession
+
+async def crear_cita(motivo, fecha_hora, paciente_id, notas=None, db: AsyncSession = None, recurso_id=None):
+    try:
+        logger.info("Creando cita para paciente %s en %s", paciente_id, fecha_hora)
+
+        fecha_actual = datetime.now(timezone.utc)
+        if fecha_hora < fecha_actual:
+            logger.warning("Intento de agendar cita en el pasado: %s", fecha_hora)
+            return None, "No se puede agendar una cita en el pasado."
+
+        # Doctores o salas del servicio (o el recurso pedido); sin recursos, la agenda general
+        agendas, error = await resolver_agendas(motivo, recurso_id, db)
+        if error:
+            return None, error
+        en_horario = [agenda for agenda in agendas if agenda.atiende(fecha_hora)]
+        if not en_horario:
+            return None, mensaje_fuera_de_horario(recurso_id)
+
+        for intento in range(RESERVA_REINTENTOS + 1):
+            for consulta in consultas_bloqueo(fecha_hora, en_horario, db.get_bind().dialect.name):
+                await db.execute(consulta)
+
+            # Verificar conflictos de horario (30 minutos de diferencia) en la agenda de cada recurso
+            plazas = plazas_por_recurso((await db.execute(consulta_ocupacion(fecha_hora, en_horario))).all())
+            agenda = elegir_agenda(en_horario, plazas)
+
+            if agenda is None:
+                logger.warning("Conflicto de horario detectado: %s", fecha_hora)
+                return None, mensaje_conflicto(await obtener_sugerencia(fecha_hora, db, agendas))
+
+            # Verificar si el paciente ya tiene una cita en el mismo día
+            if (await db.execute(consulta_cita_mismo_dia(paciente_id, fecha_hora))).first():
+                logger.warning("Paciente %s ya tiene cita en el mismo día", paciente_id)
+                return None, "Ya tienes una cita programada para este día"
+
+            nueva_cita = Cita(
+                motivo=motivo,
+                fecha_hora=fecha_hora,
+                paciente_id=paciente_id,
+                recurso_id=agenda.recurso_id,
+                plaza=plaza_libre(agenda, plazas),
+                notas=notas,
+                estado="programada"
+            )
+
+            db.add(nueva_cita)
+            try:
+                await db.commit()
+            except IntegrityError as e:
+                # Otra reserva simultánea tomó el horario entre la verificación y el COMMIT
+                await db.rollback()
+                if not es_conflicto_agenda(e):
+                    raise
+                logger.info("Horario %s tomado por una reserva simultánea (intento %s)", fecha_hora, intento + 1)
+                continue
+            await db.refresh(nueva_cita)
+
+            indice_disponibilidad.registrar(nueva_cita.fecha_hora, nueva_cita.recurso_id)
+            broker_citas.publicar("creada", [nueva_cita])
+            logger.info("Cita creada exitosamente: ID %s para paciente %s", nueva_cita.id, paciente_id)
+            return nueva_cita, None
+
+        return None, "Ya existe una cita programada cerca de este horario"
+
+    except Exception as e:
+        logger.error("Error al crear cita para paciente %s: %s", paciente_id, e)
+        await db.rollback()
+        return None, f"Error interno del servidor: {str(e)}"
+
+async def crear_citas_lote(items, db: AsyncSession, verificar_pacientes=False):
+    try:
+        logger.info("Creando lote de %s citas", len(items))
+        pacientes_validos = None
+        if verificar_pacientes:
+            ids_pacientes = {paciente_id for _, _, paciente_id in items}
+            resultado = await db.execute(select(User.id).where(User.id.in_(ids_pacientes)))
+            pacientes_validos = set(resultado.scalars().all())
+
+        for intento in range(RESERVA_REINTENTOS + 1):
+            recursos = (await db.execute(consulta_recursos_lote(items))).scalars().all()
+            existentes = (await db.execute(consulta_conflictos_lote(items))).all()
+            aceptadas, errores = planificar_lote(items, existentes, pacientes_validos, recursos)
+
+            insertadas = []
+            if not aceptadas:
+                break
+            try:
+                insertadas = (await db.execute(*insertar_lote(aceptadas))).all()
+                await db.commit()
+                break
+            except IntegrityError as e:
+                # Una reserva simultánea ocupó algún horario del lote: se vuelve a planificar
+                await db.rollback()
+                if not es_conflicto_agenda(e) or intento == RESERVA_REINTENTOS:
+                    raise
+                logger.info("Lote en conflicto con una reserva simultánea (intento %s)", intento + 1)
+    except Exception as e:
+        logger.error("Error al crear lote de citas: %s", e)
+        await db.rollback()
+        return None, f"Error interno del servidor: {str(e)}"
+
+    for _, datos, _, recurso_id, _ in aceptadas:
+        indice_disponibilidad.registrar(datos.fecha_hora, recurso_id)
+    broker_citas.publicar("creada", citas_lote(aceptadas, insertadas))
+    logger.info("Lote procesado: %s creadas, %s rechazadas", len(aceptadas), len(errores))
+    return resultados_lote(items, aceptadas, insertadas, errores), None
+
+async def obtener_citas_paciente(paciente_id, db: AsyncSession, desde=None):
+    resultado = await db.execute(select(Cita).where(*condiciones_citas_paciente(paciente_id, desde)))
+    return resultado.scalars().all()
+
+async def obtener_citas_paciente_versionadas(paciente_id, versiones_conocidas, db: AsyncSession, desde=None):
+    variante = desde.isoformat() if desde else ""
+    if versiones_conocidas:
+        total, ultima = (await db.execute(consulta_version(condiciones_citas_paciente(paciente_id, desde)))).one()
+        version = version_citas(paciente_id, total, ultima, variante)
+        if version in versiones_conocidas:
+            return version, None
+    citas = await obtener_citas_paciente(paciente_id, db, desde)
+    return version_de_filas(paciente_id, citas, variante), citas
+
+async def obtener_todas_las_citas(db: AsyncSession):
+    resultado = await db.execute(select(Cita))
+    return resultado.scalars().all()
+
+async def obtener_citas_paginadas(db: AsyncSession, limite=50, cursor=None, **filtros):
+    consulta = consulta_citas_paginadas(limite, cursor, **filtros)
+    resultado = await db.execute(consulta)
+    return paginar_citas(resultado.scalars().all(), limite)
+
+async def exportar_citas(db: AsyncSession, tamaño_lote=1000, **filtros):
+    resultado = await db.stream(consulta_exportacion(tamaño_lote=tamaño_lote, **filtros))
+    return resultado.partitions()
+
+async def eliminar_cita(cita_id, db: AsyncSession):
+    cita = await db.get(Cita, cita_id)
+    if not cita:
+        return None, "Cita no encontrada"
+    fecha_programada = cita.fecha_hora if cita.estado == "programada" else None
+    recurso_id = cita.recurso_id
+    eliminada = datos_cita(cita)
+    await db.delete(cita)
+    await db.execute(consulta_borrar_recordatorios(cita_id))
+    await db.commit()
+    if fecha_programada is not None:
+        indice_disponibilidad.quitar(fecha_programada, recurso_id)
+    broker_citas.publicar("eliminada", [eliminada])
+    return cita, None
+
+async def eliminar_cita_paciente(cita_id, paciente_id, db: AsyncSession):
+    resultado = await db.execute(select(Cita).where(Cita.id == cita_id, Cita.paciente_id == paciente_id))
+    cita = resultado.scalars().first()
+    if not cita:
+        return None, "Cita no encontrada o no te pertenece"
+
+    # En lugar de eliminar, marcar como cancelada para liberar el horario
+    estaba_programada = cita.estado == "programada"
+    cita.estado = "cancelada"
+    cita.updated_at = datetime.now(timezone.utc)
+    await db.execute(consulta_borrar_recordatorios(cita_id, solo_pendientes=True))
+    await db.commit()
+    await db.refresh(cita)
+    if estaba_programada:
+        indice_disponibilidad.quitar(cita.fecha_hora, cita.recurso_id)
+    broker_citas.publicar("cancelada", [cita])
+
+    logger.info("Cita %s cancelada por paciente %s. Horario liberado.", cita_id, paciente_id)
+    return cita, None
+
+async def editar_cita(cita_id, datos, db: AsyncSession):
+    cita = await db.get(Cita, cita_id)
+    if not cita:
+        return None, "Cita no encontrada"
+    return await aplicar_edicion(cita, datos, db)
+
+async def editar_cita_paciente(cita_id, paciente_id, datos, db: AsyncSession):
+    resultado = await db.execute(select(Cita).where(Cita.id == cita_id, Cita.paciente_id == paciente_id))
+    cita = resultado.scalars().first()
+    if not cita:
+        return None, "Cita no encontrada o no te pertenece"
+    return await aplicar_edicion(cita, datos, db)
+
+async def aplicar_edicion(cita, datos, db: AsyncSession):
+    if datos.fecha_hora and datos.fecha_hora < datetime.now(timezone.utc):
+        return None, "No puedes poner una cita con fecha pasada."
+    cita_id, paciente_id = cita.id, cita.paciente_id
+    fecha_anterior, recurso_anterior = cita.fecha_hora, cita.recurso_id
+    motivo, fecha_hora, reubicar = valores_edicion(cita, datos)
+    if reubicar:
+        agendas, error = await resolver_agendas(motivo, None, db)
+        if error:
+            return None, error
+        en_horario = [agenda for agenda in agendas if agenda.atiende(fecha_hora)]
+        if not en_horario:
+            return None, mensaje_fuera_de_horario(None)
+
+    for intento in range(RESERVA_REINTENTOS + 1):
+        if reubicar:
+            for consulta in consultas_bloqueo(fecha_hora, en_horario, db.get_bind().dialect.name):
+                await db.execute(consulta)
+            plazas = plazas_por_recurso((await db.execute(consulta_ocupacion(fecha_hora, en_horario, cita_id))).all())
+            agenda = elegir_agenda(en_horario, plazas, preferido=recurso_anterior)
+            if agenda is None:
+                return None, mensaje_conflicto(await obtener_sugerencia(fecha_hora, db, agendas))
+            if datos.fecha_hora is not None and (await db.execute(consulta_cita_mismo_dia(paciente_id, fecha_hora, cita_id))).first():
+                return None, "Ya tienes una cita programada para este día"
+            cita.recurso_id = agenda.recurso_id
+            cita.plaza = plaza_libre(agenda, plazas)
+        cita.motivo = motivo
+        cita.fecha_hora = fecha_hora
+        try:
+            await db.commit()
+        except IntegrityError as e:
+            # Otra reserva simultánea tomó la plaza entre la verificación y el COMMIT
+            await db.rollback()
+            if not es_conflicto_agenda(e):
+                raise
+            logger.info("Horario %s tomado por una reserva simultánea (intento %s)", fecha_hora, intento + 1)
+            continue
+        await db.refresh(cita)
+        if reubicar:
+            indice_disponibilidad.quitar(fecha_anterior, recurso_anterior)
+            indice_disponibilidad.registrar(cita.fecha_hora, cita.recurso_id)
+        broker_citas.publicar("editada", [cita])
+        return cita, None
+
+    return None, "Ya existe una cita programada cerca de este horario"
+
+async def obtener_citas_de_hoy(paciente_id, db: AsyncSession):
+    hoy = datetime.now(timezone.utc).date()
+    resultado = await db.execute(select(Cita).where(*condiciones_citas_de_hoy(paciente_id, hoy)))
+    return resultado.scalars().all()
+
+async def obtener_citas_de_hoy_versionadas(paciente_id, versiones_conocidas, db: AsyncSession):
+    hoy = datetime.now(timezone.utc).date()
+    if versiones_conocidas:
+        total, ultima = (await db.execute(consulta_version(condiciones_citas_de_hoy(paciente_id, hoy)))).one()
+        version = version_citas(paciente_id, total, ultima, hoy.isoformat())
+        if version in versiones_conocidas:
+            return version, None
+    resultado = await db.execute(select(Cita).where(*condiciones_citas_de_hoy(paciente_id, hoy)))
+    citas = resultado.scalars().all()
+    return version_de_filas(paciente_id, citas, hoy.isoformat()), citas
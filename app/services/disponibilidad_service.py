@@ -0,0 +1,285 @@
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from datetime import date, datetime, time as dtime, timedelta, timezone
+from typing import Optional
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+from app.models.cita import Cita
+from app.utils.logging_config import get_logger
+
+logger = get_logger("disponibilidad_service")
+
+# Reglas de agenda (mismas que CitaCreate y la verificación de conflictos de crear_cita)
+HORA_APERTURA = dtime(8, 0)
+HORA_CIERRE = dtime(18, 0)
+DURACION_SLOT = timedelta(minutes=30)
+MARGEN_CONFLICTO = timedelta(minutes=30)
+HORIZONTE_DIAS = 60
+
+# Segundos que un día cargado se considera vigente (cambios hechos por otros workers)
+DISPONIBILIDAD_TTL = float(os.getenv("DISPONIBILIDAD_TTL", "60"))
+# Días de agenda (uno por recurso y día) que se mantienen en memoria como máximo
+DISPONIBILIDAD_MAX_CLAVES = int(os.getenv("DISPONIBILIDAD_MAX_CLAVES", "20000"))
+
+
+def normalizar(fecha_hora: datetime) -> datetime:
+    """Las fechas se guardan sin zona horaria, en UTC"""
+    if fecha_hora.tzinfo is not None:
+        return fecha_hora.astimezone(timezone.utc).replace(tzinfo=None)
+    return fecha_hora
+
+
+def slots_del_dia(dia: date) -> list[datetime]:
+    if dia.weekday() >= 5:
+        return []
+    slots = []
+    actual = datetime.combine(dia, HORA_APERTURA)
+    cierre = datetime.combine(dia, HORA_CIERRE)
+    while actual <= cierre:
+        slots.append(actual)
+        actual += DURACION_SLOT
+    return slots
+
+
+class Agenda:
+    """
+    Calendario sobre el que se comprueban los conflictos: el de un recurso
+    (doctor o sala) o, con recurso_id None, la agenda general del hospital,
+    donde van las citas sin recurso. Sin horario propio rige el de CitaCreate.
+    """
+    __slots__ = ("recurso_id", "capacidad", "hora_inicio", "hora_fin")
+
+    def __init__(self, recurso_id: Optional[int] = None, capacidad: int = 1,
+                 hora_inicio: Optional[dtime] = None, hora_fin: Optional[dtime] = None):
+        self.recurso_id = recurso_id
+        self.capacidad = capacidad
+        self.hora_inicio = hora_inicio
+        self.hora_fin = hora_fin
+
+    def atiende(self, fecha_hora: datetime) -> bool:
+        if self.hora_inicio is None:
+            return True
+        return self.hora_inicio <= normalizar(fecha_hora).time() <= self.hora_fin
+
+
+AGENDA_GENERAL = Agenda()
+
+
+class DiaAgenda:
+    """
+    Citas programadas de un recurso en un día (lista ordenada) y, por cada
+    horario y capacidad de agenda consultados, la lista ordenada de sus slots
+    libres. Esa lista se calcula una vez y se descarta al registrar o quitar
+    una cita: un día lleno se descarta sin mirar sus slots y el primer hueco
+    desde una hora sale de un solo bisect.
+    """
+    __slots__ = ("expira", "horas", "_libres")
+
+    def __init__(self, expira: float, horas: list[datetime]):
+        self.expira = expira
+        self.horas = horas
+        self._libres: dict = {}
+
+    def registrar(self, fecha_hora: datetime):
+        insort(self.horas, fecha_hora)
+        self._libres.clear()
+
+    def quitar(self, fecha_hora: datetime):
+        i = bisect_left(self.horas, fecha_hora)
+        if i < len(self.horas) and self.horas[i] == fecha_hora:
+            self.horas.pop(i)
+            self._libres.clear()
+
+    def ocupacion(self, fecha_hora: datetime) -> int:
+        return bisect_right(self.horas, fecha_hora + MARGEN_CONFLICTO) - bisect_left(self.horas, fecha_hora - MARGEN_CONFLICTO)
+
+    def libres(self, dia: date, agenda: Agenda) -> list[datetime]:
+        firma = (agenda.capacidad, agenda.hora_inicio, agenda.hora_fin)
+        libres = self._libres.get(firma)
+        if libres is None:
+            libres = [
+                slot for slot in slots_del_dia(dia)
+                if agenda.atiende(slot) and self.ocupacion(slot) < agenda.capacidad
+            ]
+            self._libres[firma] = libres
+        return libres
+
+
+class IndiceDisponibilidad:
+    """
+    Índice en memoria de las citas programadas, un DiaAgenda por recurso y
+    día (recurso None = agenda general).
+
+    Responde conflictos en O(log n) con bisect. Los días se cargan desde la base
+    de datos bajo demanda y se mantienen al día con registrar/quitar en cada
+    alta, edición o cancelación de este proceso; tras DISPONIBILIDAD_TTL se
+    recargan para incorporar cambios de otros workers.
+    """
+    def __init__(self, ttl: float = DISPONIBILIDAD_TTL, max_claves: int = DISPONIBILIDAD_MAX_CLAVES):
+        self.ttl = ttl
+        self.max_claves = max_claves
+        self._dias: "OrderedDict[tuple[Optional[int], date], DiaAgenda]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def claves_faltantes(self, claves) -> list[tuple[Optional[int], date]]:
+        """De las claves (recurso_id, día) indicadas, las que no están cargadas o han caducado"""
+        ahora = time.monotonic()
+        with self._lock:
+            return [c for c in claves if c not in self._dias or self._dias[c].expira < ahora]
+
+    def caducar(self, claves):
+        """Fuerza a recargar las claves indicadas en la próxima búsqueda"""
+        with self._lock:
+            for clave in claves:
+                entrada = self._dias.get(clave)
+                if entrada is not None:
+                    entrada.expira = 0
+
+    def cargar(self, claves, filas):
+        """Reemplaza el contenido de las claves indicadas con las filas (recurso_id, fecha_hora) leídas de la base de datos"""
+        por_clave = {c: [] for c in claves}
+        for recurso_id, fecha in filas:
+            fecha = normalizar(fecha)
+            clave = (recurso_id, fecha.date())
+            if clave in por_clave:
+                por_clave[clave].append(fecha)
+        expira = time.monotonic() + self.ttl
+        with self._lock:
+            for clave, horas in por_clave.items():
+                self._dias[clave] = DiaAgenda(expira, sorted(horas))
+                self._dias.move_to_end(clave)
+            # Nunca se descartan las claves recién cargadas: la búsqueda en curso las necesita
+            while len(self._dias) > max(self.max_claves, len(por_clave)):
+                self._dias.popitem(last=False)
+
+    def registrar(self, fecha_hora: datetime, recurso_id: Optional[int] = None):
+        fecha_hora = normalizar(fecha_hora)
+        with self._lock:
+            entrada = self._dias.get((recurso_id, fecha_hora.date()))
+            if entrada is not None:
+                entrada.registrar(fecha_hora)
+
+    def quitar(self, fecha_hora: datetime, recurso_id: Optional[int] = None):
+        fecha_hora = normalizar(fecha_hora)
+        with self._lock:
+            entrada = self._dias.get((recurso_id, fecha_hora.date()))
+            if entrada is not None:
+                entrada.quitar(fecha_hora)
+
+    def ocupacion(self, fecha_hora: datetime, recurso_id: Optional[int] = None) -> int:
+        """Citas programadas del recurso a menos de MARGEN_CONFLICTO de fecha_hora"""
+        fecha_hora = normalizar(fecha_hora)
+        with self._lock:
+            entrada = self._dias.get((recurso_id, fecha_hora.date()))
+            return entrada.ocupacion(fecha_hora) if entrada else 0
+
+    def hay_conflicto(self, fecha_hora: datetime, agenda: Agenda = AGENDA_GENERAL) -> bool:
+        return not agenda.atiende(fecha_hora) or self.ocupacion(fecha_hora, agenda.recurso_id) >= agenda.capacidad
+
+    def _libres(self, dia: date, agenda: Agenda) -> list[datetime]:
+        """Con el lock tomado; un día sin cargar se trata como vacío"""
+        entrada = self._dias.get((agenda.recurso_id, dia)) or DiaAgenda(0, [])
+        return entrada.libres(dia, agenda)
+
+    def slots_libres(self, dia: date, desde: Optional[datetime] = None, agendas=(AGENDA_GENERAL,)) -> list[datetime]:
+        """Slots en los que al menos una de las agendas tiene hueco"""
+        desde = normalizar(desde) if desde else None
+        with self._lock:
+            libres = sorted(set().union(*(self._libres(dia, agenda) for agenda in agendas)))
+        return libres[bisect_left(libres, desde):] if desde else libres
+
+    def primer_libre(self, dia: date, desde: Optional[datetime] = None, agendas=(AGENDA_GENERAL,)) -> Optional[datetime]:
+        """Primer slot del día desde `desde` en el que alguna agenda tiene hueco: un bisect por agenda"""
+        desde = normalizar(desde) if desde else None
+        primero = None
+        with self._lock:
+            for agenda in agendas:
+                libres = self._libres(dia, agenda)
+                i = bisect_left(libres, desde) if desde else 0
+                if i < len(libres) and (primero is None or libres[i] < primero):
+                    primero = libres[i]
+        return primero
+
+    def limpiar(self):
+        with self._lock:
+            self._dias.clear()
+
+
+# Instancia global del índice de disponibilidad
+indice_disponibilidad = IndiceDisponibilidad()
+
+
+def condicion_recursos(recursos):
+    """WHERE sobre recurso_id para un conjunto de recursos; None es la agenda general"""
+    ids = [r for r in recursos if r is not None]
+    condiciones = []
+    if ids:
+        condiciones.append(Cita.recurso_id.in_(ids))
+    if None in recursos:
+        condiciones.append(Cita.recurso_id.is_(None))
+    return or_(*condiciones)
+
+def consulta_programadas(claves):
+    dias = [dia for _, dia in claves]
+    inicio = datetime.combine(min(dias), dtime.min)
+    fin = datetime.combine(max(dias), dtime.max)
+    return select(Cita.recurso_id, Cita.fecha_hora).where(
+        Cita.estado == "programada",
+        Cita.fecha_hora >= inicio,
+        Cita.fecha_hora <= fin,
+        condicion_recursos({recurso_id for recurso_id, _ in claves})
+    )
+
+def claves_agendas(dias, agendas) -> list[tuple[Optional[int], date]]:
+    return [(agenda.recurso_id, dia) for agenda in agendas for dia in dias]
+
+def dias_busqueda(desde: datetime, horizonte: int = HORIZONTE_DIAS) -> list[date]:
+    return [desde.date() + timedelta(days=i) for i in range(horizonte)]
+
+def inicio_busqueda(despues_de: Optional[datetime]) -> datetime:
+    ahora = normalizar(datetime.now(timezone.utc))
+    return max(normalizar(despues_de), ahora) if despues_de else ahora
+
+def primer_slot_libre(desde: datetime, dias, agendas=(AGENDA_GENERAL,)) -> Optional[datetime]:
+    for dia in dias:
+        primero = indice_disponibilidad.primer_libre(dia, desde, agendas)
+        if primero is not None:
+            return primero
+    return None
+
+def a_utc(fecha_hora: Optional[datetime]) -> Optional[datetime]:
+    return fecha_hora.replace(tzinfo=timezone.utc) if fecha_hora else None
+
+
+def _asegurar_dias(dias, db: Session, agendas=(AGENDA_GENERAL,)):
+    faltantes = indice_disponibilidad.claves_faltantes(claves_agendas(dias, agendas))
+    if faltantes:
+        filas = db.execute(consulta_programadas(faltantes)).all()
+        indice_disponibilidad.cargar(faltantes, filas)
+
+def obtener_slots_libres(dia: date, db: Session, agendas=(AGENDA_GENERAL,)):
+    _asegurar_dias([dia], db, agendas)
+    desde = normalizar(datetime.now(timezone.utc))
+    return [a_utc(slot) for slot in indice_disponibilidad.slots_libres(dia, desde, agendas)]
+
+def obtener_siguiente_libre(despues_de: Optional[datetime], db: Session, agendas=(AGENDA_GENERAL,)):
+    desde = inicio_busqueda(despues_de)
+    dias = dias_busqueda(desde)
+    _asegurar_dias(dias, db, agendas)
+    return a_utc(primer_slot_libre(desde, dias, agendas))
+
+def inicio_sugerencia(rechazada: datetime, agendas) -> datetime:
+    """
+    Tras un conflicto visto en la base de datos el día de `rechazada` puede estar
+    desactualizado en el índice (citas de otros workers): se caduca para
+    recargarlo y la búsqueda empieza en el slot siguiente al rechazado.
+    """
+    indice_disponibilidad.caducar(claves_agendas([normalizar(rechazada).date()], agendas))
+    return rechazada + DURACION_SLOT
+
+def obtener_sugerencia(rechazada: datetime, db: Session, agendas=(AGENDA_GENERAL,)):
+    """Siguiente horario libre estrictamente posterior a uno rechazado por conflicto"""
+    return obtener_siguiente_libre(inicio_sugerencia(rechazada, agendas), db, agendas)
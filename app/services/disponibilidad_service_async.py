@@ -0,0 +1,29 @@
+from datetime import date, datetime, timezone
+from typing import Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.services.disponibilidad_service import (
+    indice_disponibilidad, consulta_programadas, claves_agendas, dias_busqueda, inicio_busqueda,
+    primer_slot_libre, inicio_sugerencia, normalizar, a_utc, AGENDA_GENERAL
+)
+
+# Versión async de disponibilidad_service: comparte el mismo índice en memoria
+
+async def _asegurar_dias(dias, db: AsyncSession, agendas=(AGENDA_GENERAL,)):
+    faltantes = indice_disponibilidad.claves_faltantes(claves_agendas(dias, agendas))
+    if faltantes:
+        resultado = await db.execute(consulta_programadas(faltantes))
+        indice_disponibilidad.cargar(faltantes, resultado.all())
+
+async def obtener_slots_libres(dia: date, db: AsyncSession, agendas=(AGENDA_GENERAL,)):
+    await _asegurar_dias([dia], db, agendas)
+    desde = normalizar(datetime.now(timezone.utc))
+    return [a_utc(slot) for slot in indice_disponibilidad.slots_libres(dia, desde, agendas)]
+
+async def obtener_siguiente_libre(despues_de: Optional[datetime], db: AsyncSession, agendas=(AGENDA_GENERAL,)):
+    desde = inicio_busqueda(despues_de)
+    dias = dias_busqueda(desde)
+    await _asegurar_dias(dias, db, agendas)
+    return a_utc(primer_slot_libre(desde, dias, agendas))
+
+async def obtener_sugerencia(rechazada: datetime, db: AsyncSession, agendas=(AGENDA_GENERAL,)):
+    return await obtener_siguiente_libre(inicio_sugerencia(rechazada, agendas), db, agendas)
@@ -0,0 +1,94 @@
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.models.recurso import Recurso
+from app.services.disponibilidad_service import Agenda, AGENDA_GENERAL
+from app.utils.logging_config import get_logger
+
+logger = get_logger("recurso_service")
+
+SOLO_LECTURA = frozenset({"obtener_recursos"})
+
+def valor_motivo(motivo):
+    return getattr(motivo, "value", motivo)
+
+def agenda_de(recurso) -> Agenda:
+    return Agenda(recurso.id, recurso.capacidad, recurso.hora_inicio, recurso.hora_fin)
+
+def consulta_recursos(motivo=None, recurso_id=None, solo_activos=True):
+    """Recursos de un servicio (índice motivo, activo) o un recurso concreto, en orden de id"""
+    consulta = select(Recurso)
+    if recurso_id is not None:
+        consulta = consulta.where(Recurso.id == recurso_id)
+    elif motivo is not None:
+        consulta = consulta.where(Recurso.motivo == valor_motivo(motivo))
+    if solo_activos:
+        consulta = consulta.where(Recurso.activo.is_(True))
+    return consulta.order_by(Recurso.id)
+
+def agendas_de_recursos(recursos, motivo, recurso_id):
+    """
+    Agendas en las que se puede agendar una cita del servicio `motivo`.
+
+    Con recurso_id solo la de ese recurso; si no, las de todos los recursos
+    activos del servicio. Un servicio sin recursos usa la agenda general.
+    """
+    if recurso_id is not None:
+        if not recursos:
+            return None, "Recurso no encontrado o inactivo"
+        if motivo is not None and recursos[0].motivo != valor_motivo(motivo):
+            return None, "El recurso no atiende este servicio"
+        return [agenda_de(recursos[0])], None
+    return [agenda_de(r) for r in recursos] or [AGENDA_GENERAL], None
+
+def resolver_agendas(motivo, recurso_id, db: Session):
+    if motivo is None and recurso_id is None:
+        return [AGENDA_GENERAL], None
+    recursos = db.execute(consulta_recursos(motivo, recurso_id)).scalars().all()
+    return agendas_de_recursos(recursos, motivo, recurso_id)
+
+def crear_recurso(datos, db: Session):
+    try:
+        recurso = Recurso(
+            nombre=datos.nombre,
+            tipo=datos.tipo.value,
+            motivo=datos.motivo.value,
+            capacidad=datos.capacidad,
+            hora_inicio=datos.hora_inicio,
+            hora_fin=datos.hora_fin,
+            activo=True
+        )
+        db.add(recurso)
+        db.commit()
+        db.refresh(recurso)
+        logger.info("Recurso creado: ID %s (%s, %s)", recurso.id, recurso.tipo, recurso.motivo)
+        return recurso, None
+    except Exception as e:
+        logger.error("Error al crear recurso %s: %s", datos.nombre, e)
+        db.rollback()
+        return None, f"Error interno del servidor: {str(e)}"
+
+def obtener_recursos(db: Session, motivo=None, solo_activos=False):
+    return db.execute(consulta_recursos(motivo, solo_activos=solo_activos)).scalars().all()
+
+def aplicar_cambios(recurso, datos):
+    """Copia los campos enviados y comprueba el horario resultante"""
+    cambios = datos.model_dump(exclude_unset=True)
+    hora_inicio = cambios.get("hora_inicio", recurso.hora_inicio)
+    hora_fin = cambios.get("hora_fin", recurso.hora_fin)
+    if hora_inicio >= hora_fin:
+        return "La hora de inicio debe ser anterior a la hora de fin"
+    for campo, valor in cambios.items():
+        setattr(recurso, campo, valor)
+    return None
+
+def editar_recurso(recurso_id, datos, db: Session):
+    recurso = db.get(Recurso, recurso_id)
+    if not recurso:
+        return None, "Recurso no encontrado"
+    error = aplicar_cambios(recurso, datos)
+    if error:
+        return None, error
+    db.commit()
+    db.refresh(recurso)
+    logger.info("Recurso %s actualizado", recurso_id)
+    return recurso, None
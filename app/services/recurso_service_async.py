@@ -0,0 +1,52 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.recurso import Recurso
+from app.services.recurso_service import consulta_recursos, agendas_de_recursos, aplicar_cambios
+from app.services.disponibilidad_service import AGENDA_GENERAL
+from app.utils.logging_config import get_logger
+
+logger = get_logger("recurso_service_async")
+
+# Versión async de recurso_service: mismas reglas y mensajes, pero con AsyncSession
+
+async def resolver_agendas(motivo, recurso_id, db: AsyncSession):
+    if motivo is None and recurso_id is None:
+        return [AGENDA_GENERAL], None
+    recursos = (await db.execute(consulta_recursos(motivo, recurso_id))).scalars().all()
+    return agendas_de_recursos(recursos, motivo, recurso_id)
+
+async def crear_recurso(datos, db: AsyncSession):
+    try:
+        recurso = Recurso(
+            nombre=datos.nombre,
+            tipo=datos.tipo.value,
+            motivo=datos.motivo.value,
+            capacidad=datos.capacidad,
+            hora_inicio=datos.hora_inicio,
+            hora_fin=datos.hora_fin,
+            activo=True
+        )
+        db.add(recurso)
+        await db.commit()
+        await db.refresh(recurso)
+        logger.info("Recurso creado: ID %s (%s, %s)", recurso.id, recurso.tipo, recurso.motivo)
+        return recurso, None
+    except Exception as e:
+        logger.error("Error al crear recurso %s: %s", datos.nombre, e)
+        await db.rollback()
+        return None, f"Error interno del servidor: {str(e)}"
+
+async def obtener_recursos(db: AsyncSession, motivo=None, solo_activos=False):
+    resultado = await db.execute(consulta_recursos(motivo, solo_activos=solo_activos))
+    return resultado.scalars().all()
+
+async def editar_recurso(recurso_id, datos, db: AsyncSession):
+    recurso = await db.get(Recurso, recurso_id)
+    if not recurso:
+        return None, "Recurso no encontrado"
+    error = aplicar_cambios(recurso, datos)
+    if error:
+        return None, error
+    await db.commit()
+    await db.refresh(recurso)
+    logger.info("Recurso %s actualizado", recurso_id)
+    return recurso, None
@@ -1,12 +1,16 @@
+from pydantic import ValidationError
+from sqlalchemy import insert, or_, select
 from sqlalchemy.orm import Session
 from app.models.user import User
+from app.schemas.user import UserCreate
+from app.utils.hasher import HasherSaturadoError
 from app.utils.logging_config import get_logger
 
 logger = get_logger("user_service")
 
 def registrar_usuario(datos, db: Session, obtener_hash_contraseña):
     try:
-        logger.info(f"Intentando registrar usuario: {datos.username}")
+        logger.info("Intentando registrar usuario: %s", datos.username)
         
         # Verificar si el usuario ya existe
         usuario_existente = db.query(User).filter(
@@ -15,14 +19,14 @@ def registrar_usuario(datos, db: Session, obtener_hash_contraseña):
         
         if usuario_existente:
             if usuario_existente.username == datos.username:
-                logger.warning(f"Intento de registro con username existente: {datos.username}")
+                logger.warning("Intento de registro con username existente: %s", datos.username)
                 return None, "El nombre de usuario ya existe"
             else:
-                logger.warning(f"Intento de registro con email existente: {datos.email}")
+                logger.warning("Intento de registro con email existente: %s", datos.email)
                 return None, "El email ya está registrado"
         
         if datos.role not in ["paciente", "doctor", "admin"]:
-            logger.warning(f"Intento de registro con rol inválido: {datos.role}")
+            logger.warning("Intento de registro con rol inválido: %s", datos.role)
             return None, "Solo se permite el registro como paciente, doctor o admin."
         
         nuevo_usuario = User(
@@ -37,45 +41,64 @@ def registrar_usuario(datos, db: Session, obtener_hash_contraseña):
         db.commit()
         db.refresh(nuevo_usuario)
         
-        logger.info(f"Usuario registrado exitosamente: {datos.username} (ID: {nuevo_usuario.id})")
+        logger.info("Usuario registrado exitosamente: %s (ID: %s)", datos.username, nuevo_usuario.id)
         return nuevo_usuario, None
         
+    except HasherSaturadoError:
+        raise
     except Exception as e:
-        logger.error(f"Error al registrar usuario {datos.username}: {str(e)}")
+        logger.error("Error al registrar usuario %s: %s", datos.username, e)
         db.rollback()
         return None, f"Error interno del servidor: {str(e)}"
 
 def autenticar_usuario(username, password, db: Session, verificar_contraseña):
     try:
-        logger.info(f"Intento de autenticación para usuario: {username}")
+        logger.info("Intento de autenticación para usuario: %s", username)
         
         # Permitir login por username o por email
         usuario = db.query(User).filter((User.username == username) | (User.email == username)).first()
         if not usuario:
-            logger.warning(f"Intento de login con usuario inexistente: {username}")
+            logger.warning("Intento de login con usuario inexistente: %s", username)
             return None, "Nombre de usuario o contraseña incorrectos"
         
         if not verificar_contraseña(password, usuario.hashed_password):
-            logger.warning(f"Contraseña incorrecta para usuario: {username}")
+            logger.warning("Contraseña incorrecta para usuario: %s", username)
             return None, "Nombre de usuario o contraseña incorrectos"
         
         if not usuario.is_active:
-            logger.warning(f"Intento de login con usuario inactivo: {username}")
+            logger.warning("Intento de login con usuario inactivo: %s", username)
             return None, "Usuario inactivo"
         
-        logger.info(f"Autenticación exitosa para usuario: {username}")
+        logger.info("Autenticación exitosa para usuario: %s", username)
         return usuario, None
         
+    except HasherSaturadoError:
+        raise
     except Exception as e:
-        logger.error(f"Error al autenticar usuario {username}: {str(e)}")
+        logger.error("Error al autenticar usuario %s: %s", username, e)
         return None, "Error interno del servidor"
 
+def obtener_usuario_por_username(username, db: Session):
+    return db.query(User).filter(User.username == username).first()
+
+def usuario_duplicado(usuario_existente, datos):
+    """Mensaje de error si ya hay un usuario con ese username o email"""
+    if usuario_existente is None:
+        return None
+    if usuario_existente.username == datos.username:
+        return "El nombre de usuario ya existe"
+    return "El email ya está registrado"
+
 def crear_usuario_por_admin(datos, db: Session, obtener_hash_contraseña):
-    usuario_existente = db.query(User).filter(User.username == datos.username).first()
-    if usuario_existente:
-        return None, "El nombre de usuario ya existe"
+    usuario_existente = db.query(User).filter(
+        (User.username == datos.username) | (User.email == datos.email)
+    ).first()
+    error = usuario_duplicado(usuario_existente, datos)
+    if error:
+        return None, error
     nuevo_usuario = User(
         username=datos.username,
+        email=datos.email,
         full_name=datos.full_name,
         role=datos.role,
         hashed_password=obtener_hash_contraseña(datos.password)
@@ -86,13 +109,17 @@ def crear_usuario_por_admin(datos, db: Session, obtener_hash_contraseña):
     return nuevo_usuario, None
 
 def crear_usuario_admin(datos, db: Session, obtener_hash_contraseña):
-    usuario_existente = db.query(User).filter(User.username == datos.username).first()
-    if usuario_existente:
-        return None, "El nombre de usuario ya existe"
+    usuario_existente = db.query(User).filter(
+        (User.username == datos.username) | (User.email == datos.email)
+    ).first()
+    error = usuario_duplicado(usuario_existente, datos)
+    if error:
+        return None, error
     if datos.role != "admin":
         return None, "Solo se puede crear usuarios con rol admin en esta ruta."
     nuevo_usuario = User(
         username=datos.username,
+        email=datos.email,
         full_name=datos.full_name,
         role="admin",
         hashed_password=obtener_hash_contraseña(datos.password)
@@ -100,4 +127,99 @@ def crear_usuario_admin(datos, db: Session, obtener_hash_contraseña):
     db.add(nuevo_usuario)
     db.commit()
     db.refresh(nuevo_usuario)
-    return nuevo_usuario, None
\ No newline at end of file
+    return nuevo_usuario, None
+
+# Importación masiva: validación, duplicados en una sola consulta e inserción por trozos
+
+def _mensaje_validacion(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(c) for c in e['loc'])}: {e['msg']}" if e["loc"] else e["msg"]
+        for e in error.errors()
+    )
+
+def validar_importacion(filas):
+    """Devuelve ([(fila, UserCreate)], errores); detecta duplicados dentro del propio archivo"""
+    validos, errores = [], []
+    usernames, emails = set(), set()
+    for numero, fila in enumerate(filas, start=1):
+        try:
+            datos = UserCreate.model_validate(fila)
+        except ValidationError as e:
+            errores.append({"fila": numero, "username": fila.get("username"), "error": _mensaje_validacion(e)})
+            continue
+        if datos.username in usernames:
+            errores.append({"fila": numero, "username": datos.username, "error": "Nombre de usuario repetido en el archivo"})
+            continue
+        if datos.email in emails:
+            errores.append({"fila": numero, "username": datos.username, "error": "Email repetido en el archivo"})
+            continue
+        usernames.add(datos.username)
+        emails.add(datos.email)
+        validos.append((numero, datos))
+    return validos, errores
+
+def consulta_duplicados(validos):
+    return select(User.username, User.email).where(or_(
+        User.username.in_([datos.username for _, datos in validos]),
+        User.email.in_([datos.email for _, datos in validos])
+    ))
+
+def filtrar_existentes(validos, existentes, errores):
+    usernames = {username for username, _ in existentes}
+    emails = {email for _, email in existentes}
+    nuevos = []
+    for numero, datos in validos:
+        if datos.username in usernames:
+            errores.append({"fila": numero, "username": datos.username, "error": "El nombre de usuario ya existe"})
+        elif datos.email in emails:
+            errores.append({"fila": numero, "username": datos.username, "error": "El email ya está registrado"})
+        else:
+            nuevos.append((numero, datos))
+    return nuevos
+
+def filas_importacion(nuevos, hashes):
+    return [
+        {"username": datos.username, "email": datos.email, "full_name": datos.full_name,
+         "hashed_password": hash_, "role": datos.role, "is_active": True}
+        for (_, datos), hash_ in zip(nuevos, hashes)
+    ]
+
+def trozos(lista, tamaño):
+    for i in range(0, len(lista), tamaño):
+        yield lista[i:i + tamaño]
+
+def reporte_importacion(total, creados, errores):
+    return {
+        "total": total,
+        "creados": creados,
+        "rechazados": len(errores),
+        "errores": sorted(errores, key=lambda e: e["fila"]),
+    }
+
+def importar_usuarios(filas, db: Session, obtener_hashes_contraseñas, tamaño_trozo=500):
+    """
+    Crea usuarios en bloque: valida cada fila con UserCreate, comprueba los
+    duplicados contra la base de datos en una sola consulta, hashea todas las
+    contraseñas en paralelo e inserta por trozos en una única transacción.
+    """
+    validos, errores = validar_importacion(filas)
+    nuevos = []
+    try:
+        logger.info("Importando %s usuarios (%s válidos)", len(filas), len(validos))
+        if validos:
+            existentes = db.execute(consulta_duplicados(validos)).all()
+            nuevos = filtrar_existentes(validos, existentes, errores)
+        if nuevos:
+            hashes = obtener_hashes_contraseñas([datos.password for _, datos in nuevos])
+            for trozo in trozos(filas_importacion(nuevos, hashes), tamaño_trozo):
+                db.execute(insert(User), trozo)
+            db.commit()
+    except HasherSaturadoError:
+        raise
+    except Exception as e:
+        logger.error("Error al importar usuarios: %s", e)
+        db.rollback()
+        return None, f"Error interno del servidor: {str(e)}"
+
+    logger.info("Importación terminada: %s creados, %s rechazados", len(nuevos), len(errores))
+    return reporte_importacion(len(filas), len(nuevos), errores), None
@@ -0,0 +1,156 @@
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from app.models.user import User
+from app.services.user_service import (
+    usuario_duplicado,
+    validar_importacion, consulta_duplicados, filtrar_existentes, filas_importacion, trozos, reporte_importacion
+)
+from app.utils.hasher import HasherSaturadoError
+from app.utils.logging_config import get_logger
+
+logger = get_logger("user_service_async")
+
+# Versión async de user_service. El hashing de bcrypt se delega al pool de
+# procesos del hasher; aquí solo se espera su resultado fuera del event loop.
+
+async def registrar_usuario(datos, db: AsyncSession, obtener_hash_contraseña):
+    try:
+        logger.info("Intentando registrar usuario: %s", datos.username)
+
+        # Verificar si el usuario ya existe
+        resultado = await db.execute(select(User).where(
+            (User.username == datos.username) | (User.email == datos.email)
+        ).limit(1))
+        usuario_existente = resultado.scalars().first()
+
+        if usuario_existente:
+            if usuario_existente.username == datos.username:
+                logger.warning("Intento de registro con username existente: %s", datos.username)
+                return None, "El nombre de usuario ya existe"
+            else:
+                logger.warning("Intento de registro con email existente: %s", datos.email)
+                return None, "El email ya está registrado"
+
+        if datos.role not in ["paciente", "doctor", "admin"]:
+            logger.warning("Intento de registro con rol inválido: %s", datos.role)
+            return None, "Solo se permite el registro como paciente, doctor o admin."
+
+        nuevo_usuario = User(
+            username=datos.username,
+            email=datos.email,
+            full_name=datos.full_name,
+            hashed_password=await run_in_threadpool(obtener_hash_contraseña, datos.password),
+            role=datos.role
+        )
+
+        db.add(nuevo_usuario)
+        await db.commit()
+        await db.refresh(nuevo_usuario)
+
+        logger.info("Usuario registrado exitosamente: %s (ID: %s)", datos.username, nuevo_usuario.id)
+        return nuevo_usuario, None
+
+    except HasherSaturadoError:
+        raise
+    except Exception as e:
+        logger.error("Error al registrar usuario %s: %s", datos.username, e)
+        await db.rollback()
+        return None, f"Error interno del servidor: {str(e)}"
+
+async def autenticar_usuario(username, password, db: AsyncSession, verificar_contraseña):
+    try:
+        logger.info("Intento de autenticación para usuario: %s", username)
+
+        # Permitir login por username o por email
+        resultado = await db.execute(select(User).where(
+            (User.username == username) | (User.email == username)
+        ).limit(1))
+        usuario = resultado.scalars().first()
+        if not usuario:
+            logger.warning("Intento de login con usuario inexistente: %s", username)
+            return None, "Nombre de usuario o contraseña incorrectos"
+
+        if not await run_in_threadpool(verificar_contraseña, password, usuario.hashed_password):
+            logger.warning("Contraseña incorrecta para usuario: %s", username)
+            return None, "Nombre de usuario o contraseña incorrectos"
+
+        if not usuario.is_active:
+            logger.warning("Intento de login con usuario inactivo: %s", username)
+            return None, "Usuario inactivo"
+
+        logger.info("Autenticación exitosa para usuario: %s", username)
+        return usuario, None
+
+    except HasherSaturadoError:
+        raise
+    except Exception as e:
+        logger.error("Error al autenticar usuario %s: %s", username, e)
+        return None, "Error interno del servidor"
+
+async def obtener_usuario_por_username(username, db: AsyncSession):
+    resultado = await db.execute(select(User).where(User.username == username).limit(1))
+    return resultado.scalars().first()
+
+async def crear_usuario_por_admin(datos, db: AsyncSession, obtener_hash_contraseña):
+    resultado = await db.execute(select(User).where(
+        (User.username == datos.username) | (User.email == datos.email)
+    ).limit(1))
+    error = usuario_duplicado(resultado.scalars().first(), datos)
+    if error:
+        return None, error
+    nuevo_usuario = User(
+        username=datos.username,
+        email=datos.email,
+        full_name=datos.full_name,
+        role=datos.role,
+        hashed_password=await run_in_threadpool(obtener_hash_contraseña, datos.password)
+    )
+    db.add(nuevo_usuario)
+    await db.commit()
+    await db.refresh(nuevo_usuario)
+    return nuevo_usuario, None
+
+async def crear_usuario_admin(datos, db: AsyncSession, obtener_hash_contraseña):
+    resultado = await db.execute(select(User).where(
+        (User.username == datos.username) | (User.email == datos.email)
+    ).limit(1))
+    error = usuario_duplicado(resultado.scalars().first(), datos)
+    if error:
+        return None, error
+    if datos.role != "admin":
+        return None, "Solo se puede crear usuarios con rol admin en esta ruta."
+    nuevo_usuario = User(
+        username=datos.username,
+        email=datos.email,
+        full_name=datos.full_name,
+        role="admin",
+        hashed_password=await run_in_threadpool(obtener_hash_contraseña, datos.password)
+    )
+    db.add(nuevo_usuario)
+    await db.commit()
+    await db.refresh(nuevo_usuario)
+    return nuevo_usuario, None
+
+async def importar_usuarios(filas, db: AsyncSession, obtener_hashes_contraseñas, tamaño_trozo=500):
+    validos, errores = validar_importacion(filas)
+    nuevos = []
+    try:
+        logger.info("Importando %s usuarios (%s válidos)", len(filas), len(validos))
+        if validos:
+            existentes = (await db.execute(consulta_duplicados(validos))).all()
+            nuevos = filtrar_existentes(validos, existentes, errores)
+        if nuevos:
+            hashes = await run_in_threadpool(obtener_hashes_contraseñas, [datos.password for _, datos in nuevos])
+            for trozo in trozos(filas_importacion(nuevos, hashes), tamaño_trozo):
+                await db.execute(insert(User), trozo)
+            await db.commit()
+    except HasherSaturadoError:
+        raise
+    except Exception as e:
+        logger.error("Error al importar usuarios: %s", e)
+        await db.rollback()
+        return None, f"Error interno del servidor: {str(e)}"
+
+    logger.info("Importación terminada: %s creados, %s rechazados", len(nuevos), len(errores))
+    return reporte_importacion(len(filas), len(nuevos), errores), None
@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from app.models.user import User
+from app.schemas.user import UserOut
+from app.utils.logging_config import get_logger
+
+logger = get_logger("cache_principal")
+
+# TTL en segundos (0 desactiva la caché) y número máximo de usuarios en memoria. Cada
+# worker tiene su propia caché: el TTL es la demora máxima con que un worker ve un
+# cambio de acceso aplicado en otro
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "5"))
+PRINCIPAL_CACHE_MAX = int(os.getenv("PRINCIPAL_CACHE_MAX", "10000"))
+
+
+class PrincipalCache:
+    """
+    Caché TTL + LRU del usuario autenticado, indexada por el `sub` del token.
+
+    Guarda un UserOut (no la instancia ORM) para poder compartirlo entre
+    sesiones. Las entradas se invalidan al confirmarse (commit) un cambio de
+    rol, estado activo o username en este proceso; entre workers la demora
+    máxima es el TTL.
+    """
+    def __init__(self, ttl: float = PRINCIPAL_CACHE_TTL, max_entradas: int = PRINCIPAL_CACHE_MAX):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._entradas: "OrderedDict[str, tuple[float, UserOut]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, username: str) -> Optional[UserOut]:
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entrada = self._entradas.get(username)
+            if entrada is None or entrada[0] < time.monotonic():
+                if entrada is not None:
+                    del self._entradas[username]
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(username)
+            self.aciertos += 1
+            return entrada[1]
+
+    def guardar(self, principal: UserOut):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entradas[principal.username] = (time.monotonic() + self.ttl, principal)
+            self._entradas.move_to_end(principal.username)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def invalidar(self, username: str):
+        with self._lock:
+            if self._entradas.pop(username, None) is not None:
+                logger.info("Principal invalidado en caché: %s", username)
+
+    def invalidar_todos(self):
+        with self._lock:
+            self._entradas.clear()
+        logger.info("Caché de principales vaciada")
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+            self.aciertos = 0
+            self.fallos = 0
+
+
+# Instancia global de la caché de principales
+cache_principales = PrincipalCache()
+
+
+# Los usuarios afectados se anotan en el flush y se invalidan tras el commit: si se
+# invalidaran en el flush, una petición concurrente podría volver a guardar la fila
+# anterior antes de que el cambio se confirme. Los UPDATE/DELETE masivos sobre users
+# (session.execute(update(User)...)) no pasan por el flush y vacían toda la caché;
+# las sentencias ejecutadas directamente sobre la conexión no se detectan.
+PENDIENTES = "principales_a_invalidar"
+
+
+def _pendientes(session) -> set:
+    return session.info.setdefault(PENDIENTES, set())
+
+
+@event.listens_for(Session, "after_flush")
+def _anotar_cambios_de_acceso(session, contexto):
+    for usuario in session.dirty:
+        if not isinstance(usuario, User):
+            continue
+        estado = inspect(usuario)
+        if any(estado.attrs[campo].history.has_changes() for campo in ("role", "is_active", "username")):
+            _pendientes(session).add(usuario.username)
+            _pendientes(session).update(estado.attrs.username.history.deleted or ())
+    for usuario in session.deleted:
+        if isinstance(usuario, User):
+            _pendientes(session).add(usuario.username)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _anotar_cambios_masivos(estado):
+    if (estado.is_update or estado.is_delete) and estado.bind_mapper is inspect(User):
+        _pendientes(estado.session).add(None)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidar_tras_commit(session):
+    pendientes = session.info.pop(PENDIENTES, None)
+    if not pendientes:
+        return
+    if None in pendientes:
+        cache_principales.invalidar_todos()
+        return
+    for username in pendientes:
+        cache_principales.invalidar(username)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _descartar_pendientes(session, transaccion_previa):
+    if not transaccion_previa.nested:
+        session.info.pop(PENDIENTES, None)
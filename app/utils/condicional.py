@@ -0,0 +1,43 @@
+from fastapi import Request
+from fastapi.responses import Response
+
+# GET condicional: ETag fuerte por representación y 304 con If-None-Match.
+# Las respuestas son por usuario, así que ningún intermediario debe compartirlas
+# y el cliente revalida siempre antes de reutilizar su copia.
+CACHE_CONTROL = "private, no-cache"
+
+
+def variante_listado(listado: str, formato: str) -> str:
+    """Cada formato es una representación distinta y lleva su propio ETag (citas, citas.msgpack)"""
+    return listado if formato == "json" else f"{listado}.{formato}"
+
+
+def etag(variante: str, version: str) -> str:
+    return f'"{variante}-{version}"'
+
+
+def versiones_conocidas(request: Request, variante: str) -> set[str]:
+    """Versiones de `variante` que el cliente envía en If-None-Match (comparación débil, RFC 9110)"""
+    cabecera = request.headers.get("if-none-match")
+    if not cabecera:
+        return set()
+    prefijo = f"{variante}-"
+    versiones = set()
+    for valor in cabecera.split(","):
+        valor = valor.strip()
+        if valor.startswith("W/"):
+            valor = valor[2:]
+        valor = valor.strip('"')
+        if valor.startswith(prefijo):
+            versiones.add(valor[len(prefijo):])
+    return versiones
+
+
+def con_etag(respuesta: Response, valor: str) -> Response:
+    respuesta.headers["ETag"] = valor
+    respuesta.headers["Cache-Control"] = CACHE_CONTROL
+    return respuesta
+
+
+def no_modificado(valor: str) -> Response:
+    return con_etag(Response(status_code=304), valor)
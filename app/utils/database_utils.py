@@ -1,6 +1,9 @@
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 from app.utils.logging_config import get_logger
+from starlette.concurrency import run_in_threadpool
+from app.database import modo_async
+from app.utils.replicas import enrutador_replicas
 from typing import Callable, Any, Tuple
 
 logger = get_logger("database_utils")
@@ -23,11 +26,11 @@ def with_transaction(db: Session, operation: Callable, *args, **kwargs) -> Tuple
         return result, None
     except SQLAlchemyError as e:
         db.rollback()
-        logger.error(f"Error de base de datos: {str(e)}")
+        logger.error("Error de base de datos: %s", e)
         return None, f"Error de base de datos: {str(e)}"
     except Exception as e:
         db.rollback()
-        logger.error(f"Error inesperado: {str(e)}")
+        logger.error("Error inesperado: %s", e)
         return None, f"Error interno del servidor: {str(e)}"
 
 def safe_db_operation(operation: Callable):
@@ -47,3 +50,38 @@ def safe_db_operation(operation: Callable):
         return with_transaction(db, operation, *args, **kwargs)
     
     return wrapper
+
+
+class ServicioDual:
+    """
+    Expone un servicio con versión sync y async como funciones awaitables.
+
+    En modo async delega en el módulo async; en modo sync ejecuta la función
+    síncrona en el threadpool para no bloquear el event loop. Las funciones
+    que el módulo síncrono declara en SOLO_LECTURA pueden ir a una réplica.
+    """
+    def __init__(self, modulo_sync, modulo_async):
+        self._modulo_sync = modulo_sync
+        self._modulo_async = modulo_async
+        self._lecturas = getattr(modulo_sync, "SOLO_LECTURA", frozenset())
+
+    def __getattr__(self, nombre: str):
+        lectura = nombre in self._lecturas and bool(enrutador_replicas.replicas)
+        if modo_async():
+            funcion = getattr(self._modulo_async, nombre)
+            if not lectura:
+                return funcion
+
+            async def en_replica(*args, **kwargs):
+                return await enrutador_replicas.leer_async(funcion, *args, **kwargs)
+
+            return en_replica
+
+        funcion = getattr(self._modulo_sync, nombre)
+
+        async def en_threadpool(*args, **kwargs):
+            if lectura:
+                return await run_in_threadpool(enrutador_replicas.leer, funcion, *args, **kwargs)
+            return await run_in_threadpool(funcion, *args, **kwargs)
+
+        return en_threadpool
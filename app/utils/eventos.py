@@ -0,0 +1,288 @@
+import asyncio
+import os
+import secrets
+import socket
+import threading
+from collections import defaultdict
+from typing import Optional
+from app.utils.logging_config import get_logger
+from app.utils.serializacion import a_json
+
+try:
+    import orjson
+
+    def de_json(datos: bytes):
+        return orjson.loads(datos)
+except ImportError:  # pragma: no cover
+    import json
+
+    def de_json(datos: bytes):
+        return json.loads(datos)
+
+logger = get_logger("eventos")
+
+# Cambios de citas para /citas/stream (Server-Sent Events)
+# Eventos pendientes por cliente; un cliente que no los consume a tiempo se desconecta
+EVENTOS_COLA_MAX = int(os.getenv("EVENTOS_COLA_MAX", "100"))
+# Segundos entre comentarios de latido (mantienen viva la conexión en proxies)
+EVENTOS_LATIDO = float(os.getenv("EVENTOS_LATIDO", "15"))
+# Directorio compartido por los workers de un host para repartir los eventos
+# entre ellos (un socket Unix por worker); vacío = solo este proceso
+EVENTOS_DIR = os.getenv("EVENTOS_DIR", "")
+
+TIPOS = ("creada", "editada", "cancelada", "eliminada")
+CAMPOS_EVENTO = ("id", "paciente_id", "recurso_id", "motivo", "fecha_hora", "estado", "notas")
+# Milisegundos que el navegador espera antes de reconectar
+REINTENTO_MS = 3000
+LATIDO = b": latido\n\n"
+TAMAÑO_DATAGRAMA = 65536
+
+
+def datos_cita(cita) -> dict:
+    """Campos de una cita que viajan en el evento (instancia ORM o diccionario)"""
+    if isinstance(cita, dict):
+        datos = {campo: cita.get(campo) for campo in CAMPOS_EVENTO}
+    else:
+        datos = {campo: getattr(cita, campo) for campo in CAMPOS_EVENTO}
+    if hasattr(datos["motivo"], "value"):
+        datos["motivo"] = datos["motivo"].value
+    return datos
+
+
+def trama_sse(tipo: str, datos: dict) -> bytes:
+    """Evento ya codificado; se comparte entre todos los clientes que lo reciben"""
+    return b"event: " + tipo.encode() + b"\ndata: " + a_json(datos) + b"\n\n"
+
+
+class Suscripcion:
+    """
+    Un cliente conectado: cola acotada de tramas en el event loop de su petición.
+
+    paciente_id None recibe todos los eventos (admin); si no, solo los de sus citas.
+    """
+    __slots__ = ("paciente_id", "loop", "cola", "desbordada")
+
+    def __init__(self, paciente_id: Optional[int], loop, maximo: int):
+        self.paciente_id = paciente_id
+        self.loop = loop
+        self.cola: asyncio.Queue = asyncio.Queue(maximo)
+        self.desbordada = False
+
+    def entregar(self, trama: bytes):
+        if self.desbordada:
+            return
+        try:
+            self.cola.put_nowait(trama)
+        except asyncio.QueueFull:
+            # Cliente lento: se corta en vez de acumular eventos sin límite; al
+            # reconectar recarga el listado
+            self.desbordada = True
+
+
+class RepartoSocket:
+    """
+    Reparto entre los workers de un host sin servicios externos.
+
+    Cada worker escucha en un socket Unix de datagramas dentro de `directorio`
+    y publica enviando el evento a todos los sockets del directorio salvo el
+    suyo. Los sockets de workers que ya no existen se borran al fallar el envío.
+    """
+    def __init__(self, directorio: str):
+        self.directorio = directorio
+        self.ruta = os.path.join(directorio, f"{os.getpid()}-{secrets.token_hex(4)}.sock")
+        self._receptor: Optional[socket.socket] = None
+        self._loop = None
+        self._emisor = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._emisor.setblocking(False)
+        self._lock = threading.Lock()
+        self.perdidos = 0
+
+    def escuchar(self, loop, recibir):
+        """Empieza a recibir en `loop`; `recibir` se llama con los bytes de cada evento"""
+        if self._receptor is not None:
+            return
+        os.makedirs(self.directorio, exist_ok=True)
+        receptor = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        receptor.bind(self.ruta)
+        receptor.setblocking(False)
+        self._receptor, self._loop = receptor, loop
+        loop.add_reader(receptor.fileno(), self._leer, recibir)
+
+    def _leer(self, recibir):
+        while True:
+            try:
+                datos = self._receptor.recv(TAMAÑO_DATAGRAMA)
+            except (BlockingIOError, InterruptedError):
+                return
+            recibir(datos)
+
+    def enviar(self, datos: bytes):
+        try:
+            destinos = os.listdir(self.directorio)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            for nombre in destinos:
+                ruta = os.path.join(self.directorio, nombre)
+                if ruta == self.ruta or not nombre.endswith(".sock"):
+                    continue
+                try:
+                    self._emisor.sendto(datos, ruta)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    self._borrar(ruta)
+                except BlockingIOError:
+                    # Búfer del receptor lleno: sus clientes pierden este evento
+                    self.perdidos += 1
+
+    def _borrar(self, ruta: str):
+        try:
+            os.unlink(ruta)
+        except FileNotFoundError:
+            pass
+
+    def cerrar(self):
+        if self._receptor is not None:
+            try:
+                self._loop.remove_reader(self._receptor.fileno())
+            except RuntimeError:
+                pass  # el loop ya está cerrado
+            self._receptor.close()
+            self._receptor = None
+            self._borrar(self.ruta)
+        self._emisor.close()
+
+
+class BrokerCitas:
+    """
+    Reparte los cambios de citas a los clientes de /citas/stream.
+
+    cita_service publica después de cada COMMIT, desde el threadpool (modo
+    sync) o desde el event loop (modo async). Cada evento se codifica una vez
+    y se entrega solo a los administradores y a las suscripciones del paciente
+    de la cita, con una sola llamada por event loop. Un cliente sin eventos
+    solo ocupa una cola vacía: los latidos los pone una única tarea por event
+    loop en las colas vacías, sin un temporizador por cliente.
+    """
+    def __init__(self, maximo_cola: int = EVENTOS_COLA_MAX, latido: float = EVENTOS_LATIDO,
+                 directorio: str = EVENTOS_DIR):
+        self.maximo_cola = maximo_cola
+        self.latido = latido
+        self.reparto = RepartoSocket(directorio) if directorio else None
+        self._todas: set[Suscripcion] = set()
+        self._por_paciente: "defaultdict[int, set[Suscripcion]]" = defaultdict(set)
+        self._lock = threading.Lock()
+        # Event loop -> tarea de latidos de sus suscripciones
+        self._latidos: dict = {}
+
+    # --- Suscripciones -----------------------------------------------------
+
+    def suscribir(self, paciente_id: Optional[int]) -> Suscripcion:
+        """Desde el event loop de la petición; paciente_id None = todas las citas"""
+        loop = asyncio.get_running_loop()
+        suscripcion = Suscripcion(paciente_id, loop, self.maximo_cola)
+        with self._lock:
+            if paciente_id is None:
+                self._todas.add(suscripcion)
+            else:
+                self._por_paciente[paciente_id].add(suscripcion)
+            tarea = self._latidos.get(loop)
+            if tarea is None or tarea.done():
+                self._latidos[loop] = loop.create_task(self._latir(loop))
+        if self.reparto is not None:
+            self.reparto.escuchar(loop, self._recibir)
+        return suscripcion
+
+    def desuscribir(self, suscripcion: Suscripcion):
+        with self._lock:
+            if suscripcion.paciente_id is None:
+                self._todas.discard(suscripcion)
+                return
+            suscripciones = self._por_paciente.get(suscripcion.paciente_id)
+            if suscripciones is not None:
+                suscripciones.discard(suscripcion)
+                if not suscripciones:
+                    del self._por_paciente[suscripcion.paciente_id]
+
+    def suscritos(self) -> int:
+        with self._lock:
+            return len(self._todas) + sum(len(s) for s in self._por_paciente.values())
+
+    def _suscripciones(self):
+        yield from self._todas
+        for suscripciones in self._por_paciente.values():
+            yield from suscripciones
+
+    async def _latir(self, loop):
+        """Latido en las colas vacías de las suscripciones de `loop`; termina cuando no queda ninguna"""
+        while True:
+            await asyncio.sleep(self.latido)
+            with self._lock:
+                suscripciones = [s for s in self._suscripciones() if s.loop is loop]
+                if not suscripciones:
+                    del self._latidos[loop]
+                    return
+            for suscripcion in suscripciones:
+                if suscripcion.cola.empty():
+                    suscripcion.entregar(LATIDO)
+
+    # --- Publicación -------------------------------------------------------
+
+    def publicar(self, tipo: str, citas):
+        """Evento `tipo` para cada cita (instancias ORM o diccionarios con CAMPOS_EVENTO)"""
+        for cita in citas:
+            datos = datos_cita(cita)
+            self._repartir(datos["paciente_id"], trama_sse(tipo, datos))
+            if self.reparto is not None:
+                self.reparto.enviar(a_json({"tipo": tipo, "cita": datos}))
+
+    def _recibir(self, mensaje: bytes):
+        evento = de_json(mensaje)
+        self._repartir(evento["cita"]["paciente_id"], trama_sse(evento["tipo"], evento["cita"]))
+
+    def _repartir(self, paciente_id, trama: bytes):
+        with self._lock:
+            destinos = list(self._todas)
+            destinos.extend(self._por_paciente.get(paciente_id, ()))
+        if not destinos:
+            return
+        por_loop = defaultdict(list)
+        for suscripcion in destinos:
+            por_loop[suscripcion.loop].append(suscripcion)
+        try:
+            actual = asyncio.get_running_loop()
+        except RuntimeError:
+            actual = None
+        for loop, suscripciones in por_loop.items():
+            if loop is actual:
+                _entregar(suscripciones, trama)
+            elif not loop.is_closed():
+                loop.call_soon_threadsafe(_entregar, suscripciones, trama)
+
+    # --- Respuesta SSE -----------------------------------------------------
+
+    async def flujo_sse(self, suscripcion: Suscripcion):
+        """Cuerpo de la respuesta text/event-stream de una suscripción"""
+        try:
+            yield f"retry: {REINTENTO_MS}\n\n".encode()
+            while not suscripcion.desbordada:
+                yield await suscripcion.cola.get()
+            logger.warning("Cliente de eventos desconectado por lento (paciente %s)", suscripcion.paciente_id)
+            yield b"event: desbordado\ndata: {}\n\n"
+        finally:
+            self.desuscribir(suscripcion)
+
+    def cerrar(self):
+        for tarea in list(self._latidos.values()):
+            tarea.cancel()
+        self._latidos.clear()
+        if self.reparto is not None:
+            self.reparto.cerrar()
+
+
+def _entregar(suscripciones, trama: bytes):
+    for suscripcion in suscripciones:
+        suscripcion.entregar(trama)
+
+
+# Instancia global; cita_service publica y /citas/stream se suscribe
+broker_citas = BrokerCitas()
@@ -0,0 +1,51 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+# Formateo por lotes de filas para exportaciones en streaming (NDJSON / CSV)
+
+FORMATOS_EXPORTACION = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+def _valor_json(valor):
+    return valor.isoformat() if isinstance(valor, datetime) else valor
+
+def formatear_lote(lote, columnas, formato: str) -> str:
+    if formato == "ndjson":
+        return "".join(
+            json.dumps({c: _valor_json(v) for c, v in zip(columnas, fila)}, ensure_ascii=False) + "\n"
+            for fila in lote
+        )
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(lote)
+    return buffer.getvalue()
+
+def encabezado(columnas, formato: str) -> str:
+    if formato == "csv":
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(columnas)
+        return buffer.getvalue()
+    return ""
+
+def generar_exportacion(lotes, columnas, formato: str):
+    """
+    Devuelve el cuerpo de un StreamingResponse a partir de un iterador de lotes.
+
+    Acepta iteradores síncronos (modo sync, consumidos en el threadpool) o
+    asíncronos (modo async); en ambos casos solo hay un lote en memoria.
+    """
+    if hasattr(lotes, "__aiter__"):
+        async def cuerpo_async():
+            yield encabezado(columnas, formato)
+            async for lote in lotes:
+                yield formatear_lote(lote, columnas, formato)
+        return cuerpo_async()
+
+    def cuerpo():
+        yield encabezado(columnas, formato)
+        for lote in lotes:
+            yield formatear_lote(lote, columnas, formato)
+    return cuerpo()
@@ -0,0 +1,151 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from passlib.context import CryptContext
+from app.utils.logging_config import get_logger
+from app.utils.perfilador import registrar_hash
+
+logger = get_logger("hasher")
+
+# Contexto para hashing de contraseñas (se usa dentro de los procesos del pool)
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# Configuración del pool: 0 workers ejecuta el hashing en el mismo proceso
+HASHER_WORKERS = int(os.getenv("HASHER_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+HASHER_MAX_COLA = int(os.getenv("HASHER_MAX_COLA", max(1, HASHER_WORKERS) * 8))
+
+
+class HasherSaturadoError(Exception):
+    """La cola del pool de hashing está llena; el cliente debe reintentar más tarde"""
+
+
+def _hashear(contraseña: str):
+    inicio = time.monotonic()
+    resultado = pwd_context.hash(contraseña)
+    return resultado, inicio, time.monotonic() - inicio
+
+
+def _verificar(contraseña_plana: str, contraseña_hash: str):
+    inicio = time.monotonic()
+    resultado = pwd_context.verify(contraseña_plana, contraseña_hash)
+    return resultado, inicio, time.monotonic() - inicio
+
+
+class HasherPool:
+    """
+    Ejecuta bcrypt en un pool de procesos acotado.
+
+    El número de operaciones pendientes (en cola + en ejecución) está limitado
+    por max_cola; al superarlo se lanza HasherSaturadoError de inmediato en lugar
+    de bloquear más hilos de la API esperando CPU.
+    """
+    def __init__(self, workers: int = HASHER_WORKERS, max_cola: int = HASHER_MAX_COLA):
+        self.workers = workers
+        self.max_cola = max_cola
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pendientes = 0
+        self._operaciones = 0
+        self._rechazos = 0
+        self._espera_total = 0.0
+        self._espera_max = 0.0
+        self._hash_total = 0.0
+        self._hash_max = 0.0
+
+    def _obtener_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                    logger.info("Pool de hashing iniciado con %s procesos", self.workers)
+        return self._executor
+
+    def _reservar(self):
+        with self._lock:
+            if self._pendientes >= self.max_cola:
+                self._rechazos += 1
+                raise HasherSaturadoError("Servicio de autenticación saturado. Intenta nuevamente en unos segundos")
+            self._pendientes += 1
+
+    def _liberar(self, espera: float = None, duracion: float = None, operaciones: int = 1):
+        with self._lock:
+            self._pendientes -= 1
+            if espera is None:
+                return
+            self._operaciones += operaciones
+            self._espera_total += espera * operaciones
+            self._espera_max = max(self._espera_max, espera)
+            self._hash_total += duracion
+            self._hash_max = max(self._hash_max, duracion / operaciones)
+
+    def ejecutar(self, funcion, *args):
+        self._reservar()
+        enviado = time.monotonic()
+        try:
+            if self.workers <= 0:
+                resultado, inicio, duracion = funcion(*args)
+            else:
+                resultado, inicio, duracion = self._obtener_executor().submit(funcion, *args).result()
+        except BaseException:
+            self._liberar()
+            raise
+        self._liberar(max(0.0, inicio - enviado), duracion)
+        registrar_hash(time.monotonic() - enviado)
+        return resultado
+
+    def hash(self, contraseña: str) -> str:
+        return self.ejecutar(_hashear, contraseña)
+
+    def verificar(self, contraseña_plana: str, contraseña_hash: str) -> bool:
+        return self.ejecutar(_verificar, contraseña_plana, contraseña_hash)
+
+    def hash_lote(self, contraseñas: list[str]) -> list[str]:
+        """
+        Hashea muchas contraseñas repartiéndolas entre todos los procesos del pool.
+
+        El lote ocupa un solo hueco de la cola; mientras se procesa, las demás
+        operaciones esperan detrás de sus trozos.
+        """
+        if not contraseñas:
+            return []
+        self._reservar()
+        enviado = time.monotonic()
+        try:
+            if self.workers <= 0:
+                resultados = [_hashear(c) for c in contraseñas]
+            else:
+                trozo = max(1, len(contraseñas) // (self.workers * 4))
+                resultados = list(self._obtener_executor().map(_hashear, contraseñas, chunksize=trozo))
+        except BaseException:
+            self._liberar()
+            raise
+        primer_inicio = min(inicio for _, inicio, _ in resultados)
+        self._liberar(max(0.0, primer_inicio - enviado), sum(d for _, _, d in resultados), len(resultados))
+        registrar_hash(time.monotonic() - enviado)
+        return [hash_ for hash_, _, _ in resultados]
+
+    def metricas(self) -> dict:
+        """Tiempo en cola frente a tiempo de hashing, en segundos"""
+        with self._lock:
+            operaciones = self._operaciones or 1
+            return {
+                "workers": self.workers,
+                "max_cola": self.max_cola,
+                "pendientes": self._pendientes,
+                "operaciones": self._operaciones,
+                "rechazos": self._rechazos,
+                "espera_promedio": self._espera_total / operaciones,
+                "espera_max": self._espera_max,
+                "hash_promedio": self._hash_total / operaciones,
+                "hash_max": self._hash_max,
+            }
+
+    def cerrar(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Instancia global del pool de hashing
+hasher = HasherPool()
@@ -0,0 +1,305 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from app.models.idempotencia import RespuestaIdempotente
+from app.utils.logging_config import get_logger
+from app.utils.metricas import repeticiones_idempotentes
+from app.utils.respuestas import respuesta_error
+from app.utils.seguridad import sujeto_token
+
+logger = get_logger("idempotencia")
+
+# Idempotency-Key en las peticiones que cambian citas
+# Almacén de respuestas: "memoria" (por proceso) o "db" (tabla idempotencia, compartida entre workers)
+IDEMPOTENCIA_BACKEND = os.getenv("IDEMPOTENCIA_BACKEND", "memoria")
+# Segundos que se conserva la respuesta de una clave
+IDEMPOTENCIA_TTL = float(os.getenv("IDEMPOTENCIA_TTL", "86400"))
+# Máximo de claves en memoria; al superarlo se descartan las más antiguas
+IDEMPOTENCIA_MAX_CLAVES = int(os.getenv("IDEMPOTENCIA_MAX_CLAVES", "10000"))
+# Segundos que un duplicado espera a la petición original; pasado ese tiempo
+# la reserva de la original se da por abandonada
+IDEMPOTENCIA_ESPERA = float(os.getenv("IDEMPOTENCIA_ESPERA", "30"))
+
+CABECERA = "idempotency-key"
+CABECERA_REPETIDA = "Idempotent-Replayed"
+METODOS = frozenset({"POST", "PUT", "DELETE"})
+PREFIJOS = ("/citas",)
+LONGITUD_MAXIMA = 255
+# Cada cuánto se consulta el almacén mientras la original sigue en curso en otro worker
+INTERVALO_SONDEO = 0.05
+
+
+class RespuestaGuardada:
+    """Respuesta registrada para una clave; estado None mientras la petición original está en curso"""
+    __slots__ = ("huella", "expira", "estado", "cabeceras", "cuerpo")
+
+    def __init__(self, huella: str, expira: float, estado: Optional[int] = None, cabeceras=(), cuerpo: bytes = b""):
+        self.huella = huella
+        self.expira = expira
+        self.estado = estado
+        self.cabeceras = list(cabeceras)
+        self.cuerpo = cuerpo
+
+    @property
+    def en_curso(self) -> bool:
+        return self.estado is None
+
+    def respuesta(self, repetida: bool = False) -> Response:
+        respuesta = Response(content=self.cuerpo, status_code=self.estado)
+        respuesta.raw_headers = [(nombre.encode("latin-1"), valor.encode("latin-1")) for nombre, valor in self.cabeceras]
+        if repetida:
+            respuesta.headers[CABECERA_REPETIDA] = "true"
+        return respuesta
+
+
+class AlmacenMemoria:
+    """
+    Respuestas en un OrderedDict por orden de registro.
+
+    Las caducadas se barren desde el principio en cada reserva y nunca hay
+    más de max_claves. Solo ve las peticiones de este proceso.
+    """
+    bloqueante = False
+
+    def __init__(self, max_claves: int = IDEMPOTENCIA_MAX_CLAVES):
+        self.max_claves = max_claves
+        self._respuestas: "OrderedDict[str, RespuestaGuardada]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def reservar(self, clave: str, huella: str, ahora: float, espera: float) -> Optional[RespuestaGuardada]:
+        """Lo registrado para la clave, o None si esta petición pasa a ser la original"""
+        with self._lock:
+            self._barrer(ahora)
+            guardada = self._respuestas.get(clave)
+            if guardada is not None and guardada.expira > ahora:
+                return guardada
+            self._respuestas[clave] = RespuestaGuardada(huella, ahora + espera)
+            self._respuestas.move_to_end(clave)
+            return None
+
+    def guardar(self, clave: str, guardada: RespuestaGuardada):
+        with self._lock:
+            self._respuestas[clave] = guardada
+            self._respuestas.move_to_end(clave)
+
+    def liberar(self, clave: str):
+        """Olvida la reserva de una original que no terminó (o terminó en 5xx) para que se pueda reintentar"""
+        with self._lock:
+            guardada = self._respuestas.get(clave)
+            if guardada is not None and guardada.en_curso:
+                del self._respuestas[clave]
+
+    def limpiar(self):
+        with self._lock:
+            self._respuestas.clear()
+
+    def _barrer(self, ahora: float):
+        while self._respuestas:
+            guardada = next(iter(self._respuestas.values()))
+            if guardada.expira > ahora and len(self._respuestas) < self.max_claves:
+                break
+            self._respuestas.popitem(last=False)
+
+    def __len__(self):
+        return len(self._respuestas)
+
+
+class AlmacenDB:
+    """
+    Respuestas en la tabla idempotencia, compartida por todos los workers.
+
+    La reserva es un INSERT: si dos workers reciben la misma clave, la clave
+    primaria deja pasar a uno solo. Una reserva en curso caduca a los
+    `espera` segundos (worker caído) y otro worker puede retomarla. Las filas
+    caducadas se borran cada `barrer_cada` reservas.
+    """
+    bloqueante = True
+
+    def __init__(self, engine=None, barrer_cada: int = 1000):
+        if engine is None:
+            from app.database import engine
+        self.engine = engine
+        self.barrer_cada = barrer_cada
+        self._reservas = 0
+        self._lock = threading.Lock()
+
+    def reservar(self, clave: str, huella: str, ahora: float, espera: float) -> Optional[RespuestaGuardada]:
+        tabla = RespuestaIdempotente.__table__
+        self._contar(ahora)
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(insert(tabla).values(clave=clave, huella=huella, expira=ahora + espera))
+            return None
+        except IntegrityError:
+            pass
+        with self.engine.begin() as conn:
+            # Reserva abandonada o respuesta caducada: la retoma solo un worker
+            retomada = conn.execute(
+                update(tabla).where(tabla.c.clave == clave, tabla.c.expira <= ahora)
+                .values(huella=huella, estado=None, cabeceras=None, cuerpo=None, expira=ahora + espera)
+            ).rowcount
+            if retomada:
+                return None
+            fila = conn.execute(select(tabla).where(tabla.c.clave == clave)).first()
+        if fila is None:
+            return None
+        return RespuestaGuardada(fila.huella, fila.expira, fila.estado,
+                                 json.loads(fila.cabeceras) if fila.cabeceras else (), fila.cuerpo or b"")
+
+    def guardar(self, clave: str, guardada: RespuestaGuardada):
+        tabla = RespuestaIdempotente.__table__
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(tabla).where(tabla.c.clave == clave)
+                .values(huella=guardada.huella, estado=guardada.estado, cabeceras=json.dumps(guardada.cabeceras),
+                        cuerpo=guardada.cuerpo, expira=guardada.expira)
+            )
+
+    def liberar(self, clave: str):
+        tabla = RespuestaIdempotente.__table__
+        with self.engine.begin() as conn:
+            conn.execute(delete(tabla).where(tabla.c.clave == clave, tabla.c.estado.is_(None)))
+
+    def limpiar(self):
+        with self.engine.begin() as conn:
+            conn.execute(delete(RespuestaIdempotente.__table__))
+
+    def _contar(self, ahora: float):
+        with self._lock:
+            self._reservas += 1
+            barrer = self._reservas % self.barrer_cada == 0
+        if barrer:
+            with self.engine.begin() as conn:
+                conn.execute(delete(RespuestaIdempotente.__table__).where(RespuestaIdempotente.expira <= ahora))
+
+
+def crear_almacen(backend: str = IDEMPOTENCIA_BACKEND):
+    if backend == "db":
+        return AlmacenDB()
+    if backend != "memoria":
+        raise ValueError(f"IDEMPOTENCIA_BACKEND no soportado: {backend}")
+    return AlmacenMemoria()
+
+
+def _huella(request: Request, cuerpo: bytes) -> str:
+    contenido = b"\n".join((request.method.encode(), request.url.path.encode(), request.url.query.encode(), cuerpo))
+    return hashlib.sha256(contenido).hexdigest()
+
+
+def _usuario(request: Request) -> Optional[str]:
+    esquema, _, token = request.headers.get("authorization", "").partition(" ")
+    if esquema.lower() != "bearer" or not token:
+        return None
+    return sujeto_token(token)
+
+
+class Idempotencia:
+    """
+    Idempotency-Key para POST/PUT/DELETE de /citas.
+
+    La primera petición con una clave se ejecuta y su respuesta (salvo los
+    5xx, que se pueden reintentar) se guarda `ttl` segundos. Las repeticiones
+    con la misma clave y la misma petición reciben esa respuesta, con la
+    cabecera Idempotent-Replayed, sin llegar al endpoint. Los duplicados que
+    llegan mientras la original sigue en curso esperan a su resultado en vez
+    de ejecutarse: en este proceso comparten un Future, y entre workers
+    (almacén db) consultan la tabla. Las claves son por usuario; reutilizar
+    una clave con otra petición da 422.
+    """
+    def __init__(self, almacen=None, ttl: float = IDEMPOTENCIA_TTL, espera: float = IDEMPOTENCIA_ESPERA):
+        self.almacen = almacen if almacen is not None else crear_almacen()
+        self.ttl = ttl
+        self.espera = espera
+        # Clave -> Future con la RespuestaGuardada de la original en curso en este proceso
+        self._en_vuelo: dict[str, asyncio.Future] = {}
+
+    async def procesar(self, request: Request, call_next) -> Response:
+        valor = request.headers.get(CABECERA)
+        if valor is None or request.method not in METODOS or not request.url.path.startswith(PREFIJOS):
+            return await call_next(request)
+        if not valor or len(valor) > LONGITUD_MAXIMA:
+            return JSONResponse(status_code=400, content=respuesta_error("Idempotency-Key no válida"))
+        usuario = _usuario(request)
+        if usuario is None:
+            # Sin credenciales válidas el endpoint responde 401: no hay nada que repetir
+            return await call_next(request)
+        clave = f"{usuario}:{valor}"
+        huella = _huella(request, await request.body())
+
+        futuro = self._en_vuelo.get(clave)
+        if futuro is not None:
+            guardada = await asyncio.shield(futuro)
+            if guardada is None or (guardada.estado or 0) >= 500:
+                # La original terminó sin respuesta (excepción) o con un 5xx, que no se
+                # guarda: esta se trata como un reintento
+                return await self.procesar(request, call_next)
+            return self._repetir(guardada, huella)
+
+        futuro = self._en_vuelo[clave] = asyncio.get_running_loop().create_future()
+        guardada = None
+        try:
+            guardada, original = await self._ejecutar(clave, huella, request, call_next)
+        finally:
+            del self._en_vuelo[clave]
+            futuro.set_result(guardada)
+        return guardada.respuesta() if original else self._repetir(guardada, huella)
+
+    async def _ejecutar(self, clave: str, huella: str, request: Request, call_next) -> tuple[RespuestaGuardada, bool]:
+        """(respuesta, True) si esta petición es la original; (lo ya registrado para la clave, False) si no"""
+        limite = time.time() + self.espera
+        guardada = await self._almacen("reservar", clave, huella, time.time(), self.espera)
+        # La original está en curso en otro worker
+        while guardada is not None and guardada.en_curso and guardada.huella == huella and time.time() < limite:
+            await asyncio.sleep(INTERVALO_SONDEO)
+            guardada = await self._almacen("reservar", clave, huella, time.time(), self.espera)
+        if guardada is not None:
+            return guardada, False
+
+        try:
+            response = await call_next(request)
+            cuerpo = b"".join([trozo async for trozo in response.body_iterator])
+        except BaseException:
+            await self._almacen("liberar", clave)
+            raise
+        guardada = RespuestaGuardada(huella, time.time() + self.ttl, response.status_code, response.headers.items(), cuerpo)
+        if response.status_code >= 500:
+            await self._almacen("liberar", clave)
+        else:
+            await self._almacen("guardar", clave, guardada)
+        return guardada, True
+
+    def _repetir(self, guardada: RespuestaGuardada, huella: str) -> Response:
+        if guardada.huella != huella:
+            return JSONResponse(status_code=422, content=respuesta_error("Idempotency-Key ya usada con otra petición"))
+        if guardada.en_curso:
+            return JSONResponse(
+                status_code=409,
+                content=respuesta_error("La petición con esta Idempotency-Key sigue en curso"),
+                headers={"Retry-After": "1"}
+            )
+        repeticiones_idempotentes.inc()
+        logger.info("Respuesta repetida por Idempotency-Key (estado %s)", guardada.estado)
+        return guardada.respuesta(repetida=True)
+
+    async def _almacen(self, metodo: str, *args):
+        funcion = getattr(self.almacen, metodo)
+        if self.almacen.bloqueante:
+            return await run_in_threadpool(funcion, *args)
+        return funcion(*args)
+
+    def limpiar(self):
+        self.almacen.limpiar()
+
+
+# Instancia global; main.py la aplica como middleware
+idempotencia = Idempotencia()
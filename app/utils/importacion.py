@@ -0,0 +1,41 @@
+import csv
+import io
+import json
+import os
+from typing import Optional
+
+# Lectura de archivos de importación de usuarios (CSV con encabezado o JSONL)
+
+FORMATOS_IMPORTACION = ("csv", "jsonl")
+COLUMNAS_IMPORTACION = ("username", "email", "password", "full_name", "role")
+IMPORTACION_MAX_FILAS = int(os.getenv("IMPORTACION_MAX_FILAS", "10000"))
+
+def detectar_formato(nombre_archivo: Optional[str], formato: Optional[str] = None) -> str:
+    """Usa el formato indicado o la extensión del archivo; lanza ValueError si no se reconoce"""
+    if formato is None and nombre_archivo:
+        extension = nombre_archivo.rsplit(".", 1)[-1].lower()
+        formato = "jsonl" if extension in ("jsonl", "ndjson") else extension
+    if formato not in FORMATOS_IMPORTACION:
+        raise ValueError("Formato de importación no soportado. Usa csv o jsonl")
+    return formato
+
+def leer_usuarios(contenido: str, formato: str) -> list[dict]:
+    """Devuelve una lista de diccionarios (uno por fila); lanza ValueError si el archivo está mal formado"""
+    if formato == "csv":
+        lector = csv.DictReader(io.StringIO(contenido))
+        if not lector.fieldnames or not set(COLUMNAS_IMPORTACION) <= set(lector.fieldnames):
+            raise ValueError(f"El CSV debe tener las columnas: {', '.join(COLUMNAS_IMPORTACION)}")
+        return [dict(fila) for fila in lector]
+
+    filas = []
+    for numero, linea in enumerate(contenido.splitlines(), start=1):
+        if not linea.strip():
+            continue
+        try:
+            fila = json.loads(linea)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Línea {numero}: JSON inválido") from e
+        if not isinstance(fila, dict):
+            raise ValueError(f"Línea {numero}: se esperaba un objeto JSON")
+        filas.append(fila)
+    return filas
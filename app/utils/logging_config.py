@@ -1,46 +1,215 @@
+import atexit
+import copy
+import glob
+import json
 import logging
-import sys
-from datetime import datetime
+import logging.handlers
 import os
+import queue
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows: la rotación no se coordina entre procesos
+    fcntl = None
+
+# Configuración (ver env.example)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FILE = os.getenv("LOG_FILE", "logs/hospital_api.log")
+# "texto" (formato clásico) o "json" (un objeto por línea)
+LOG_FORMATO = os.getenv("LOG_FORMATO", "texto")
+# Tamaño máximo de cada archivo del día antes de rotarlo (0 = sin límite) y copias que se conservan
+LOG_ROTACION_BYTES = int(os.getenv("LOG_ROTACION_BYTES", str(50 * 1024 * 1024)))
+LOG_ROTACION_COPIAS = int(os.getenv("LOG_ROTACION_COPIAS", "5"))
+# Días de archivos diarios que se conservan (0 = no borrar)
+LOG_DIAS_RETENCION = int(os.getenv("LOG_DIAS_RETENCION", "14"))
+# Fracción de los mensajes INFO que se escriben (1.0 = todos); WARNING y superiores nunca se descartan
+LOG_MUESTREO_INFO = float(os.getenv("LOG_MUESTREO_INFO", "1.0"))
+# Registros pendientes antes de empezar a descartar en lugar de bloquear la petición
+LOG_COLA_MAX = int(os.getenv("LOG_COLA_MAX", "10000"))
+
+log_format = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+date_format = "%Y-%m-%d %H:%M:%S"
+
+
+class FormateadorJSON(logging.Formatter):
+    """Un objeto JSON por línea, con la marca de tiempo en UTC"""
+    def format(self, record):
+        datos = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "mensaje": record.getMessage(),
+            "pid": record.process,
+        }
+        if getattr(record, "datos", None) is not None:
+            datos["datos"] = record.datos
+        if getattr(record, "muestra", None) is not None:
+            datos["muestra"] = record.muestra
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            datos["exc"] = record.exc_text
+        return json.dumps(datos, ensure_ascii=False)
+
+
+class FiltroMuestreo(logging.Filter):
+    """Deja pasar solo una fracción de los INFO (y DEBUG); anota la tasa en el registro"""
+    def __init__(self, tasa: float):
+        super().__init__()
+        self.tasa = tasa
+
+    def filter(self, record):
+        if record.levelno > logging.INFO or self.tasa >= 1.0:
+            return True
+        if random.random() >= self.tasa:
+            return False
+        record.muestra = self.tasa
+        return True
+
+
+class ManejadorCola(logging.handlers.QueueHandler):
+    """
+    Encola los registros sin bloquear nunca al hilo de la petición.
+
+    Solo se interpolan los argumentos `%` (y el traceback) en el hilo que
+    registra; el formato final y la escritura ocurren en el QueueListener. Si
+    la cola está llena el registro se descarta y se cuenta.
+    """
+    def __init__(self, cola):
+        super().__init__(cola)
+        self.descartados = 0
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+
+
+class ManejadorArchivoDiario(logging.handlers.RotatingFileHandler):
+    """
+    Escribe en `<base>_<AAAAMMDD><ext>` y cambia de archivo al cambiar el día.
+
+    Al superar max_bytes rota el archivo del día (.1, .2, ...). Con varios
+    workers la rotación se hace bajo un flock y cada proceso reabre el archivo
+    si otro ya lo rotó, así que nadie sigue escribiendo en un archivo renombrado.
+    """
+    def __init__(self, ruta_base: str, max_bytes: int = 0, copias: int = 0, dias_retencion: int = 0):
+        self.ruta_base, self.extension = os.path.splitext(ruta_base)
+        self.dias_retencion = dias_retencion
+        self.fecha = self._hoy()
+        super().__init__(self._ruta_del_dia(self.fecha), maxBytes=max_bytes, backupCount=copias, encoding="utf-8")
+        self._purgar_antiguos()
+
+    @staticmethod
+    def _hoy() -> str:
+        return datetime.now().strftime("%Y%m%d")
+
+    def _ruta_del_dia(self, fecha: str) -> str:
+        return f"{self.ruta_base}_{fecha}{self.extension}"
+
+    def _reabrir(self):
+        if self.stream:
+            self.stream.close()
+        self.stream = self._open()
+
+    def _archivo_rotado(self) -> bool:
+        """True si el archivo abierto ya no es el que está en la ruta (otro proceso lo rotó)"""
+        try:
+            return os.stat(self.baseFilename).st_ino != os.fstat(self.stream.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    def emit(self, record):
+        fecha = self._hoy()
+        if fecha != self.fecha:
+            self.fecha = fecha
+            self.baseFilename = os.path.abspath(self._ruta_del_dia(fecha))
+            self._reabrir()
+            self._purgar_antiguos()
+        elif self.stream and self._archivo_rotado():
+            self._reabrir()
+        super().emit(record)
+
+    def doRollover(self):
+        if fcntl is None:
+            return super().doRollover()
+        with open(self.baseFilename + ".lock", "a") as candado:
+            fcntl.flock(candado, fcntl.LOCK_EX)
+            try:
+                # Otro worker pudo rotar mientras esperábamos el candado
+                if self._archivo_rotado() or os.path.getsize(self.baseFilename) < self.maxBytes:
+                    self._reabrir()
+                else:
+                    super().doRollover()
+            finally:
+                fcntl.flock(candado, fcntl.LOCK_UN)
+
+    def _purgar_antiguos(self):
+        if self.dias_retencion <= 0:
+            return
+        limite = (datetime.now() - timedelta(days=self.dias_retencion)).strftime("%Y%m%d")
+        for ruta in glob.glob(f"{self.ruta_base}_[0-9]*{self.extension}*"):
+            fecha = os.path.basename(ruta)[len(os.path.basename(self.ruta_base)) + 1:][:8]
+            if fecha.isdigit() and fecha < limite:
+                try:
+                    os.remove(ruta)
+                except OSError:
+                    pass
+
+
+def crear_formateador(formato: str = LOG_FORMATO) -> logging.Formatter:
+    if formato == "json":
+        return FormateadorJSON()
+    return logging.Formatter(log_format, date_format)
+
 
 def setup_logging():
     """Configura el sistema de logging para la aplicación"""
-    
-    # Crear directorio de logs si no existe
-    log_dir = "logs"
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
-    
-    # Configurar el formato de los logs
-    log_format = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    date_format = "%Y-%m-%d %H:%M:%S"
-    
+
     # Configurar el logger principal
     logger = logging.getLogger("hospital_api")
-    logger.setLevel(logging.INFO)
-    
+    logger.setLevel(LOG_LEVEL)
+
     # Evitar duplicación de logs
     if logger.handlers:
         return logger
-    
-    # Handler para archivo
-    file_handler = logging.FileHandler(
-        f"{log_dir}/hospital_api_{datetime.now().strftime('%Y%m%d')}.log"
-    )
-    file_handler.setLevel(logging.INFO)
-    file_formatter = logging.Formatter(log_format, date_format)
-    file_handler.setFormatter(file_formatter)
-    
+
+    # Crear directorio de logs si no existe
+    os.makedirs(os.path.dirname(LOG_FILE) or ".", exist_ok=True)
+
+    formateador = crear_formateador()
+
+    # Handler para archivo (diario, con rotación por tamaño)
+    file_handler = ManejadorArchivoDiario(LOG_FILE, LOG_ROTACION_BYTES, LOG_ROTACION_COPIAS, LOG_DIAS_RETENCION)
+    file_handler.setFormatter(formateador)
+
     # Handler para consola
     console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(logging.INFO)
-    console_formatter = logging.Formatter(log_format, date_format)
-    console_handler.setFormatter(console_formatter)
-    
-    # Agregar handlers al logger
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-    
+    console_handler.setFormatter(formateador)
+
+    # La petición solo encola; un hilo del QueueListener formatea y escribe
+    cola = queue.Queue(LOG_COLA_MAX)
+    queue_handler = ManejadorCola(cola)
+    queue_handler.addFilter(FiltroMuestreo(LOG_MUESTREO_INFO))
+    logger.addHandler(queue_handler)
+
+    listener = logging.handlers.QueueListener(cola, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
     return logger
 
 # Crear instancia global del logger
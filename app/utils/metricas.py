@@ -0,0 +1,129 @@
+import os
+import time
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess
+)
+from sqlalchemy import event
+from starlette.requests import Request
+
+# Métricas en formato Prometheus.
+#
+# Con varios workers hay que definir PROMETHEUS_MULTIPROC_DIR (un directorio
+# vacío y compartido, limpiado antes de arrancar): cada proceso escribe sus
+# muestras en archivos mmap de ese directorio y /metrics agrega todos al leer.
+
+MULTIPROCESO = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+BUCKETS_DB = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+OPERACIONES_SQL = {"SELECT", "INSERT", "UPDATE", "DELETE", "BEGIN", "COMMIT", "ROLLBACK"}
+
+peticiones_duracion = Histogram(
+    "http_request_duration_seconds", "Latencia de las peticiones HTTP", ["metodo", "ruta", "estado"]
+)
+peticiones_en_curso = Gauge(
+    "http_requests_in_progress", "Peticiones HTTP en curso", ["metodo", "ruta"], multiprocess_mode="livesum"
+)
+sentencias_db = Counter("db_statements_total", "Sentencias SQL ejecutadas", ["operacion"])
+sentencias_db_duracion = Histogram(
+    "db_statement_duration_seconds", "Duración de las sentencias SQL", ["operacion"], buckets=BUCKETS_DB
+)
+conexiones_pool = Gauge(
+    "db_pool_connections", "Conexiones del pool (en_uso, overflow)", ["pool", "estado"], multiprocess_mode="livesum"
+)
+fallos_autenticacion = Counter("auth_failures_total", "Fallos de autenticación", ["motivo"])
+rechazos_rate_limit = Counter("rate_limit_rejections_total", "Logins rechazados por rate limiting")
+ips_sin_seguimiento = Counter("rate_limit_untracked_total", "Fallos de login no contados por estar lleno de bloqueos el almacén de rate limiting")
+repeticiones_idempotentes = Counter("idempotent_replays_total", "Respuestas repetidas por Idempotency-Key")
+
+
+# labels() busca el hijo bajo un lock en cada llamada; las combinaciones son pocas y se reutilizan
+_hijos_peticion = {}
+_hijos_sentencia = {}
+
+def observar_peticion(metodo: str, ruta: str, estado: int, duracion: float):
+    clave = (metodo, ruta, estado)
+    hijo = _hijos_peticion.get(clave)
+    if hijo is None:
+        hijo = _hijos_peticion[clave] = peticiones_duracion.labels(metodo, ruta, str(estado))
+    hijo.observe(duracion)
+
+def observar_sentencia(statement: str, duracion: float):
+    operacion = _operacion(statement)
+    hijos = _hijos_sentencia.get(operacion)
+    if hijos is None:
+        hijos = _hijos_sentencia[operacion] = (sentencias_db.labels(operacion), sentencias_db_duracion.labels(operacion))
+    hijos[0].inc()
+    hijos[1].observe(duracion)
+
+
+def ruta_de(scope) -> str:
+    """Plantilla de la ruta (/citas/{cita_id}) para no crear una serie por cada id"""
+    if "route" not in scope:
+        return "sin_ruta"
+    parametros = scope.get("path_params")
+    if not parametros:
+        return scope["path"]
+    nombres = {str(valor): nombre for nombre, valor in parametros.items()}
+    return "/".join(f"{{{nombres[s]}}}" if s in nombres else s for s in scope["path"].split("/"))
+
+
+async def peticion_en_curso(request: Request):
+    """Dependencia global: cuenta la petición como en curso mientras se ejecuta su endpoint"""
+    gauge = peticiones_en_curso.labels(request.method, ruta_de(request.scope))
+    gauge.inc()
+    try:
+        yield
+    finally:
+        gauge.dec()
+
+
+def _operacion(statement: str) -> str:
+    palabra = statement.lstrip()[:8].split(None, 1)
+    operacion = palabra[0].upper() if palabra else ""
+    return operacion if operacion in OPERACIONES_SQL else "OTRA"
+
+
+def instrumentar_engine(engine, nombre: str = "principal"):
+    """Registra conteo y duración de sentencias y el estado del pool de un Engine síncrono"""
+    @event.listens_for(engine, "before_cursor_execute")
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metricas_inicio", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _despues(conn, cursor, statement, parameters, context, executemany):
+        observar_sentencia(statement, time.perf_counter() - conn.info["metricas_inicio"].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def _error(contexto):
+        pendientes = contexto.connection.info.get("metricas_inicio") if contexto.connection is not None else None
+        if pendientes:
+            pendientes.pop()
+
+    pool = engine.pool
+    if not hasattr(pool, "checkedout"):
+        return
+
+    en_uso = conexiones_pool.labels(nombre, "en_uso")
+    overflow = conexiones_pool.labels(nombre, "overflow")
+
+    def _actualizar_pool(*_):
+        en_uso.set(pool.checkedout())
+        overflow.set(max(0, pool.overflow()))
+
+    event.listen(pool, "checkout", _actualizar_pool)
+    event.listen(pool, "checkin", _actualizar_pool)
+
+
+def exportar_metricas() -> tuple[bytes, str]:
+    """Cuerpo y content-type para /metrics (agregando todos los workers si hay directorio compartido)"""
+    if MULTIPROCESO:
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+        return generate_latest(registro), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def cerrar_proceso():
+    """Marca este worker como terminado para que sus gauges en vivo dejen de sumarse"""
+    if MULTIPROCESO:
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,18 @@
+import base64
+import json
+from datetime import datetime
+
+# Cursores opacos para paginación keyset sobre (fecha_hora, id)
+
+def codificar_cursor(fecha_hora: datetime, id: int) -> str:
+    datos = json.dumps({"f": fecha_hora.isoformat(), "id": id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(datos.encode()).decode().rstrip("=")
+
+def decodificar_cursor(cursor: str) -> tuple[datetime, int]:
+    """Devuelve (fecha_hora, id); lanza ValueError si el cursor no es válido"""
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        datos = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        return datetime.fromisoformat(datos["f"]), int(datos["id"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError("Cursor de paginación inválido") from e
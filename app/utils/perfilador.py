@@ -0,0 +1,176 @@
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.utils.logging_config import get_logger
+
+logger = get_logger("perfilador")
+
+# Perfilado de SQL por petición (opcional)
+# PERFIL_SQL=true perfila todas las peticiones; si no, solo las de un admin
+# que envíe la cabecera X-Perfil-SQL: 1
+PERFIL_SQL = os.getenv("PERFIL_SQL", "false").lower() == "true"
+CABECERA_PERFIL = "x-perfil-sql"
+# Veces que debe repetirse la misma sentencia para marcarla como posible N+1
+PERFIL_UMBRAL_N1 = int(os.getenv("PERFIL_UMBRAL_N1", "3"))
+
+
+class PerfilPeticion:
+    """
+    Sentencias SQL y tiempos (en segundos) acumulados durante una petición.
+    Inactivo no acumula nada: es el de la cabecera X-Perfil-SQL hasta que la
+    autenticación confirma que la envía un admin.
+    """
+    def __init__(self, metodo: str = "", ruta: str = "", activo: bool = True):
+        self.metodo = metodo
+        self.ruta = ruta
+        self.activo = activo
+        self.inicio = time.perf_counter()
+        self.total = 0.0
+        self.consultas = 0
+        self.tiempo_db = 0.0
+        self.tiempo_hash = 0.0
+        self.sentencias: Counter = Counter()
+        self.es_admin = False
+        self._lock = threading.Lock()
+
+    def registrar_sentencia(self, statement: str, duracion: float):
+        with self._lock:
+            self.consultas += 1
+            self.tiempo_db += duracion
+            self.sentencias[statement] += 1
+
+    def registrar_hash(self, duracion: float):
+        with self._lock:
+            self.tiempo_hash += duracion
+
+    def terminar(self):
+        self.total = time.perf_counter() - self.inicio
+
+    def candidatas_n1(self, umbral: int = PERFIL_UMBRAL_N1) -> list[tuple[str, int]]:
+        return [(sentencia, veces) for sentencia, veces in self.sentencias.most_common() if veces >= umbral]
+
+    def server_timing(self) -> str:
+        resto = max(0.0, self.total - self.tiempo_db - self.tiempo_hash)
+        partes = [
+            f'db;dur={self.tiempo_db * 1000:.1f};desc="{self.consultas} consultas"',
+            f"hash;dur={self.tiempo_hash * 1000:.1f}",
+            f"app;dur={resto * 1000:.1f}",
+            f"total;dur={self.total * 1000:.1f}",
+        ]
+        n1 = self.candidatas_n1()
+        if n1:
+            partes.append(f'n1;desc="{len(n1)} sentencias repetidas"')
+        return ", ".join(partes)
+
+    def como_dict(self) -> dict:
+        return {
+            "metodo": self.metodo,
+            "ruta": self.ruta,
+            "consultas": self.consultas,
+            "db_ms": round(self.tiempo_db * 1000, 2),
+            "hash_ms": round(self.tiempo_hash * 1000, 2),
+            "total_ms": round(self.total * 1000, 2),
+            "n1": [{"sentencia": " ".join(s.split())[:200], "veces": v} for s, v in self.candidatas_n1()],
+        }
+
+
+_perfil_actual: ContextVar[Optional[PerfilPeticion]] = ContextVar("perfil_actual", default=None)
+# Funciones que reciben cada perfil terminado (las usa presupuesto_consultas en los tests)
+_observadores = []
+
+
+def perfil_actual() -> Optional[PerfilPeticion]:
+    return _perfil_actual.get()
+
+def iniciar(metodo: str, ruta: str, activo: bool = True) -> PerfilPeticion:
+    """activo=False: perfil pendiente de que marcar_usuario lo active para un admin"""
+    perfil = PerfilPeticion(metodo, ruta, activo)
+    _perfil_actual.set(perfil)
+    return perfil
+
+def terminar(perfil: PerfilPeticion):
+    perfil.terminar()
+    for observador in list(_observadores):
+        observador(perfil)
+    datos = perfil.como_dict()
+    logger.info(
+        "Perfil %s %s: %s consultas, db=%sms, hash=%sms, total=%sms",
+        perfil.metodo, perfil.ruta, datos["consultas"], datos["db_ms"], datos["hash_ms"], datos["total_ms"],
+        extra={"datos": datos}
+    )
+    for candidata in datos["n1"]:
+        logger.warning("Posible N+1 en %s %s: %s veces %s", perfil.metodo, perfil.ruta, candidata["veces"], candidata["sentencia"])
+
+def marcar_usuario(usuario):
+    """
+    Lo llama la autenticación: la cabecera de perfilado solo se devuelve a
+    administradores, y solo para ellos se activa el perfil pedido con X-Perfil-SQL
+    """
+    perfil = _perfil_actual.get()
+    if perfil is not None:
+        perfil.es_admin = usuario.role == "admin"
+        perfil.activo = perfil.activo or perfil.es_admin
+
+def registrar_hash(duracion: float):
+    perfil = _perfil_actual.get()
+    if perfil is not None and perfil.activo:
+        perfil.registrar_hash(duracion)
+
+
+# Un solo listener para todos los engines (incluidos los de pruebas); sin perfil activo
+# (o inactivo) el coste es una lectura de ContextVar
+@event.listens_for(Engine, "before_cursor_execute")
+def _antes(conn, cursor, statement, parameters, context, executemany):
+    perfil = _perfil_actual.get()
+    if perfil is not None and perfil.activo:
+        conn.info.setdefault("perfil_inicio", []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _despues(conn, cursor, statement, parameters, context, executemany):
+    perfil = _perfil_actual.get()
+    pendientes = conn.info.get("perfil_inicio")
+    if perfil is not None and pendientes:
+        perfil.registrar_sentencia(statement, time.perf_counter() - pendientes.pop())
+
+@event.listens_for(Engine, "handle_error")
+def _error(contexto):
+    pendientes = contexto.connection.info.get("perfil_inicio") if contexto.connection is not None else None
+    if pendientes:
+        pendientes.pop()
+
+
+class PresupuestoExcedido(AssertionError):
+    """Una petición ejecutó más consultas SQL de las permitidas"""
+
+
+@contextmanager
+def presupuesto_consultas(maximo: int):
+    """
+    Para tests: perfila las peticiones hechas dentro del bloque y falla si
+    alguna ejecuta más de `maximo` sentencias SQL.
+
+        with presupuesto_consultas(2):
+            client.get("/citas/", headers=auth_headers)
+    """
+    global PERFIL_SQL
+    perfiles = []
+    anterior = PERFIL_SQL
+    PERFIL_SQL = True
+    _observadores.append(perfiles.append)
+    try:
+        yield perfiles
+    finally:
+        _observadores.remove(perfiles.append)
+        PERFIL_SQL = anterior
+    for perfil in perfiles:
+        if perfil.consultas > maximo:
+            detalle = "\n".join(f"  {veces}x {' '.join(s.split())}" for s, veces in perfil.sentencias.items())
+            raise PresupuestoExcedido(
+                f"{perfil.metodo} {perfil.ruta} ejecutó {perfil.consultas} consultas (máximo {maximo}):\n{detalle}"
+            )
@@ -0,0 +1,139 @@
+import asyncio
+import os
+import secrets
+import socket
+import time
+from typing import Optional
+from sqlalchemy import delete, insert, update
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+from app.models.liderazgo import Liderazgo
+from app.services import archivo_service, ciclo_service
+from app.utils.logging_config import get_logger
+
+logger = get_logger("planificador")
+
+# Ejecutar las tareas periódicas dentro de cada worker web; con "false" solo las
+# ejecuta `python worker.py`. Con varios workers, un arriendo en la tabla
+# liderazgo garantiza que cada tarea la ejecuta una sola instancia a la vez
+PLANIFICADOR = os.getenv("PLANIFICADOR", "true").lower() == "true"
+# Intervalos de arriendo por ejecución: si el titular deja de renovarlo durante
+# ese tiempo (proceso caído), otra instancia toma la tarea
+ARRIENDO_INTERVALOS = 3
+
+
+class ArriendoTareas:
+    """
+    Elección de líder por tarea sobre la tabla liderazgo, sin servicios externos.
+
+    Adquirir es un UPDATE condicionado (ya es el titular o el arriendo expiró)
+    y, si la tarea aún no tiene fila, un INSERT: la clave primaria deja pasar
+    a un solo proceso. El titular renueva el arriendo en cada ejecución.
+    """
+    def __init__(self, engine=None, titular: Optional[str] = None):
+        if engine is None:
+            from app.database import engine
+        self.engine = engine
+        self.titular = titular or f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+
+    def adquirir(self, tarea: str, duracion: float, ahora: Optional[float] = None) -> bool:
+        ahora = time.time() if ahora is None else ahora
+        tabla = Liderazgo.__table__
+        with self.engine.begin() as conn:
+            renovado = conn.execute(
+                update(tabla)
+                .where(tabla.c.tarea == tarea, (tabla.c.titular == self.titular) | (tabla.c.expira < ahora))
+                .values(titular=self.titular, expira=ahora + duracion)
+            ).rowcount
+        if renovado:
+            return True
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(insert(tabla).values(tarea=tarea, titular=self.titular, expira=ahora + duracion))
+            return True
+        except IntegrityError:
+            return False  # otra instancia tiene el arriendo vigente
+
+    def soltar(self, tarea: str):
+        tabla = Liderazgo.__table__
+        with self.engine.begin() as conn:
+            conn.execute(delete(tabla).where(tabla.c.tarea == tarea, tabla.c.titular == self.titular))
+
+
+class Planificador:
+    """
+    Ejecuta periódicamente las tareas (nombre, función(db), intervalo en
+    segundos) en el event loop actual. Cada función corre en el threadpool con
+    su propia sesión síncrona, solo si esta instancia tiene el arriendo de la
+    tarea. Un fallo se registra y la tarea se reintenta en el siguiente intervalo.
+    """
+    def __init__(self, tareas, arriendo: Optional[ArriendoTareas] = None, sesiones=None):
+        self.tareas = tuple(tareas)
+        self._arriendo = arriendo
+        self._sesiones = sesiones
+        self._proximas: dict = {}
+        self._tarea: Optional[asyncio.Task] = None
+
+    @property
+    def arriendo(self) -> ArriendoTareas:
+        if self._arriendo is None:
+            self._arriendo = ArriendoTareas()
+        return self._arriendo
+
+    def _ejecutar(self, funcion):
+        if self._sesiones is None:
+            from app.database import SessionLocal
+            self._sesiones = SessionLocal
+        db = self._sesiones()
+        try:
+            return funcion(db)
+        finally:
+            db.close()
+
+    async def ejecutar_pendientes(self, ahora: Optional[float] = None) -> dict:
+        """Ejecuta las tareas cuyo intervalo venció; devuelve {nombre: resultado} de las ejecutadas"""
+        ahora = time.time() if ahora is None else ahora
+        resultados = {}
+        for nombre, funcion, intervalo in self.tareas:
+            if self._proximas.get(nombre, 0) > ahora:
+                continue
+            self._proximas[nombre] = ahora + intervalo
+            try:
+                if not await run_in_threadpool(self.arriendo.adquirir, nombre, intervalo * ARRIENDO_INTERVALOS, ahora):
+                    continue
+                resultados[nombre] = await run_in_threadpool(self._ejecutar, funcion)
+            except Exception as e:
+                logger.error("Error en la tarea %s: %s", nombre, e)
+        return resultados
+
+    async def bucle(self):
+        espera = min((intervalo for _, _, intervalo in self.tareas), default=60)
+        while True:
+            await self.ejecutar_pendientes()
+            await asyncio.sleep(espera)
+
+    def iniciar(self):
+        """Desde el event loop (lifespan o worker.py)"""
+        if self._tarea is None or self._tarea.done():
+            self._tarea = asyncio.get_running_loop().create_task(self.bucle())
+            logger.info("Planificador iniciado (%s)", self.arriendo.titular)
+
+    async def detener(self):
+        """Cancela el bucle y suelta los arriendos para que otra instancia no espere a que expiren"""
+        if self._tarea is None:
+            return
+        self._tarea.cancel()
+        try:
+            await self._tarea
+        except asyncio.CancelledError:
+            pass
+        self._tarea = None
+        for nombre, _, _ in self.tareas:
+            try:
+                await run_in_threadpool(self.arriendo.soltar, nombre)
+            except Exception as e:
+                logger.error("Error al soltar el arriendo de %s: %s", nombre, e)
+
+
+# Instancia global; la inician el lifespan de la app (PLANIFICADOR) y worker.py
+planificador = Planificador(ciclo_service.TAREAS + archivo_service.TAREAS)
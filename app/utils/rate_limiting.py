@@ -1,59 +1,238 @@
 from fastapi import HTTPException, Request, status
-from datetime import datetime, timedelta
-from typing import Dict, Optional
+from typing import Optional
+from collections import OrderedDict
+import math
+import os
+import sqlite3
+import threading
 import time
-from collections import defaultdict
 from app.utils.logging_config import get_logger
+from app.utils.metricas import ips_sin_seguimiento, rechazos_rate_limit
 
 logger = get_logger("rate_limiting")
 
+# Configuración de límites
+RATE_LIMIT_MAX_ATTEMPTS = int(os.getenv("RATE_LIMIT_MAX_ATTEMPTS", "5"))
+RATE_LIMIT_WINDOW_MINUTES = float(os.getenv("RATE_LIMIT_WINDOW_MINUTES", "15"))
+RATE_LIMIT_LOCKOUT_MINUTES = float(os.getenv("RATE_LIMIT_LOCKOUT_MINUTES", "30"))
+# Almacén de contadores: "memoria" (por proceso) o "sqlite" (compartido entre workers del mismo host)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memoria")
+RATE_LIMIT_SQLITE_PATH = os.getenv("RATE_LIMIT_SQLITE_PATH", "./rate_limit.db")
+# Máximo de IPs seguidas en memoria; al superarlo se descartan las menos recientes de las no
+# bloqueadas, y si todas están bloqueadas las IPs nuevas no se siguen (ni se bloquean)
+RATE_LIMIT_MAX_CLAVES = int(os.getenv("RATE_LIMIT_MAX_CLAVES", "100000"))
+
+
+class Contador:
+    """Estado de una clave: ventana fija de intentos y fin del bloqueo (epoch)"""
+    __slots__ = ("inicio", "intentos", "bloqueado_hasta", "actualizado")
+
+    def __init__(self, ahora: float):
+        self.inicio = ahora
+        self.intentos = 0
+        self.bloqueado_hasta = 0.0
+        self.actualizado = ahora
+
+
+class AlmacenMemoria:
+    """
+    Contadores en dos OrderedDict: las claves sin bloqueo, ordenadas por última
+    actividad, y las bloqueadas, ordenadas por fin del bloqueo (su duración es fija).
+
+    Cada clave ocupa un Contador de tamaño fijo. En cada registro se barren
+    desde el principio las claves inactivas durante más de `retencion` segundos
+    y los bloqueos vencidos (coste amortizado O(1)), y nunca hay más de
+    max_claves. Para hacer sitio se desalojan las claves sin bloqueo menos
+    recientes; un bloqueo vigente nunca se descarta. Si todas las plazas están
+    bloqueadas, los fallos de claves nuevas no se cuentan (se suman a
+    sin_seguimiento y a la métrica rate_limit_untracked_total) hasta que venza
+    algún bloqueo: llenar la tabla de bloqueos no deja fuera a las demás IPs.
+    """
+    def __init__(self, max_claves: int = RATE_LIMIT_MAX_CLAVES):
+        self.max_claves = max_claves
+        self._contadores: "OrderedDict[str, Contador]" = OrderedDict()
+        self._bloqueados: "OrderedDict[str, Contador]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.desalojadas = 0
+        self.sin_seguimiento = 0
+
+    def registrar_fallo(self, clave: str, ahora: float, ventana: float, max_intentos: int, bloqueo: float) -> float:
+        """Suma un fallo y devuelve bloqueado_hasta (0 si la clave no queda bloqueada)"""
+        with self._lock:
+            self._barrer(ahora, max(ventana, bloqueo))
+            contador = self._bloqueados.get(clave) or self._contadores.get(clave)
+            if contador is None:
+                if not self._hacer_sitio():
+                    self.sin_seguimiento += 1
+                    ips_sin_seguimiento.inc()
+                    return 0.0
+                contador = self._contadores[clave] = Contador(ahora)
+            elif clave in self._contadores:
+                self._contadores.move_to_end(clave)
+            if contador.inicio <= ahora - ventana:
+                contador.inicio, contador.intentos = ahora, 0
+            contador.intentos += 1
+            if contador.intentos >= max_intentos:
+                contador.intentos = 0
+                contador.bloqueado_hasta = ahora + bloqueo
+                self._contadores.pop(clave, None)
+                self._bloqueados.pop(clave, None)
+                self._bloqueados[clave] = contador
+            contador.actualizado = ahora
+            return contador.bloqueado_hasta
+
+    def bloqueado_hasta(self, clave: str, ahora: float) -> float:
+        with self._lock:
+            contador = self._bloqueados.get(clave) or self._contadores.get(clave)
+            return contador.bloqueado_hasta if contador else 0.0
+
+    def limpiar(self, clave: str):
+        with self._lock:
+            self._contadores.pop(clave, None)
+            self._bloqueados.pop(clave, None)
+
+    def limpiar_todo(self):
+        with self._lock:
+            self._contadores.clear()
+            self._bloqueados.clear()
+
+    def _barrer(self, ahora: float, retencion: float):
+        # Un bloqueo vencido deja el contador a cero: equivale a no tenerlo
+        while self._bloqueados and next(iter(self._bloqueados.values())).bloqueado_hasta <= ahora:
+            self._bloqueados.popitem(last=False)
+        while self._contadores and next(iter(self._contadores.values())).actualizado <= ahora - retencion:
+            self._contadores.popitem(last=False)
+
+    def _hacer_sitio(self) -> bool:
+        """Desaloja claves sin bloqueo, las menos recientes primero; False si solo quedan bloqueadas"""
+        while len(self._contadores) + len(self._bloqueados) >= self.max_claves:
+            if not self._contadores:
+                return False
+            self._contadores.popitem(last=False)
+            self.desalojadas += 1
+        return True
+
+    def __len__(self):
+        return len(self._contadores) + len(self._bloqueados)
+
+
+class AlmacenSQLite:
+    """
+    Contadores en un archivo SQLite compartido por todos los workers del host.
+
+    Cada fallo es un único UPSERT atómico, así que varios procesos pueden
+    registrar a la vez sin perder intentos. Las filas inactivas se borran cada
+    `barrer_cada` registros.
+    """
+    def __init__(self, ruta: str = RATE_LIMIT_SQLITE_PATH, barrer_cada: int = 1000):
+        self.ruta = ruta
+        self.barrer_cada = barrer_cada
+        self._registros = 0
+        self._lock = threading.Lock()
+        self._conexion = sqlite3.connect(ruta, timeout=5, isolation_level=None, check_same_thread=False)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute("PRAGMA synchronous=NORMAL")
+        self._conexion.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit ("
+            "clave TEXT PRIMARY KEY, inicio REAL NOT NULL, intentos INTEGER NOT NULL, "
+            "bloqueado_hasta REAL NOT NULL, actualizado REAL NOT NULL) WITHOUT ROWID"
+        )
+        self._conexion.execute("CREATE INDEX IF NOT EXISTS ix_rate_limit_actualizado ON rate_limit (actualizado)")
+
+    def registrar_fallo(self, clave: str, ahora: float, ventana: float, max_intentos: int, bloqueo: float) -> float:
+        parametros = {"clave": clave, "ahora": ahora, "limite": ahora - ventana,
+                      "max": max_intentos, "hasta": ahora + bloqueo}
+        # En el UPDATE todas las expresiones ven los valores anteriores de la fila
+        nuevos_intentos = "CASE WHEN inicio <= :limite THEN 1 ELSE intentos + 1 END"
+        with self._lock:
+            fila = self._conexion.execute(
+                "INSERT INTO rate_limit (clave, inicio, intentos, bloqueado_hasta, actualizado) "
+                "VALUES (:clave, :ahora, CASE WHEN 1 >= :max THEN 0 ELSE 1 END, "
+                "CASE WHEN 1 >= :max THEN :hasta ELSE 0 END, :ahora) "
+                "ON CONFLICT(clave) DO UPDATE SET "
+                f"inicio = CASE WHEN inicio <= :limite THEN :ahora ELSE inicio END, "
+                f"intentos = CASE WHEN {nuevos_intentos} >= :max THEN 0 ELSE {nuevos_intentos} END, "
+                f"bloqueado_hasta = CASE WHEN {nuevos_intentos} >= :max THEN :hasta ELSE bloqueado_hasta END, "
+                "actualizado = :ahora "
+                "RETURNING bloqueado_hasta",
+                parametros
+            ).fetchone()
+            self._registros += 1
+            if self._registros % self.barrer_cada == 0:
+                self._barrer(ahora, max(ventana, bloqueo))
+        return fila[0]
+
+    def bloqueado_hasta(self, clave: str, ahora: float) -> float:
+        with self._lock:
+            fila = self._conexion.execute(
+                "SELECT bloqueado_hasta FROM rate_limit WHERE clave = ?", (clave,)
+            ).fetchone()
+        return fila[0] if fila else 0.0
+
+    def limpiar(self, clave: str):
+        with self._lock:
+            self._conexion.execute("DELETE FROM rate_limit WHERE clave = ?", (clave,))
+
+    def limpiar_todo(self):
+        with self._lock:
+            self._conexion.execute("DELETE FROM rate_limit")
+
+    def _barrer(self, ahora: float, retencion: float):
+        self._conexion.execute(
+            "DELETE FROM rate_limit WHERE actualizado <= ? AND bloqueado_hasta <= ?",
+            (ahora - retencion, ahora)
+        )
+
+    def __len__(self):
+        with self._lock:
+            return self._conexion.execute("SELECT COUNT(*) FROM rate_limit").fetchone()[0]
+
+
+def crear_almacen(backend: str = RATE_LIMIT_BACKEND):
+    if backend == "sqlite":
+        return AlmacenSQLite()
+    if backend != "memoria":
+        raise ValueError(f"RATE_LIMIT_BACKEND no soportado: {backend}")
+    return AlmacenMemoria()
+
+
 class RateLimiter:
-    def __init__(self):
-        # Almacenar intentos por IP
-        self.attempts: Dict[str, list] = defaultdict(list)
+    def __init__(self, almacen=None):
+        # Contadores por IP (en memoria o compartidos entre procesos)
+        self.almacen = almacen if almacen is not None else crear_almacen()
         # Configuración de límites
-        self.max_attempts = 5  # Máximo 5 intentos
-        self.window_minutes = 15  # En 15 minutos
-        self.lockout_minutes = 30  # Bloqueo por 30 minutos
-        
+        self.max_attempts = RATE_LIMIT_MAX_ATTEMPTS  # Máximo de intentos fallidos
+        self.window_minutes = RATE_LIMIT_WINDOW_MINUTES  # En esta ventana
+        self.lockout_minutes = RATE_LIMIT_LOCKOUT_MINUTES  # Duración del bloqueo
+
     def is_rate_limited(self, ip: str) -> tuple[bool, Optional[str]]:
         """
         Verifica si una IP está rate limited
         Retorna: (is_limited, message)
         """
-        now = datetime.now()
-        window_start = now - timedelta(minutes=self.window_minutes)
-        
-        # Limpiar intentos antiguos
-        self.attempts[ip] = [
-            attempt_time for attempt_time in self.attempts[ip] 
-            if attempt_time > window_start
-        ]
-        
-        # Verificar si está en período de bloqueo
-        if self.attempts[ip]:
-            last_attempt = max(self.attempts[ip])
-            if now - last_attempt < timedelta(minutes=self.lockout_minutes):
-                remaining_time = self.lockout_minutes - (now - last_attempt).total_seconds() / 60
-                return True, f"Demasiados intentos fallidos. Intenta nuevamente en {int(remaining_time)} minutos"
-        
-        # Verificar límite de intentos
-        if len(self.attempts[ip]) >= self.max_attempts:
-            logger.warning(f"Rate limit excedido para IP: {ip}")
-            return True, f"Demasiados intentos fallidos. Intenta nuevamente en {self.lockout_minutes} minutos"
-        
+        ahora = time.time()
+        restante = self.almacen.bloqueado_hasta(ip, ahora) - ahora
+        if restante > 0:
+            return True, f"Demasiados intentos fallidos. Intenta nuevamente en {math.ceil(restante / 60)} minutos"
         return False, None
-    
+
     def record_failed_attempt(self, ip: str):
         """Registra un intento fallido"""
-        self.attempts[ip].append(datetime.now())
-        logger.info(f"Intento fallido registrado para IP: {ip}")
-    
+        bloqueado_hasta = self.almacen.registrar_fallo(
+            ip, time.time(), self.window_minutes * 60, self.max_attempts, self.lockout_minutes * 60
+        )
+        if bloqueado_hasta > time.time():
+            logger.warning("Rate limit excedido para IP: %s", ip)
+        else:
+            logger.info("Intento fallido registrado para IP: %s", ip)
+
     def clear_attempts(self, ip: str):
         """Limpia los intentos fallidos (para login exitoso)"""
-        if ip in self.attempts:
-            del self.attempts[ip]
-            logger.info(f"Intentos limpiados para IP: {ip}")
+        self.almacen.limpiar(ip)
+
+    def limpiar(self):
+        """Olvida todas las IPs"""
+        self.almacen.limpiar_todo()
 
 # Instancia global del rate limiter
 rate_limiter = RateLimiter()
@@ -61,13 +240,14 @@ rate_limiter = RateLimiter()
 def check_rate_limit(request: Request) -> None:
     """Middleware para verificar rate limiting"""
     client_ip = request.client.host
-    
+
     is_limited, message = rate_limiter.is_rate_limited(client_ip)
     if is_limited:
+        rechazos_rate_limit.inc()
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             detail=message,
-            headers={"Retry-After": str(rate_limiter.lockout_minutes * 60)}
+            headers={"Retry-After": str(int(rate_limiter.lockout_minutes * 60))}
         )
 
 def record_failed_login(request: Request):
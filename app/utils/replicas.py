@@ -0,0 +1,227 @@
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event, text
+from sqlalchemy.exc import InterfaceError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.utils.logging_config import get_logger
+
+logger = get_logger("replicas")
+
+# Réplicas de solo lectura (las URLs están en DATABASE_REPLICA_URLS, ver app/database.py)
+# round_robin o menos_conexiones (la réplica con menos conexiones en uso en este proceso)
+REPLICA_SELECCION = os.getenv("REPLICA_SELECCION", "round_robin")
+# Segundos que un usuario lee del primario después de escribir
+REPLICA_VENTANA_ESCRITURA = float(os.getenv("REPLICA_VENTANA_ESCRITURA", "5"))
+# Segundos que una réplica que ha fallado queda fuera antes de volver a probarla
+REPLICA_REINTENTO = float(os.getenv("REPLICA_REINTENTO", "30"))
+# Usuarios con escrituras recientes que se recuerdan como máximo
+REPLICA_MAX_USUARIOS = 100_000
+
+SELECCIONES = ("round_robin", "menos_conexiones")
+# Errores que indican una réplica inaccesible (no un error de la consulta)
+ERRORES_CONEXION = (OperationalError, InterfaceError)
+
+# Engine de la réplica elegida para la lectura en curso; None = primario
+_engine_lectura: ContextVar = ContextVar("engine_lectura", default=None)
+# Usuario autenticado de la petición, para recordar sus escrituras
+_usuario_actual: ContextVar[Optional[int]] = ContextVar("usuario_replicas", default=None)
+
+
+class SesionEnrutada(Session):
+    """
+    Sesión que ejecuta en la réplica elegida mientras dura una lectura
+    enrutada (ver EnrutadorReplicas.leer) y en el primario en cualquier otro
+    caso, incluido todo flush.
+    """
+    def get_bind(self, mapper=None, clause=None, **kw):
+        engine = _engine_lectura.get()
+        if engine is not None and not self._flushing:
+            return engine
+        return super().get_bind(mapper=mapper, clause=clause, **kw)
+
+
+@event.listens_for(SesionEnrutada, "after_flush")
+def _marcar_escritura(sesion, contexto):
+    sesion.info["escribio"] = True
+
+@event.listens_for(SesionEnrutada, "do_orm_execute")
+def _marcar_escritura_dml(estado):
+    # insert()/update()/delete() ejecutados con session.execute no pasan por el flush
+    if estado.is_insert or estado.is_update or estado.is_delete:
+        estado.session.info["escribio"] = True
+
+@event.listens_for(SesionEnrutada, "after_commit")
+def _recordar_escritura(sesion):
+    if sesion.info.pop("escribio", False):
+        enrutador_replicas.registrar_escritura(_usuario_actual.get())
+
+@event.listens_for(SesionEnrutada, "after_rollback")
+def _descartar_escritura(sesion):
+    sesion.info.pop("escribio", None)
+
+
+def marcar_usuario(usuario):
+    """Lo llama la autenticación: las escrituras de la petición se atribuyen a este usuario"""
+    _usuario_actual.set(usuario.id)
+
+
+def _sesion(args, kwargs):
+    for valor in itertools.chain(args, kwargs.values()):
+        if isinstance(valor, (Session, AsyncSession)):
+            return valor
+    return None
+
+
+class EnrutadorReplicas:
+    """
+    Reparte las lecturas entre las réplicas.
+
+    Las réplicas que dan un error de conexión quedan fuera `reintento`
+    segundos y la lectura se repite en el primario; pasado ese tiempo se
+    comprueban con un SELECT 1 antes de volver a usarlas. Sin réplicas sanas
+    todo va al primario.
+
+    Un usuario que acaba de escribir lee del primario durante
+    `ventana_escritura` segundos para ver sus propios cambios. Se recuerda en
+    este proceso; con varios workers, otro worker puede servirle una réplica
+    con retraso dentro de esa ventana.
+    """
+    def __init__(self, replicas=(), seleccion: str = REPLICA_SELECCION,
+                 ventana_escritura: float = REPLICA_VENTANA_ESCRITURA, reintento: float = REPLICA_REINTENTO):
+        if seleccion not in SELECCIONES:
+            raise ValueError(f"REPLICA_SELECCION no soportada: {seleccion}")
+        self.seleccion = seleccion
+        self.ventana_escritura = ventana_escritura
+        self.reintento = reintento
+        self._escrituras: "OrderedDict[int, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.configurar(replicas)
+
+    def configurar(self, replicas):
+        """Engines de las réplicas (AsyncEngine en modo async)"""
+        with self._lock:
+            self.replicas = list(replicas)
+            # Índice de réplica -> momento (monotonic) a partir del cual se vuelve a probar
+            self.caidas: dict[int, float] = {}
+            self._turno = itertools.count()
+
+    # --- Lectura propia ----------------------------------------------------
+
+    def registrar_escritura(self, usuario_id: Optional[int]):
+        if usuario_id is None or not self.replicas or self.ventana_escritura <= 0:
+            return
+        with self._lock:
+            self._escrituras[usuario_id] = time.monotonic() + self.ventana_escritura
+            self._escrituras.move_to_end(usuario_id)
+            while len(self._escrituras) > REPLICA_MAX_USUARIOS:
+                self._escrituras.popitem(last=False)
+
+    def fijado_al_primario(self, usuario_id: Optional[int]) -> bool:
+        if usuario_id is None:
+            return False
+        with self._lock:
+            hasta = self._escrituras.get(usuario_id)
+            if hasta is None:
+                return False
+            if hasta < time.monotonic():
+                del self._escrituras[usuario_id]
+                return False
+            return True
+
+    def limpiar(self):
+        """Olvida las escrituras recientes y el estado de salud de las réplicas"""
+        with self._lock:
+            self._escrituras.clear()
+            self.caidas.clear()
+
+    # --- Selección ---------------------------------------------------------
+
+    def elegir(self) -> Optional[tuple[int, bool]]:
+        """(índice de réplica, hay que probarla antes) o None para leer del primario"""
+        if not self.replicas or self.fijado_al_primario(_usuario_actual.get()):
+            return None
+        ahora = time.monotonic()
+        with self._lock:
+            disponibles = [i for i in range(len(self.replicas)) if self.caidas.get(i, 0) <= ahora]
+            if not disponibles:
+                return None
+            if self.seleccion == "menos_conexiones":
+                indice = min(disponibles, key=lambda i: _en_uso(self.replicas[i]))
+            else:
+                indice = disponibles[next(self._turno) % len(disponibles)]
+            return indice, indice in self.caidas
+
+    def marcar_caida(self, indice: int, error: Exception):
+        with self._lock:
+            self.caidas[indice] = time.monotonic() + self.reintento
+        logger.warning("Réplica %s fuera de servicio durante %ss: %s", indice, self.reintento, error)
+
+    def _recuperada(self, indice: int):
+        with self._lock:
+            self.caidas.pop(indice, None)
+        logger.info("Réplica %s de nuevo en servicio", indice)
+
+    # --- Ejecución ---------------------------------------------------------
+
+    def leer(self, funcion, *args, **kwargs):
+        """Ejecuta una función de servicio de solo lectura (síncrona) en una réplica"""
+        eleccion = self.elegir()
+        if eleccion is None:
+            return funcion(*args, **kwargs)
+        indice, probar = eleccion
+        engine = self.replicas[indice]
+        try:
+            if probar:
+                with engine.connect() as conexion:
+                    conexion.execute(text("SELECT 1"))
+                self._recuperada(indice)
+            token = _engine_lectura.set(engine)
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                _engine_lectura.reset(token)
+        except ERRORES_CONEXION as e:
+            self.marcar_caida(indice, e)
+            sesion = _sesion(args, kwargs)
+            if sesion is not None:
+                sesion.rollback()
+        return funcion(*args, **kwargs)
+
+    async def leer_async(self, funcion, *args, **kwargs):
+        """Versión de leer() para las funciones de los servicios async"""
+        eleccion = self.elegir()
+        if eleccion is None:
+            return await funcion(*args, **kwargs)
+        indice, probar = eleccion
+        engine = self.replicas[indice]
+        try:
+            if probar:
+                async with engine.connect() as conexion:
+                    await conexion.execute(text("SELECT 1"))
+                self._recuperada(indice)
+            token = _engine_lectura.set(engine.sync_engine)
+            try:
+                return await funcion(*args, **kwargs)
+            finally:
+                _engine_lectura.reset(token)
+        except ERRORES_CONEXION as e:
+            self.marcar_caida(indice, e)
+            sesion = _sesion(args, kwargs)
+            if sesion is not None:
+                await sesion.rollback()
+        return await funcion(*args, **kwargs)
+
+
+def _en_uso(engine) -> int:
+    pool = getattr(engine, "sync_engine", engine).pool
+    return pool.checkedout() if hasattr(pool, "checkedout") else 0
+
+
+# Instancia global; app/database.py le pasa los engines de DATABASE_REPLICA_URLS
+enrutador_replicas = EnrutadorReplicas()
@@ -3,11 +3,17 @@ import os
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import HTTPException, status, Depends
 from sqlalchemy.orm import Session
 from app.models.user import User
+from app.schemas.user import UserOut
 from app.database import get_db
+from app.services import user_service, user_service_async
+from app.utils.database_utils import ServicioDual
+from app.utils.hasher import hasher
+from app.utils.cache_principal import cache_principales
+from app.utils.metricas import fallos_autenticacion
+from app.utils import perfilador, replicas
 from fastapi.security import OAuth2PasswordBearer
 
 # Configuración de JWT
@@ -15,16 +21,18 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Incluir id, rol y versión de acceso en el token (además de `sub`)
+JWT_CLAIMS_EXTENDIDOS = os.getenv("JWT_CLAIMS_EXTENDIDOS", "false").lower() == "true"
 
-# Contexto para hashing de contraseñas
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-# Funciones de seguridad
+# Funciones de seguridad (bcrypt se ejecuta en el pool de procesos del hasher)
 def verificar_contraseña(contraseña_plana: str, contraseña_hash: str) -> bool:
-    return pwd_context.verify(contraseña_plana, contraseña_hash)
+    return hasher.verificar(contraseña_plana, contraseña_hash)
 
 def obtener_hash_contraseña(contraseña: str) -> str:
-    return pwd_context.hash(contraseña)
+    return hasher.hash(contraseña)
+
+def obtener_hashes_contraseñas(contraseñas: list[str]) -> list[str]:
+    return hasher.hash_lote(contraseñas)
 
 def crear_token_acceso(data: dict, expiración: timedelta | None = None) -> str:
     to_encode = data.copy()
@@ -32,28 +40,66 @@ def crear_token_acceso(data: dict, expiración: timedelta | None = None) -> str:
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+def version_acceso(usuario) -> str:
+    """Cambia cuando el usuario cambia de rol o se activa/desactiva"""
+    return f"{usuario.role}:{int(bool(usuario.is_active))}"
+
+def claims_usuario(usuario) -> dict:
+    datos = {"sub": usuario.username}
+    if JWT_CLAIMS_EXTENDIDOS:
+        datos.update({"uid": usuario.id, "role": usuario.role, "ver": version_acceso(usuario)})
+    return datos
+
+def sujeto_token(token: str) -> str | None:
+    """`sub` de un token válido, sin consultar la base de datos; None si no es válido"""
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+    except JWTError:
+        return None
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
-def obtener_usuario_actual(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
-    cred_excep = HTTPException(
+servicio_usuarios = ServicioDual(user_service, user_service_async)
+
+def _credenciales_invalidas(motivo: str) -> HTTPException:
+    fallos_autenticacion.labels(motivo).inc()
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="No se pudieron validar las credenciales",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+async def obtener_usuario_actual(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> UserOut:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
-            raise cred_excep
+            raise _credenciales_invalidas("token_invalido")
     except JWTError:
-        raise cred_excep
+        raise _credenciales_invalidas("token_invalido")
 
-    usuario = db.query(User).filter(User.username == username).first()
+    # La mayoría de las peticiones se resuelven desde la caché sin tocar la base de datos.
+    # Sin ella se consulta el usuario aunque el token traiga uid/role/ver: esos claims
+    # describen al usuario al emitir el token, y solo la fila actual revela una
+    # desactivación o cambio de rol posterior (la invalidación vacía la caché)
+    usuario = cache_principales.obtener(username)
     if usuario is None:
-        raise cred_excep
+        usuario_db = await servicio_usuarios.obtener_usuario_por_username(username, db)
+        if usuario_db is None:
+            raise _credenciales_invalidas("usuario_inexistente")
+        usuario = UserOut.model_validate(usuario_db)
+        cache_principales.guardar(usuario)
+
+    if not usuario.is_active:
+        raise _credenciales_invalidas("usuario_inactivo")
+    # Tokens emitidos antes de un cambio de rol o desactivación dejan de ser válidos
+    if "ver" in payload and payload["ver"] != version_acceso(usuario):
+        raise _credenciales_invalidas("token_revocado")
+    perfilador.marcar_usuario(usuario)
+    replicas.marcar_usuario(usuario)
     return usuario
 
-def verificar_admin(usuario: User = Depends(obtener_usuario_actual)):
+async def verificar_admin(usuario: UserOut = Depends(obtener_usuario_actual)):
     if usuario.role != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
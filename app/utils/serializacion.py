@@ -0,0 +1,147 @@
+from datetime import datetime, timezone
+from enum import Enum
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+from app.utils.respuestas import respuesta_exito
+
+# Serialización directa a bytes para los listados: evita que FastAPI recorra
+# cada instancia ORM con jsonable_encoder (ver benchmarks/bench_serializacion.py)
+try:
+    import orjson
+
+    def a_json(datos) -> bytes:
+        return orjson.dumps(datos)
+except ImportError:  # pragma: no cover - pydantic_core siempre está disponible
+    from pydantic_core import to_json as a_json
+
+# MessagePack es opcional: sin la librería los listados solo se sirven en JSON
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+TIPO_JSON = "application/json"
+TIPO_MSGPACK = "application/msgpack"
+TIPOS_MSGPACK = {TIPO_MSGPACK, "application/x-msgpack", "application/vnd.msgpack"}
+# Elementos de una lista que se empaquetan juntos en cada trozo de la respuesta
+TROZO_MSGPACK = 500
+
+
+def filas(instancias, esquema) -> list[dict]:
+    """
+    Convierte instancias ORM en diccionarios con los campos del esquema de
+    salida (p. ej. CitaOut), leyendo los valores ya cargados en la instancia.
+    """
+    campos = tuple(esquema.model_fields)
+    resultado = []
+    for instancia in instancias:
+        cargados = instancia.__dict__
+        try:
+            resultado.append({campo: cargados[campo] for campo in campos})
+        except KeyError:
+            # Atributo expirado o diferido: que lo cargue el ORM
+            resultado.append({campo: getattr(instancia, campo) for campo in campos})
+    return resultado
+
+
+def respuesta_exito_json(mensaje: str, datos: dict = None) -> Response:
+    """Como respuesta_exito, pero ya codificada; `datos` solo debe contener tipos JSON, fechas y enums"""
+    return Response(content=a_json(respuesta_exito(mensaje, datos)), media_type="application/json")
+
+
+def negociar_formato(request: Request) -> str:
+    """"json" o "msgpack" según la cabecera Accept (con pesos q); JSON si hay empate o no se indica"""
+    if msgpack is None:
+        return "json"
+    pesos = {"json": -1.0, "msgpack": -1.0}
+    for rango in request.headers.get("accept", "").split(","):
+        tipo, _, parametros = rango.partition(";")
+        tipo = tipo.strip().lower()
+        q = 1.0
+        for parametro in parametros.split(";"):
+            nombre, _, valor = parametro.partition("=")
+            if nombre.strip() == "q":
+                try:
+                    q = float(valor)
+                except ValueError:
+                    q = 0.0
+        if tipo in TIPOS_MSGPACK:
+            pesos["msgpack"] = max(pesos["msgpack"], q)
+        elif tipo in (TIPO_JSON, "application/*", "*/*"):
+            pesos["json"] = max(pesos["json"], q)
+    return "msgpack" if pesos["msgpack"] > 0 and pesos["msgpack"] > pesos["json"] else "json"
+
+
+def _msgpack_default(valor):
+    # Fechas sin zona que no pasaron por _fechas_utc (ver abajo)
+    if isinstance(valor, datetime):
+        return valor.replace(tzinfo=timezone.utc)
+    if isinstance(valor, Enum):
+        return valor.value
+    raise TypeError(f"No se puede serializar {type(valor).__name__} en MessagePack")
+
+
+def _fechas_utc(valor):
+    """
+    Las fechas se guardan sin zona horaria, en UTC. Msgpack solo empaqueta en
+    C (como Timestamp, extensión -1) las que tienen zona, y pasar cada una por
+    `default` cuesta cinco veces más; en las listas de filas se marcan de una
+    vez las columnas que en la primera fila son fechas.
+    """
+    if isinstance(valor, dict):
+        for clave, elemento in valor.items():
+            if isinstance(elemento, (dict, list)):
+                _fechas_utc(elemento)
+    elif isinstance(valor, list) and valor and isinstance(valor[0], dict):
+        columnas = [clave for clave, elemento in valor[0].items() if isinstance(elemento, datetime)]
+        # replace() es lo caro; los horarios se repiten y created_at suele ser igual a updated_at
+        convertidas = {}
+        for fila in valor:
+            for columna in columnas:
+                fecha = fila[columna]
+                if fecha is not None and fecha.tzinfo is None:
+                    con_zona = convertidas.get(fecha)
+                    if con_zona is None:
+                        con_zona = convertidas[fecha] = fecha.replace(tzinfo=timezone.utc)
+                    fila[columna] = con_zona
+
+
+def _packer():
+    return msgpack.Packer(default=_msgpack_default, datetime=True)
+
+
+def _empaquetar(packer, valor):
+    """Genera el MessagePack de `valor` por partes: las listas largas salen en trozos de TROZO_MSGPACK"""
+    if isinstance(valor, dict):
+        yield packer.pack_map_header(len(valor))
+        for clave, elemento in valor.items():
+            yield packer.pack(clave)
+            yield from _empaquetar(packer, elemento)
+    elif isinstance(valor, list) and len(valor) > TROZO_MSGPACK:
+        yield packer.pack_array_header(len(valor))
+        for inicio in range(0, len(valor), TROZO_MSGPACK):
+            yield b"".join(packer.pack(elemento) for elemento in valor[inicio:inicio + TROZO_MSGPACK])
+    else:
+        yield packer.pack(valor)
+
+
+def a_msgpack(datos) -> bytes:
+    """Modifica `datos`: las fechas sin zona pasan a tener zona UTC"""
+    _fechas_utc(datos)
+    return b"".join(_empaquetar(_packer(), datos))
+
+
+def respuesta_exito_formato(formato: str, mensaje: str, datos: dict = None) -> Response:
+    """
+    respuesta_exito en el formato negociado. En MessagePack el cuerpo se envía
+    en streaming y las fechas van como Timestamp; `datos` se modifica.
+    """
+    if formato == "msgpack":
+        sobre = respuesta_exito(mensaje, datos)
+        _fechas_utc(sobre)
+        partes = _empaquetar(_packer(), sobre)
+        respuesta = StreamingResponse(partes, media_type=TIPO_MSGPACK)
+    else:
+        respuesta = respuesta_exito_json(mensaje, datos)
+    respuesta.headers["Vary"] = "Accept"
+    return respuesta
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark: coste de los clientes conectados a /citas/stream.
+
+Abre --clientes suscripciones de pacientes (más --admins que reciben todo),
+cada una con su tarea consumiendo flujo_sse como haría la respuesta, y mide
+la memoria por cliente en reposo y el tiempo de publicar un evento (que solo
+se entrega a los administradores y al paciente de la cita).
+
+Uso:
+    python benchmarks/bench_eventos.py [--clientes 10000] [--admins 20] [--eventos 2000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.eventos import BrokerCitas
+
+
+async def consumir(broker, suscripcion, recibidos):
+    async for _ in broker.flujo_sse(suscripcion):
+        recibidos[0] += 1
+
+
+async def medir(clientes, admins, eventos):
+    broker = BrokerCitas(latido=3600)
+    recibidos = [0]
+    tracemalloc.start()
+    antes = tracemalloc.get_traced_memory()[0]
+    tareas = [
+        asyncio.create_task(consumir(broker, broker.suscribir(None if i < admins else i), recibidos))
+        for i in range(clientes + admins)
+    ]
+    await asyncio.sleep(0)
+    memoria = (tracemalloc.get_traced_memory()[0] - antes) / len(tareas)
+    tracemalloc.stop()
+
+    cita = {"id": 1, "paciente_id": 0, "recurso_id": None, "motivo": "Cardiología",
+            "fecha_hora": datetime(2030, 1, 7, 10), "estado": "programada", "notas": None}
+    esperados = recibidos[0]
+    inicio = time.perf_counter()
+    for i in range(eventos):
+        cita["paciente_id"] = admins + i % clientes
+        broker.publicar("editada", [cita])
+        esperados += admins + 1
+        while recibidos[0] < esperados:
+            await asyncio.sleep(0)
+    duracion = time.perf_counter() - inicio
+
+    for tarea in tareas:
+        tarea.cancel()
+    await asyncio.gather(*tareas, return_exceptions=True)
+    return memoria, duracion / eventos * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clientes", type=int, default=10_000)
+    parser.add_argument("--admins", type=int, default=20)
+    parser.add_argument("--eventos", type=int, default=2000)
+    args = parser.parse_args()
+
+    memoria, por_evento = asyncio.run(medir(args.clientes, args.admins, args.eventos))
+    print(f"{args.clientes} pacientes y {args.admins} administradores conectados")
+    print(f"{'memoria por cliente en reposo':<36}{memoria / 1024:>10.1f} KiB")
+    print(f"{'publicar y entregar un evento':<36}{por_evento:>10.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Benchmark: memoria y throughput de la exportación en streaming de citas.
+
+Carga N citas en un SQLite temporal y las recorre con el mismo pipeline que
+usa GET /citas/admin/exportar (exportar_citas + generar_exportacion),
+midiendo el RSS máximo del proceso cada cierto número de filas.
+
+Uso:
+    python benchmarks/bench_exportacion.py [--filas 1000000] [--formato csv]
+"""
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models.cita import Cita
+from app.models.user import User
+from app.services.cita_service import exportar_citas, COLUMNAS_EXPORTACION
+from app.utils.exportacion import generar_exportacion
+
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def poblar(engine, filas, lote=50_000):
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"username": "bench", "email": "bench@example.com", "full_name": "Bench",
+                                     "hashed_password": "x", "role": "paciente"}])
+        base = datetime(2030, 1, 1, 8, 0)
+        for inicio in range(0, filas, lote):
+            conn.execute(insert(Cita), [
+                {"motivo": "Medicina General", "fecha_hora": base + timedelta(minutes=i), "paciente_id": 1,
+                 "estado": "programada", "notas": "Consulta de rutina"}
+                for i in range(inicio, min(inicio + lote, filas))
+            ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=1_000_000)
+    parser.add_argument("--formato", choices=["ndjson", "csv"], default="ndjson")
+    args = parser.parse_args()
+
+    ruta_db = os.path.join(tempfile.mkdtemp(), "bench_export.db")
+    engine = create_engine(f"sqlite:///{ruta_db}")
+    Base.metadata.create_all(bind=engine)
+    poblar(engine, args.filas)
+    rss_inicial = rss_mb()
+
+    columnas = [c.key for c in COLUMNAS_EXPORTACION]
+    with sessionmaker(bind=engine)() as db:
+        inicio = time.perf_counter()
+        bytes_totales = 0
+        filas_leidas = 0
+        muestras = []
+        for fragmento in generar_exportacion(exportar_citas(db), columnas, args.formato):
+            bytes_totales += len(fragmento)
+            filas_leidas += fragmento.count("\n")
+            if filas_leidas // 100_000 > len(muestras):
+                muestras.append((filas_leidas, rss_mb()))
+        duracion = time.perf_counter() - inicio
+
+    print(f"filas: {args.filas}  formato: {args.formato}  MB generados: {bytes_totales / 1e6:.1f}")
+    print(f"filas/s: {args.filas / duracion:,.0f}")
+    print(f"RSS máx. antes de exportar: {rss_inicial:.1f} MB")
+    for filas, rss in muestras:
+        print(f"  tras {filas:>10,} filas: {rss:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
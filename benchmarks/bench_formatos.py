@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark: JSON frente a MessagePack para un listado de citas.
+
+Mide, para el sobre {"success", "mensaje", "datos": {"citas": [...]}}:
+  - tamaño del cuerpo (sin comprimir y con gzip)
+  - tiempo de codificación en el servidor: filas() desde las instancias ORM
+    más serializacion.a_json / a_msgpack, como en los endpoints
+  - tiempo de decodificación en el cliente, incluidas las fechas: en JSON
+    hay que parsear tres cadenas ISO por cita; en MessagePack llegan como
+    Timestamp y se convierten a datetime al desempaquetar
+
+Uso:
+    python benchmarks/bench_formatos.py [--citas 10000] [--repeticiones 5]
+"""
+import argparse
+import gzip
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import msgpack
+import orjson
+
+from app.schemas.cita import CitaOut
+from app.utils.respuestas import respuesta_exito
+from app.utils.serializacion import a_json, a_msgpack, filas
+from benchmarks.bench_serializacion import cargar_citas
+
+CAMPOS_FECHA = ("fecha_hora", "created_at", "updated_at")
+
+
+def medir(funcion, repeticiones):
+    funcion()
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        resultado = funcion()
+    return (time.perf_counter() - inicio) / repeticiones * 1000, resultado
+
+
+def decodificar_json(cuerpo):
+    datos = orjson.loads(cuerpo)
+    for cita in datos["datos"]["citas"]:
+        for campo in CAMPOS_FECHA:
+            cita[campo] = datetime.fromisoformat(cita[campo])
+    return datos
+
+
+def decodificar_msgpack(cuerpo):
+    return msgpack.unpackb(cuerpo, timestamp=3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--citas", type=int, default=10_000)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    citas = cargar_citas(args.citas)
+
+    def sobre():
+        return respuesta_exito("Todas las citas obtenidas", {"citas": filas(citas, CitaOut)})
+
+    print(f"{args.citas} citas, {args.repeticiones} repeticiones")
+    print(f"{'formato':<12}{'KiB':>10}{'KiB gzip':>10}{'codificar ms':>14}{'decodificar ms':>16}")
+    decodificados = []
+    for nombre, codificar, decodificar in (("JSON", a_json, decodificar_json),
+                                           ("MessagePack", a_msgpack, decodificar_msgpack)):
+        ms_codificar, cuerpo = medir(lambda: codificar(sobre()), args.repeticiones)
+        ms_decodificar, datos = medir(lambda: decodificar(cuerpo), args.repeticiones)
+        decodificados.append(datos)
+        print(f"{nombre:<12}{len(cuerpo) / 1024:>10.0f}{len(gzip.compress(cuerpo)) / 1024:>10.0f}"
+              f"{ms_codificar:>14.1f}{ms_decodificar:>16.1f}")
+
+    # Mismo contenido (MessagePack devuelve fechas con zona UTC)
+    json_, msgpack_ = (d["datos"]["citas"][-1] for d in decodificados)
+    assert all(json_[c] == msgpack_[c].replace(tzinfo=None) for c in CAMPOS_FECHA)
+
+
+if __name__ == "__main__":
+    main()
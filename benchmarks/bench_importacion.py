@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark: usuarios/s al crear pacientes uno a uno frente a la importación en bloque.
+
+"uno a uno" reproduce /users/admin/crear (hash secuencial y un COMMIT por
+usuario); "importación" usa importar_usuarios con bcrypt repartido entre
+--workers procesos e inserción por trozos.
+
+Uso:
+    python benchmarks/bench_importacion.py [--usuarios 96] [--workers 8]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, delete
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models.cita import Cita  # noqa: F401  (registra la relación User.citas)
+from app.models.user import User
+from app.services import user_service
+from app.utils.hasher import HasherPool
+
+
+def filas_sinteticas(cantidad, prefijo):
+    return [
+        {"username": f"{prefijo}{i}", "email": f"{prefijo}{i}@example.com", "password": f"Paciente{i}Pass",
+         "full_name": f"Paciente {i}", "role": "paciente"}
+        for i in range(cantidad)
+    ]
+
+
+def uno_a_uno(filas, db, pool):
+    for fila in filas:
+        db.add(User(username=fila["username"], email=fila["email"], full_name=fila["full_name"],
+                    hashed_password=pool.hash(fila["password"]), role=fila["role"]))
+        db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--usuarios", type=int, default=96)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--url", help="Base de datos (por defecto un SQLite temporal)")
+    args = parser.parse_args()
+
+    url = args.url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_importacion.db')}"
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    SessionBench = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+
+    secuencial = HasherPool(workers=1, max_cola=1)
+    paralelo = HasherPool(workers=args.workers, max_cola=1)
+    # Arrancar los procesos antes de medir
+    secuencial.hash("Calentamiento1")
+    paralelo.hash_lote(["Calentamiento1"] * args.workers)
+
+    resultados = {}
+    try:
+        with SessionBench() as db:
+            inicio = time.perf_counter()
+            uno_a_uno(filas_sinteticas(args.usuarios, "serie"), db, secuencial)
+            resultados["uno a uno"] = time.perf_counter() - inicio
+
+            inicio = time.perf_counter()
+            reporte, error = user_service.importar_usuarios(filas_sinteticas(args.usuarios, "lote"), db, paralelo.hash_lote)
+            resultados[f"importación ({args.workers} procesos)"] = time.perf_counter() - inicio
+            if error or reporte["creados"] != args.usuarios:
+                raise SystemExit(f"La importación falló: {error or reporte}")
+
+            db.execute(delete(User).where(User.username.like("serie%") | User.username.like("lote%")))
+            db.commit()
+    finally:
+        secuencial.cerrar()
+        paralelo.cerrar()
+
+    print(f"{args.usuarios} usuarios, {os.cpu_count()} núcleos")
+    print(f"{'modo':<28}{'segundos':>10}{'usuarios/s':>12}")
+    for nombre, duracion in resultados.items():
+        print(f"{nombre:<28}{duracion:>10.2f}{args.usuarios / duracion:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
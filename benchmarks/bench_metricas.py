@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Benchmark: coste de registrar una muestra en las métricas de app/utils/metricas.
+
+Mide, en microsegundos por muestra, lo que añade cada petición: una
+observación del histograma HTTP, el inc/dec del gauge en curso y el conteo
+más la observación de una sentencia SQL. Con --multiproceso usa un
+PROMETHEUS_MULTIPROC_DIR temporal (archivos mmap compartidos).
+
+Uso:
+    python benchmarks/bench_metricas.py [--muestras 200000] [--multiproceso]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def medir(funcion, muestras):
+    inicio = time.perf_counter()
+    for _ in range(muestras):
+        funcion()
+    return (time.perf_counter() - inicio) / muestras * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--muestras", type=int, default=200_000)
+    parser.add_argument("--multiproceso", action="store_true")
+    args = parser.parse_args()
+
+    if args.multiproceso:
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp()
+    from app.utils import metricas
+
+    scope = {"route": object(), "path": "/citas/admin/42", "path_params": {"cita_id": 42}}
+    gauge = metricas.peticiones_en_curso.labels("GET", "/citas/")
+
+    def peticion():
+        metricas.observar_peticion("GET", metricas.ruta_de(scope), 200, 0.012)
+
+    def en_curso():
+        gauge.inc()
+        gauge.dec()
+
+    def sentencia():
+        metricas.observar_sentencia("SELECT citas.id FROM citas", 0.0007)
+
+    modo = "multiproceso (mmap)" if args.multiproceso else "un proceso"
+    print(f"{args.muestras} muestras, {modo}")
+    print(f"{'muestra':<40}{'µs':>8}")
+    for nombre, funcion in (("histograma HTTP + plantilla de ruta", peticion),
+                            ("gauge en curso (inc + dec)", en_curso),
+                            ("sentencia SQL (counter + histograma)", sentencia)):
+        print(f"{nombre:<40}{medir(funcion, args.muestras):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark: consultas SQL por petición autenticada con y sin caché de principales.
+
+Uso:
+    python benchmarks/bench_principal_cache.py [--peticiones 200]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.main import app
+from app.database import get_db, Base
+from app.models.user import User
+from app.utils.seguridad import obtener_hash_contraseña
+from app.utils.cache_principal import cache_principales
+
+
+def medir(client, headers, engine, peticiones):
+    sentencias = []
+
+    def contar(conn, cursor, statement, parameters, context, executemany):
+        sentencias.append(statement)
+
+    event.listen(engine, "before_cursor_execute", contar)
+    inicio = time.perf_counter()
+    try:
+        for _ in range(peticiones):
+            client.get("/citas/", headers=headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", contar)
+    duracion = time.perf_counter() - inicio
+
+    consultas_users = len([s for s in sentencias if "FROM users" in s])
+    return len(sentencias) / peticiones, consultas_users / peticiones, peticiones / duracion
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--peticiones", type=int, default=200)
+    args = parser.parse_args()
+
+    ruta_db = os.path.join(tempfile.mkdtemp(), "bench_principal.db")
+    engine = create_engine(f"sqlite:///{ruta_db}", connect_args={"check_same_thread": False})
+    SessionBench = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+    Base.metadata.create_all(bind=engine)
+
+    def override_get_db():
+        db = SessionBench()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+
+    with SessionBench() as db:
+        db.add(User(username="bench", email="bench@example.com", full_name="Bench User",
+                    hashed_password=obtener_hash_contraseña("BenchPass123"), role="paciente"))
+        db.commit()
+
+    client = TestClient(app, base_url="http://localhost")
+    token = client.post("/auth/login", data={"username": "bench", "password": "BenchPass123"}).json()["datos"]["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    ttl_original = cache_principales.ttl
+    resultados = {}
+    for nombre, ttl in (("sin caché", 0), ("con caché", ttl_original or 30)):
+        cache_principales.limpiar()
+        cache_principales.ttl = ttl
+        client.get("/citas/", headers=headers)  # calentar
+        resultados[nombre] = medir(client, headers, engine, args.peticiones)
+    cache_principales.ttl = ttl_original
+
+    print(f"GET /citas/ x {args.peticiones}")
+    print(f"{'modo':<12}{'SQL/petición':>14}{'users/petición':>16}{'req/s':>10}")
+    for nombre, (total, users, rps) in resultados.items():
+        print(f"{nombre:<12}{total:>14.2f}{users:>16.2f}{rps:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark: memoria por IP seguida y fallos/s de cada almacén del rate limiter.
+
+Simula un ataque de credential stuffing desde --ips direcciones distintas con
+--intentos fallos cada una, y compara la lista de datetimes por IP anterior
+(defaultdict(list), sin barrido) con AlmacenMemoria y AlmacenSQLite.
+
+Uso:
+    python benchmarks/bench_rate_limiter.py [--ips 100000] [--intentos 3]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.rate_limiting import AlmacenMemoria, AlmacenSQLite, RateLimiter
+
+
+def ips_sinteticas(cantidad):
+    return [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(cantidad)]
+
+
+def medir_lista(ips, intentos):
+    """Estructura anterior: una lista de datetimes por IP que nunca se elimina"""
+    tracemalloc.start()
+    intentos_por_ip = defaultdict(list)
+    inicio = time.perf_counter()
+    for _ in range(intentos):
+        for ip in ips:
+            intentos_por_ip[ip].append(datetime.now())
+    duracion = time.perf_counter() - inicio
+    memoria = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return memoria, duracion, len(intentos_por_ip)
+
+
+def medir_limitador(ips, intentos, almacen, trazar_memoria=True):
+    limitador = RateLimiter(almacen)
+    limitador.max_attempts = intentos + 1  # que ninguna IP llegue a bloquearse
+    if trazar_memoria:
+        tracemalloc.start()
+    inicio = time.perf_counter()
+    for _ in range(intentos):
+        for ip in ips:
+            limitador.almacen.registrar_fallo(
+                ip, time.time(), limitador.window_minutes * 60, limitador.max_attempts, limitador.lockout_minutes * 60
+            )
+    duracion = time.perf_counter() - inicio
+    memoria = tracemalloc.get_traced_memory()[0] if trazar_memoria else 0
+    if trazar_memoria:
+        tracemalloc.stop()
+    return memoria, duracion, len(limitador.almacen)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ips", type=int, default=100_000)
+    parser.add_argument("--intentos", type=int, default=3)
+    args = parser.parse_args()
+
+    ips = ips_sinteticas(args.ips)
+    ruta_sqlite = os.path.join(tempfile.mkdtemp(), "bench_rate_limit.db")
+
+    resultados = {
+        "lista de datetimes (anterior)": medir_lista(ips, args.intentos),
+        "AlmacenMemoria": medir_limitador(ips, args.intentos, AlmacenMemoria(max_claves=args.ips)),
+        "AlmacenSQLite": medir_limitador(ips, args.intentos, AlmacenSQLite(ruta_sqlite), trazar_memoria=False),
+    }
+    tamaño_sqlite = sum(
+        os.path.getsize(ruta_sqlite + sufijo) for sufijo in ("", "-wal") if os.path.exists(ruta_sqlite + sufijo)
+    )
+    memoria, duracion, claves = resultados["AlmacenSQLite"]
+    resultados["AlmacenSQLite"] = (tamaño_sqlite, duracion, claves)
+
+    fallos = args.ips * args.intentos
+    print(f"{args.ips} IPs x {args.intentos} fallos (la memoria de SQLite es el tamaño del archivo)")
+    print(f"{'almacén':<32}{'bytes/IP':>10}{'fallos/s':>12}{'claves':>10}")
+    for nombre, (memoria, duracion, claves) in resultados.items():
+        print(f"{nombre:<32}{memoria / args.ips:>10.0f}{fallos / duracion:>12.0f}{claves:>10}")
+
+    # Con max_claves acotado la memoria no crece con el número de IPs
+    acotado = AlmacenMemoria(max_claves=10_000)
+    medir_limitador(ips, 1, acotado, trazar_memoria=False)
+    print(f"\nAlmacenMemoria(max_claves=10000) tras {args.ips} IPs: {len(acotado)} claves, {acotado.desalojadas} desalojadas")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark: citas aceptadas en un día de alta demanda según el número de
+recursos (doctores) del servicio.
+
+Cada paciente pide una hora al azar del mismo día con crear_cita, que
+verifica conflictos en la agenda de cada recurso y asigna el menos ocupado.
+Con un solo recurso se llena la agenda del día (una cita por hora por el
+margen de ±30 minutos) y el resto se rechaza; cada recurso añadido suma su
+propia agenda. El coste por intento no depende del número de recursos.
+
+Uso:
+    python benchmarks/bench_recursos.py [--pacientes 400] [--recursos 1 2 4 8 16]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.models.recurso import Recurso
+from app.models.user import User
+from app.services import cita_service
+from app.services.disponibilidad_service import indice_disponibilidad, slots_del_dia
+
+
+def medir(recursos, pacientes, semilla):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {"id": i, "username": f"p{i}", "email": f"p{i}@example.com", "full_name": f"Paciente {i}",
+             "hashed_password": "x", "role": "paciente"} for i in range(1, pacientes + 1)
+        ])
+        conn.execute(insert(Recurso), [
+            {"nombre": f"Doctor {i}", "tipo": "doctor", "motivo": "Cardiología", "capacidad": 1} for i in range(recursos)
+        ])
+    indice_disponibilidad.limpiar()
+
+    dia = (datetime.now(timezone.utc) + timedelta(days=30)).date()
+    while dia.weekday() >= 5:
+        dia += timedelta(days=1)
+    horas = [slot.replace(tzinfo=timezone.utc) for slot in slots_del_dia(dia)]
+    rnd = random.Random(semilla)
+
+    db = sessionmaker(bind=engine, autoflush=False)()
+    aceptadas = 0
+    inicio = time.perf_counter()
+    for paciente_id in range(1, pacientes + 1):
+        cita, _ = cita_service.crear_cita("Cardiología", rnd.choice(horas), paciente_id, None, db)
+        aceptadas += cita is not None
+    duracion = time.perf_counter() - inicio
+    db.close()
+    engine.dispose()
+    return aceptadas, duracion
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pacientes", type=int, default=400)
+    parser.add_argument("--recursos", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    # Los logs por cita distorsionan la medida
+    import logging
+    logging.disable(logging.WARNING)
+
+    print(f"{args.pacientes} pacientes piden una hora al azar del mismo día")
+    print(f"{'recursos':>9}{'aceptadas':>11}{'rechazadas':>12}{'ms/intento':>12}{'aceptadas/s':>13}")
+    for recursos in args.recursos:
+        aceptadas, duracion = medir(recursos, args.pacientes, args.seed)
+        print(f"{recursos:>9}{aceptadas:>11}{args.pacientes - aceptadas:>12}"
+              f"{duracion / args.pacientes * 1000:>12.2f}{aceptadas / duracion:>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
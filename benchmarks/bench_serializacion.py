@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark: serializar un listado de citas ORM dentro del sobre
+{"success", "mensaje", "datos"}.
+
+Compara, en milisegundos por respuesta:
+  - jsonable_encoder + json.dumps (lo que hace FastAPI con un dict de instancias ORM)
+  - TypeAdapter del sobre con list[CitaOut], validando desde atributos + dump_json
+  - serializacion.filas + orjson (app/utils/serializacion.py)
+
+Las citas se cargan desde un SQLite en memoria para que sean instancias
+ORM reales, y se comprueba que las tres salidas sean el mismo JSON.
+
+Uso:
+    python benchmarks/bench_serializacion.py [--citas 10000] [--repeticiones 5]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from typing_extensions import TypedDict
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from app.database import Base
+from app.models.cita import Cita
+from app.models.user import User  # noqa: F401  (registra la relación Cita.paciente)
+from app.schemas.cita import CitaOut
+from app.utils.respuestas import respuesta_exito
+from app.utils.serializacion import a_json, filas
+
+
+class DatosCitas(TypedDict):
+    citas: list[CitaOut]
+
+
+class Sobre(TypedDict):
+    success: bool
+    mensaje: str
+    datos: DatosCitas
+
+
+def cargar_citas(cantidad):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    inicio = datetime(2026, 1, 5, 8, 0)
+    with engine.begin() as conn:
+        conn.execute(insert(Cita), [
+            {"motivo": "Medicina General", "fecha_hora": inicio + timedelta(minutes=30 * i), "paciente_id": 1 + i % 500,
+             "estado": "programada", "notas": "Consulta de rutina" if i % 3 == 0 else None,
+             "created_at": inicio - timedelta(seconds=97 * i), "updated_at": inicio - timedelta(seconds=97 * i)}
+            for i in range(cantidad)
+        ])
+    sesion = Session(engine)
+    return sesion.execute(select(Cita)).scalars().all()
+
+
+def medir(funcion, repeticiones):
+    funcion()
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        resultado = funcion()
+    return (time.perf_counter() - inicio) / repeticiones * 1000, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--citas", type=int, default=10_000)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    citas = cargar_citas(args.citas)
+    adaptador = TypeAdapter(Sobre)
+    mensaje = "Citas obtenidas exitosamente"
+
+    def jsonable():
+        contenido = jsonable_encoder(respuesta_exito(mensaje, {"citas": citas}))
+        return json.dumps(contenido, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+    def type_adapter():
+        sobre = adaptador.validate_python(respuesta_exito(mensaje, {"citas": citas}), from_attributes=True)
+        return adaptador.dump_json(sobre)
+
+    def rapida():
+        return a_json(respuesta_exito(mensaje, {"citas": filas(citas, CitaOut)}))
+
+    print(f"{args.citas} citas, {args.repeticiones} repeticiones")
+    print(f"{'serialización':<44}{'ms':>10}{'KiB':>10}")
+    salidas = []
+    for nombre, funcion in (("jsonable_encoder + json.dumps", jsonable),
+                            ("TypeAdapter (sobre con list[CitaOut])", type_adapter),
+                            ("filas + orjson (serializacion)", rapida)):
+        ms, salida = medir(funcion, args.repeticiones)
+        salidas.append(json.loads(salida))
+        print(f"{nombre:<44}{ms:>10.1f}{len(salida) / 1024:>10.0f}")
+    assert salidas[0] == salidas[1] == salidas[2], "las salidas no coinciden"
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,11 @@ from app.database import get_db, Base
 from app.models.user import User
 from app.models.cita import Cita
 from app.utils.seguridad import obtener_hash_contraseña
+from app.utils.rate_limiting import rate_limiter
+from app.utils.cache_principal import cache_principales
+from app.services.disponibilidad_service import indice_disponibilidad
+from app.utils.replicas import SesionEnrutada, enrutador_replicas
+from app.utils.idempotencia import idempotencia
 
 # Base de datos de prueba en memoria
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -19,7 +24,7 @@ engine = create_engine(
     connect_args={"check_same_thread": False},
     poolclass=StaticPool,
 )
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=SesionEnrutada)
 
 def override_get_db():
     try:
@@ -30,17 +35,22 @@ def override_get_db():
 
 app.dependency_overrides[get_db] = override_get_db
 
-@pytest.fixture(scope="session")
+@pytest.fixture
 def setup_database():
     """Configura la base de datos de prueba"""
     Base.metadata.create_all(bind=engine)
+    rate_limiter.limpiar()
+    cache_principales.limpiar()
+    indice_disponibilidad.limpiar()
+    enrutador_replicas.limpiar()
+    idempotencia.limpiar()
     yield
     Base.metadata.drop_all(bind=engine)
 
 @pytest.fixture
 def client(setup_database):
     """Cliente de prueba para la API"""
-    return TestClient(app)
+    return TestClient(app, base_url="http://localhost")
 
 @pytest.fixture
 def db_session(setup_database):
@@ -0,0 +1,200 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from datetime import datetime, timezone, timedelta
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app import database
+from app.main import app
+from app.database import get_db, Base
+from app.utils.rate_limiting import rate_limiter
+from app.utils.cache_principal import cache_principales
+from app.services.disponibilidad_service import indice_disponibilidad
+from app.utils.replicas import SesionEnrutada, enrutador_replicas
+
+# Base de datos de prueba para el modo async (aiosqlite)
+ASYNC_SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./test_async.db"
+
+async_engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL, poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, sync_session_class=SesionEnrutada, autoflush=False, expire_on_commit=False
+)
+
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+async def _crear_tablas():
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+async def _borrar_tablas():
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+
+@pytest.fixture
+def async_client(monkeypatch):
+    """Cliente de prueba con la aplicación en modo async"""
+    asyncio.run(_crear_tablas())
+    rate_limiter.limpiar()
+    cache_principales.limpiar()
+    indice_disponibilidad.limpiar()
+    enrutador_replicas.limpiar()
+    monkeypatch.setattr(database, "DB_MODE", "async")
+    monkeypatch.setitem(app.dependency_overrides, get_db, override_get_async_db)
+    yield TestClient(app, base_url="http://localhost")
+    asyncio.run(_borrar_tablas())
+
+def _registrar_y_login(client, username="asyncuser"):
+    client.post("/auth/registro", json={
+        "username": username,
+        "email": f"{username}@example.com",
+        "password": "AsyncPass123",
+        "full_name": "Async User",
+        "role": "paciente"
+    })
+    response = client.post("/auth/login", data={"username": username, "password": "AsyncPass123"})
+    token = response.json()["datos"]["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+def test_async_register_and_login(async_client):
+    """Prueba registro y login usando sesiones async"""
+    headers = _registrar_y_login(async_client)
+    assert headers["Authorization"].startswith("Bearer ")
+
+def test_async_create_and_list_appointments(async_client):
+    """Prueba crear, listar y cancelar una cita en modo async"""
+    headers = _registrar_y_login(async_client)
+    future_date = datetime.now(timezone.utc) + timedelta(days=1)
+    while future_date.weekday() >= 5:
+        future_date += timedelta(days=1)
+    future_date = future_date.replace(hour=10, minute=0, second=0, microsecond=0)
+
+    response = async_client.post("/citas/", json={
+        "motivo": "Medicina General",
+        "fecha_hora": future_date.isoformat()
+    }, headers=headers)
+    assert response.status_code == 200
+    cita_id = response.json()["datos"]["cita"]
+
+    response = async_client.get("/citas/", headers=headers)
+    assert response.status_code == 200
+    assert len(response.json()["datos"]["citas"]) == 1
+
+    response = async_client.delete(f"/citas/{cita_id}", headers=headers)
+    assert response.status_code == 200
+
+    response = async_client.get("/citas/", headers=headers)
+    assert response.json()["datos"]["citas"] == []
+
+def test_async_unauthorized(async_client):
+    """Prueba que el modo async también rechace peticiones sin token"""
+    response = async_client.get("/citas/")
+    assert response.status_code == 401
+
+def test_async_admin_export(async_client):
+    """Prueba la exportación en streaming con AsyncSession"""
+    async_client.post("/auth/registro", json={
+        "username": "asyncadmin",
+        "email": "asyncadmin@example.com",
+        "password": "AsyncPass123",
+        "full_name": "Async Admin",
+        "role": "admin"
+    })
+    token = async_client.post("/auth/login", data={"username": "asyncadmin", "password": "AsyncPass123"}).json()["datos"]["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = async_client.get("/citas/admin/exportar", params={"formato": "csv"}, headers=headers)
+    assert response.status_code == 200
+    assert response.text.splitlines()[0].startswith("id,motivo,fecha_hora")
+
+def test_async_read_replica_fallback(async_client, tmp_path):
+    """Prueba que en modo async las lecturas vayan a la réplica y vuelvan al primario si falla"""
+    headers = _registrar_y_login(async_client)
+    future_date = datetime.now(timezone.utc) + timedelta(days=1)
+    while future_date.weekday() >= 5:
+        future_date += timedelta(days=1)
+    future_date = future_date.replace(hour=11, minute=0, second=0, microsecond=0)
+    async_client.post("/citas/", json={"motivo": "Laboratorio", "fecha_hora": future_date.isoformat()}, headers=headers)
+
+    replica = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}", poolclass=NullPool)
+    async def _esquema():
+        async with replica.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    asyncio.run(_esquema())
+    enrutador_replicas.configurar([replica])
+    try:
+        enrutador_replicas.limpiar()
+        assert async_client.get("/citas/", headers=headers).json()["datos"]["citas"] == []
+
+        caida = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'no_existe' / 'replica.db'}", poolclass=NullPool)
+        enrutador_replicas.configurar([caida])
+        assert len(async_client.get("/citas/", headers=headers).json()["datos"]["citas"]) == 1
+        assert 0 in enrutador_replicas.caidas
+    finally:
+        enrutador_replicas.configurar([])
+
+def test_async_resource_booking(async_client):
+    """Prueba la asignación de recurso y la capacidad con AsyncSession"""
+    async_client.post("/auth/registro", json={
+        "username": "asyncadmin",
+        "email": "asyncadmin@example.com",
+        "password": "AsyncPass123",
+        "full_name": "Async Admin",
+        "role": "admin"
+    })
+    token = async_client.post("/auth/login", data={"username": "asyncadmin", "password": "AsyncPass123"}).json()["datos"]["access_token"]
+    admin = {"Authorization": f"Bearer {token}"}
+    sala = async_client.post("/recursos/", json={
+        "nombre": "Sala de extracciones", "tipo": "sala", "motivo": "Laboratorio", "capacidad": 2
+    }, headers=admin).json()["datos"]["recurso"]["id"]
+
+    future_date = datetime.now(timezone.utc) + timedelta(days=1)
+    while future_date.weekday() >= 5:
+        future_date += timedelta(days=1)
+    future_date = future_date.replace(hour=10, minute=0, second=0, microsecond=0)
+
+    # Capacidad 2: dos pacientes a la misma hora en la misma sala, el tercero no
+    for username, esperado in (("asyncuno", 200), ("asyncdos", 200), ("asynctres", 400)):
+        response = async_client.post("/citas/", json={
+            "motivo": "Laboratorio", "fecha_hora": future_date.isoformat()
+        }, headers=_registrar_y_login(async_client, username))
+        assert response.status_code == esperado
+        if esperado == 200:
+            assert response.json()["datos"]["recurso_id"] == sala
+    assert response.json()["mensaje"].startswith("Ya existe una cita programada")
+    assert "Hora sugerida" in response.json()["mensaje"]
+
+def test_async_edit_reassigns_resource(async_client):
+    """Prueba que en modo async editar el servicio vuelva a elegir recurso y horario"""
+    async_client.post("/auth/registro", json={
+        "username": "asyncadmin",
+        "email": "asyncadmin@example.com",
+        "password": "AsyncPass123",
+        "full_name": "Async Admin",
+        "role": "admin"
+    })
+    token = async_client.post("/auth/login", data={"username": "asyncadmin", "password": "AsyncPass123"}).json()["datos"]["access_token"]
+    admin = {"Authorization": f"Bearer {token}"}
+    sala = async_client.post("/recursos/", json={
+        "nombre": "Sala de extracciones", "tipo": "sala", "motivo": "Laboratorio",
+        "hora_inicio": "09:00:00", "hora_fin": "11:00:00"
+    }, headers=admin).json()["datos"]["recurso"]["id"]
+
+    headers = _registrar_y_login(async_client)
+    future_date = datetime.now(timezone.utc) + timedelta(days=1)
+    while future_date.weekday() >= 5:
+        future_date += timedelta(days=1)
+    future_date = future_date.replace(hour=10, minute=0, second=0, microsecond=0)
+    cita_id = async_client.post("/citas/", json={
+        "motivo": "Medicina General", "fecha_hora": future_date.isoformat()
+    }, headers=headers).json()["datos"]["cita"]
+
+    response = async_client.put(f"/citas/{cita_id}", json={"motivo": "Laboratorio"}, headers=headers)
+    assert response.status_code == 200
+    citas = async_client.get("/citas/", headers=headers).json()["datos"]["citas"]
+    assert citas[0]["recurso_id"] == sala
+
+    response = async_client.put(f"/citas/{cita_id}", json={"fecha_hora": future_date.replace(hour=15).isoformat()}, headers=headers)
+    assert "atiende en ese horario" in response.json()["mensaje"]
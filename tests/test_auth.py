@@ -105,3 +105,183 @@ def test_login_inactive_user(client, db_session):
     response = client.post("/auth/login", data=login_data)
     assert response.status_code == 400
     assert "inactivo" in response.json()["mensaje"]
+
+def test_login_hasher_saturado(client, test_user, monkeypatch):
+    """Prueba que el login responda 503 rápido si el pool de hashing está lleno"""
+    from app.utils.hasher import hasher
+    monkeypatch.setattr(hasher, "max_cola", 0)
+
+    login_data = {
+        "username": "testuser",
+        "password": "TestPass123"
+    }
+
+    response = client.post("/auth/login", data=login_data)
+    assert response.status_code == 503
+    assert response.json()["success"] is False
+    assert "Retry-After" in response.headers
+
+def test_hasher_metricas(client, admin_headers):
+    """Prueba que el admin pueda consultar las métricas del pool de hashing"""
+    response = client.get("/auth/hasher/metricas", headers=admin_headers)
+    assert response.status_code == 200
+    datos = response.json()["datos"]
+    assert datos["operaciones"] >= 1
+    assert "espera_promedio" in datos and "hash_promedio" in datos
+
+def test_principal_cache_avoids_user_query(client, auth_headers):
+    """Prueba que las peticiones autenticadas repetidas no consulten la tabla users"""
+    from sqlalchemy import event
+    from tests.conftest import engine
+
+    sentencias = []
+    def contar(conn, cursor, statement, parameters, context, executemany):
+        sentencias.append(statement)
+
+    client.get("/citas/", headers=auth_headers)
+    event.listen(engine, "before_cursor_execute", contar)
+    try:
+        for _ in range(3):
+            response = client.get("/citas/", headers=auth_headers)
+            assert response.status_code == 200
+    finally:
+        event.remove(engine, "before_cursor_execute", contar)
+
+    assert not [s for s in sentencias if "FROM users" in s]
+
+def test_deactivated_user_loses_access_immediately(client, auth_headers, db_session):
+    """Prueba que desactivar un usuario invalide su principal en caché"""
+    from app.models.user import User
+
+    assert client.get("/citas/", headers=auth_headers).status_code == 200
+
+    user = db_session.query(User).filter(User.username == "testuser").first()
+    user.is_active = False
+    db_session.commit()
+
+    response = client.get("/citas/", headers=auth_headers)
+    assert response.status_code == 401
+
+def test_principal_invalidated_on_commit_not_flush(client, auth_headers, db_session):
+    """Prueba que un principal guardado entre el flush y el commit de una desactivación no sobreviva"""
+    from app.models.user import User
+    from app.schemas.user import UserOut
+    from app.utils.cache_principal import cache_principales
+
+    user = db_session.query(User).filter(User.username == "testuser").first()
+    anterior = UserOut.model_validate(user)
+    user.is_active = False
+    db_session.flush()
+    # Una petición concurrente vuelve a guardar la fila aún sin confirmar
+    cache_principales.guardar(anterior)
+    db_session.commit()
+
+    response = client.get("/citas/", headers=auth_headers)
+    assert response.status_code == 401
+
+def test_bulk_deactivation_invalidates_principals(client, auth_headers, db_session):
+    """Prueba que un UPDATE masivo sobre users invalide los principales en caché"""
+    from sqlalchemy import update
+    from app.models.user import User
+
+    assert client.get("/citas/", headers=auth_headers).status_code == 200
+    db_session.execute(update(User).where(User.username == "testuser").values(is_active=False))
+    db_session.commit()
+
+    response = client.get("/citas/", headers=auth_headers)
+    assert response.status_code == 401
+
+def test_extended_token_rejected_after_role_change(client, test_user, db_session, monkeypatch):
+    """Prueba que un token con claims extendidos se invalide al cambiar el rol"""
+    from app.utils import seguridad
+    monkeypatch.setattr(seguridad, "JWT_CLAIMS_EXTENDIDOS", True)
+
+    response = client.post("/auth/login", data={"username": "testuser", "password": "TestPass123"})
+    headers = {"Authorization": f"Bearer {response.json()['datos']['access_token']}"}
+    assert client.get("/citas/", headers=headers).status_code == 200
+
+    test_user.role = "doctor"
+    db_session.commit()
+
+    response = client.get("/citas/", headers=headers)
+    assert response.status_code == 401
+
+def test_login_rate_limited_after_max_attempts(client, test_user):
+    """Prueba que la IP se bloquee solo al alcanzar el máximo de intentos fallidos"""
+    from app.utils.rate_limiting import rate_limiter
+
+    for _ in range(rate_limiter.max_attempts - 1):
+        response = client.post("/auth/login", data={"username": "testuser", "password": "Incorrecta123"})
+        assert response.status_code == 400
+
+    response = client.post("/auth/login", data={"username": "testuser", "password": "TestPass123"})
+    assert response.status_code == 200
+
+    for _ in range(rate_limiter.max_attempts):
+        client.post("/auth/login", data={"username": "testuser", "password": "Incorrecta123"})
+
+    response = client.post("/auth/login", data={"username": "testuser", "password": "TestPass123"})
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
+
+def test_rate_limit_sqlite_store_shared_and_swept(tmp_path):
+    """Prueba que dos limitadores sobre el mismo SQLite compartan contadores y barran claves inactivas"""
+    from app.utils.rate_limiting import AlmacenSQLite, RateLimiter
+
+    ruta = str(tmp_path / "rate_limit.db")
+    worker_a = RateLimiter(AlmacenSQLite(ruta, barrer_cada=1))
+    worker_b = RateLimiter(AlmacenSQLite(ruta, barrer_cada=1))
+
+    for i in range(worker_a.max_attempts):
+        (worker_a if i % 2 else worker_b).record_failed_attempt("10.0.0.1")
+
+    assert worker_a.is_rate_limited("10.0.0.1")[0] is True
+    assert worker_b.is_rate_limited("10.0.0.1")[0] is True
+
+    ventana = worker_a.window_minutes * 60
+    bloqueo = worker_a.lockout_minutes * 60
+    worker_a.almacen.registrar_fallo("10.0.0.2", 0.0, ventana, worker_a.max_attempts, bloqueo)
+    worker_a.record_failed_attempt("10.0.0.3")
+    assert len(worker_b.almacen) == 2
+
+def test_rate_limit_memory_store_keeps_lockouts_when_full():
+    """Prueba que al llenarse el almacén en memoria se desalojen primero las IPs sin bloqueo, nunca un bloqueo vigente, y que las IPs nuevas no queden bloqueadas"""
+    from app.utils.rate_limiting import AlmacenMemoria
+
+    almacen = AlmacenMemoria(max_claves=3)
+    ventana, bloqueo = 900.0, 1800.0
+    for segundo, ip in enumerate(("10.0.0.1", "10.0.0.2")):
+        almacen.registrar_fallo(ip, float(segundo), ventana, 1, bloqueo)
+    almacen.registrar_fallo("10.0.0.3", 2.0, ventana, 5, bloqueo)
+
+    # La IP nueva desaloja a la única sin bloqueo, aunque las bloqueadas sean más antiguas
+    assert almacen.registrar_fallo("10.0.0.4", 3.0, ventana, 5, bloqueo) == 0.0
+    assert almacen.desalojadas == 1
+    assert almacen.bloqueado_hasta("10.0.0.1", 4.0) == bloqueo
+
+    # Con todas las plazas bloqueadas, una IP nueva no se sigue pero tampoco se bloquea
+    almacen.registrar_fallo("10.0.0.4", 4.0, ventana, 2, bloqueo)
+    assert almacen.registrar_fallo("10.0.0.5", 5.0, ventana, 1, bloqueo) == 0.0
+    assert almacen.bloqueado_hasta("10.0.0.5", 5.0) == 0.0
+    assert almacen.bloqueado_hasta("10.0.0.6", 5.0) == 0.0
+    assert almacen.sin_seguimiento == 1 and len(almacen) == 3
+    # Los bloqueos vigentes se mantienen
+    assert almacen.bloqueado_hasta("10.0.0.4", 5.0) == 4.0 + bloqueo
+
+    # Al vencer el primer bloqueo se libera su plaza
+    assert almacen.registrar_fallo("10.0.0.5", bloqueo, ventana, 5, bloqueo) == 0.0
+    assert almacen.bloqueado_hasta("10.0.0.1", bloqueo) == 0.0
+    assert almacen.bloqueado_hasta("10.0.0.2", bloqueo) == bloqueo + 1
+
+def test_metrics_endpoint(client, test_user):
+    """Prueba que /metrics exporte latencia por ruta, sentencias SQL y fallos de autenticación"""
+    client.post("/auth/login", data={"username": "testuser", "password": "Incorrecta123"})
+    client.get("/citas/", headers={"Authorization": "Bearer token-invalido"})
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    cuerpo = response.text
+    assert 'http_request_duration_seconds_count{estado="400",metodo="POST",ruta="/auth/login"}' in cuerpo
+    assert 'auth_failures_total{motivo="login"}' in cuerpo
+    assert 'auth_failures_total{motivo="token_invalido"}' in cuerpo
+    assert "rate_limit_rejections_total" in cuerpo
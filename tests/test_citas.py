@@ -113,3 +113,864 @@ def test_cancel_my_appointment(client, auth_headers, db_session):
     response = client.delete(f"/citas/{appointment.id}", headers=auth_headers)
     assert response.status_code == 200
     assert response.json()["success"] is True
+
+def test_admin_appointments_keyset_pagination(client, admin_headers, test_user, db_session):
+    """Prueba que el listado admin se recorra por páginas con cursor"""
+    from app.models.cita import Cita
+
+    base = datetime(2030, 1, 7, 9, 0)
+    for i in range(5):
+        db_session.add(Cita(
+            motivo="Medicina General",
+            fecha_hora=base + timedelta(days=i),
+            paciente_id=test_user.id,
+            estado="programada"
+        ))
+    db_session.commit()
+
+    vistos = []
+    cursor = None
+    for _ in range(3):
+        params = {"limite": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/citas/admin", params=params, headers=admin_headers)
+        assert response.status_code == 200
+        datos = response.json()["datos"]
+        vistos.extend(c["id"] for c in datos["citas"])
+        cursor = datos["siguiente_cursor"]
+        if cursor is None:
+            break
+
+    assert len(vistos) == 5
+    assert len(set(vistos)) == 5
+    assert cursor is None
+
+def test_admin_appointments_filters(client, admin_headers, test_user, db_session):
+    """Prueba los filtros de estado y rango de fechas del listado admin"""
+    from app.models.cita import Cita
+
+    db_session.add_all([
+        Cita(motivo="Odontología", fecha_hora=datetime(2030, 2, 4, 9, 0), paciente_id=test_user.id, estado="programada"),
+        Cita(motivo="Odontología", fecha_hora=datetime(2030, 2, 5, 9, 0), paciente_id=test_user.id, estado="cancelada"),
+        Cita(motivo="Laboratorio", fecha_hora=datetime(2030, 3, 4, 9, 0), paciente_id=test_user.id, estado="programada"),
+    ])
+    db_session.commit()
+
+    response = client.get("/citas/admin", params={"estado": "cancelada"}, headers=admin_headers)
+    assert [c["estado"] for c in response.json()["datos"]["citas"]] == ["cancelada"]
+
+    response = client.get("/citas/admin", params={
+        "motivo": "Odontología", "desde": "2030-02-01T00:00:00", "hasta": "2030-02-28T23:59:59"
+    }, headers=admin_headers)
+    assert len(response.json()["datos"]["citas"]) == 2
+
+def test_admin_appointments_invalid_cursor(client, admin_headers):
+    """Prueba que un cursor inválido devuelva 400"""
+    response = client.get("/citas/admin", params={"cursor": "no-es-un-cursor"}, headers=admin_headers)
+    assert response.status_code == 400
+
+def test_admin_export_ndjson(client, admin_headers, test_user, db_session):
+    """Prueba la exportación NDJSON filtrada por estado"""
+    import json
+    from app.models.cita import Cita
+
+    db_session.add_all([
+        Cita(motivo="Pediatría", fecha_hora=datetime(2030, 4, 1, 9, 0), paciente_id=test_user.id, estado="programada"),
+        Cita(motivo="Pediatría", fecha_hora=datetime(2030, 4, 2, 9, 0), paciente_id=test_user.id, estado="cancelada"),
+    ])
+    db_session.commit()
+
+    response = client.get("/citas/admin/exportar", params={"estado": "programada"}, headers=admin_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    filas = [json.loads(linea) for linea in response.text.splitlines()]
+    assert [f["estado"] for f in filas] == ["programada"]
+    assert filas[0]["fecha_hora"].startswith("2030-04-01T09:00")
+
+def test_admin_export_csv(client, admin_headers, test_user, db_session):
+    """Prueba la exportación CSV con encabezado"""
+    import csv
+    import io
+    from app.models.cita import Cita
+
+    db_session.add(Cita(motivo="Laboratorio", fecha_hora=datetime(2030, 4, 3, 9, 0), paciente_id=test_user.id, estado="programada"))
+    db_session.commit()
+
+    response = client.get("/citas/admin/exportar", params={"formato": "csv"}, headers=admin_headers)
+    assert response.status_code == 200
+    filas = list(csv.reader(io.StringIO(response.text)))
+    assert filas[0][:3] == ["id", "motivo", "fecha_hora"]
+    assert len(filas) == 2
+
+def test_patient_cannot_export(client, auth_headers):
+    """Prueba que un paciente no pueda exportar citas"""
+    response = client.get("/citas/admin/exportar", headers=auth_headers)
+    assert response.status_code == 403
+
+def _proximo_dia_laborable(dias=30):
+    dia = datetime.now(timezone.utc) + timedelta(days=dias)
+    while dia.weekday() >= 5:
+        dia += timedelta(days=1)
+    return dia.replace(hour=10, minute=0, second=0, microsecond=0)
+
+def test_availability_excludes_booked_slots(client, auth_headers):
+    """Prueba que los horarios cercanos a una cita programada no aparezcan libres"""
+    fecha = _proximo_dia_laborable()
+    response = client.post("/citas/", json={"motivo": "Medicina General", "fecha_hora": fecha.isoformat()}, headers=auth_headers)
+    assert response.status_code == 200
+
+    response = client.get("/citas/disponibilidad", params={"fecha": fecha.date().isoformat()}, headers=auth_headers)
+    assert response.status_code == 200
+    libres = [datetime.fromisoformat(s).strftime("%H:%M") for s in response.json()["datos"]["slots_libres"]]
+    assert "09:00" in libres and "11:00" in libres
+    assert not {"09:30", "10:00", "10:30"} & set(libres)
+
+    response = client.get("/citas/disponibilidad", params={"despues_de": fecha.isoformat()}, headers=auth_headers)
+    siguiente = datetime.fromisoformat(response.json()["datos"]["siguiente_libre"])
+    assert siguiente.strftime("%H:%M") == "11:00"
+
+def test_availability_index_free_slots():
+    """Prueba los slots libres precalculados del índice: días llenos, capacidad, horario y cambios"""
+    from datetime import time as dtime
+    from app.services.disponibilidad_service import Agenda, IndiceDisponibilidad, slots_del_dia
+    indice = IndiceDisponibilidad()
+    lunes, martes = datetime(2030, 1, 7).date(), datetime(2030, 1, 8).date()
+    doctor, sala = Agenda(1), Agenda(2, capacidad=2, hora_inicio=dtime(9), hora_fin=dtime(11))
+    # El doctor tiene el lunes lleno; la sala tiene una cita a las 9:00
+    indice.cargar([(1, lunes), (1, martes), (2, lunes)],
+                  [(1, slot) for slot in slots_del_dia(lunes)] + [(2, datetime(2030, 1, 7, 9))])
+
+    assert indice.primer_libre(lunes, None, [doctor]) is None
+    assert indice.primer_libre(lunes, datetime(2030, 1, 7, 12), [doctor, sala]) is None
+    assert indice.primer_libre(martes, datetime(2030, 1, 8, 12, 10), [doctor]) == datetime(2030, 1, 8, 12, 30)
+    # Capacidad 2: con una cita la sala sigue libre; el horario limita los slots
+    assert indice.slots_libres(lunes, None, [sala])[0] == datetime(2030, 1, 7, 9)
+    assert indice.slots_libres(lunes, None, [sala])[-1] == datetime(2030, 1, 7, 11)
+
+    # Registrar y quitar recalculan los libres
+    indice.registrar(datetime(2030, 1, 7, 9), 2)
+    assert indice.primer_libre(lunes, None, [sala]) == datetime(2030, 1, 7, 10)
+    for hora in (datetime(2030, 1, 7, 13, 30), datetime(2030, 1, 7, 14), datetime(2030, 1, 7, 14, 30)):
+        indice.quitar(hora, 1)
+    assert indice.primer_libre(lunes, None, [doctor, sala]) == datetime(2030, 1, 7, 10)
+    assert indice.primer_libre(lunes, datetime(2030, 1, 7, 11, 15), [doctor, sala]) == datetime(2030, 1, 7, 14)
+
+def test_conflict_suggests_free_slot(client, auth_headers, test_admin, db_session):
+    """Prueba que la hora sugerida ante un conflicto esté realmente libre"""
+    from app.models.cita import Cita
+
+    fecha = _proximo_dia_laborable()
+    db_session.add_all([
+        Cita(motivo="Medicina General", fecha_hora=fecha.replace(tzinfo=None), paciente_id=test_admin.id, estado="programada"),
+        Cita(motivo="Medicina General", fecha_hora=(fecha + timedelta(hours=1)).replace(tzinfo=None), paciente_id=test_admin.id, estado="programada"),
+    ])
+    db_session.commit()
+
+    response = client.post("/citas/", json={"motivo": "Medicina General", "fecha_hora": fecha.isoformat()}, headers=auth_headers)
+    assert response.status_code == 400
+    # 10:00 y 11:00 ocupadas: la sugerencia antigua (conflicto + 1h) caía sobre otra cita
+    assert "Hora sugerida" in response.text
+    assert f"{fecha.date()} 12:00:00" in response.text
+
+def test_conflict_suggestion_reloads_stale_day(client, auth_headers, test_admin, db_session):
+    """Prueba que tras un conflicto la sugerencia no salga del día cacheado sin las citas de otro worker"""
+    from app.models.cita import Cita
+
+    fecha = _proximo_dia_laborable()
+    # El índice carga el día vacío; las citas llegan después sin pasar por él
+    response = client.get("/citas/disponibilidad", params={"fecha": fecha.date().isoformat()}, headers=auth_headers)
+    assert len(response.json()["datos"]["slots_libres"]) == 21
+    db_session.add_all([
+        Cita(motivo="Medicina General", fecha_hora=fecha.replace(tzinfo=None), paciente_id=test_admin.id, estado="programada"),
+        Cita(motivo="Medicina General", fecha_hora=(fecha + timedelta(hours=1)).replace(tzinfo=None), paciente_id=test_admin.id, estado="programada"),
+    ])
+    db_session.commit()
+
+    response = client.post("/citas/", json={"motivo": "Medicina General", "fecha_hora": fecha.isoformat()}, headers=auth_headers)
+    assert response.status_code == 400
+    assert f"{fecha.date()} 10:00:00" not in response.text
+    assert f"{fecha.date()} 12:00:00" in response.text
+
+def test_batch_booking_reports_per_item(client, admin_headers, test_user, db_session):
+    """Prueba el agendamiento por lotes con conflictos internos, externos e ítems inválidos"""
+    from app.models.cita import Cita
+    from sqlalchemy import event
+    from tests.conftest import engine
+
+    fecha = _proximo_dia_laborable()
+    db_session.add(Cita(motivo="Odontología", fecha_hora=fecha.replace(tzinfo=None), paciente_id=test_user.id, estado="programada"))
+    db_session.commit()
+
+    otro_dia = _proximo_dia_laborable(40)
+    lote = {"citas": [
+        {"motivo": "Medicina General", "fecha_hora": (fecha + timedelta(minutes=15)).isoformat(), "paciente_id": test_user.id},  # choca con existente
+        {"motivo": "Medicina General", "fecha_hora": otro_dia.isoformat(), "paciente_id": test_user.id},                          # ok
+        {"motivo": "Medicina General", "fecha_hora": (otro_dia + timedelta(minutes=20)).isoformat()},                            # choca dentro del lote
+        {"motivo": "Medicina General", "fecha_hora": (otro_dia + timedelta(hours=3)).isoformat()},                               # ok (admin)
+        {"motivo": "No existe", "fecha_hora": otro_dia.isoformat()},                                                             # inválido
+        {"motivo": "Laboratorio", "fecha_hora": (otro_dia + timedelta(hours=5)).isoformat(), "paciente_id": 99999},             # paciente inexistente
+    ]}
+
+    sentencias = []
+    def contar(conn, cursor, statement, parameters, context, executemany):
+        sentencias.append(statement.split()[0].upper())
+
+    event.listen(engine, "before_cursor_execute", contar)
+    try:
+        response = client.post("/citas/batch", json=lote, headers=admin_headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", contar)
+
+    assert response.status_code == 200
+    datos = response.json()["datos"]
+    assert [r["success"] for r in datos["resultados"]] == [False, True, False, True, False, False]
+    assert "mismo lote" in datos["resultados"][2]["mensaje"]
+    assert datos["creadas"] == 2
+    assert sentencias.count("INSERT") == 1
+
+def test_patient_cannot_batch_for_others(client, auth_headers, test_admin):
+    """Prueba que un paciente no pueda agendar en lote para otros pacientes"""
+    fecha = _proximo_dia_laborable(50)
+    response = client.post("/citas/batch", json={"citas": [
+        {"motivo": "Medicina General", "fecha_hora": fecha.isoformat(), "paciente_id": test_admin.id}
+    ]}, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["datos"]["resultados"][0]["success"] is False
+
+def test_query_budgets(client, auth_headers, admin_headers):
+    """Prueba los presupuestos de consultas SQL por endpoint"""
+    from app.utils.perfilador import presupuesto_consultas
+
+    with presupuesto_consultas(2):
+        response = client.get("/citas/", headers=auth_headers)
+    assert response.status_code == 200
+    assert "Server-Timing" in response.headers
+
+    with presupuesto_consultas(2):
+        assert client.get("/citas/admin", headers=admin_headers).status_code == 200
+
+def test_server_timing_only_for_admin_header(client, auth_headers, admin_headers, monkeypatch):
+    """Prueba que la cabecera X-Perfil-SQL solo perfile y devuelva Server-Timing a un admin"""
+    from app.utils import perfilador
+    terminados = []
+    terminar = perfilador.terminar
+    monkeypatch.setattr(perfilador, "terminar", lambda perfil: terminados.append(perfil) or terminar(perfil))
+
+    response = client.get("/citas/admin", headers={**admin_headers, "X-Perfil-SQL": "1"})
+    assert response.status_code == 200
+    assert 'db;dur=' in response.headers["Server-Timing"]
+    assert 'consultas"' in response.headers["Server-Timing"]
+    assert len(terminados) == 1 and terminados[0].consultas > 0
+
+    # Ni un paciente ni una petición anónima activan el perfilado
+    response = client.get("/citas/", headers={**auth_headers, "X-Perfil-SQL": "1"})
+    assert response.status_code == 200
+    assert "Server-Timing" not in response.headers
+    assert client.get("/citas/", headers={"X-Perfil-SQL": "1"}).status_code == 401
+    assert len(terminados) == 1
+
+def test_read_replica_routing(client, auth_headers, tmp_path):
+    """Prueba lecturas en réplica, lectura propia tras escribir y respaldo en el primario"""
+    from sqlalchemy import create_engine
+    from app.database import Base
+    from app.utils.replicas import enrutador_replicas
+
+    # Réplica "atrasada": mismo esquema, sin datos
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    Base.metadata.create_all(bind=replica)
+    enrutador_replicas.configurar([replica])
+    try:
+        future_date = datetime.now(timezone.utc) + timedelta(days=1)
+        while future_date.weekday() >= 5:
+            future_date += timedelta(days=1)
+        future_date = future_date.replace(hour=10, minute=0, second=0, microsecond=0)
+        response = client.post("/citas/", json={"motivo": "Medicina General", "fecha_hora": future_date.isoformat()}, headers=auth_headers)
+        assert response.status_code == 200
+
+        # Recién escrito: el paciente lee del primario
+        assert len(client.get("/citas/", headers=auth_headers).json()["datos"]["citas"]) == 1
+
+        # Pasada la ventana, la lectura va a la réplica
+        enrutador_replicas.limpiar()
+        assert client.get("/citas/", headers=auth_headers).json()["datos"]["citas"] == []
+
+        # Réplica inaccesible: la lectura se repite en el primario y la réplica queda fuera
+        enrutador_replicas.configurar([create_engine(f"sqlite:///{tmp_path / 'no_existe' / 'replica.db'}")])
+        assert len(client.get("/citas/", headers=auth_headers).json()["datos"]["citas"]) == 1
+        assert 0 in enrutador_replicas.caidas
+        assert enrutador_replicas.elegir() is None
+    finally:
+        enrutador_replicas.configurar([])
+        replica.dispose()
+
+def test_replica_selection(tmp_path):
+    """Prueba round robin y menos conexiones entre dos réplicas SQLite"""
+    from sqlalchemy import create_engine
+    from app.utils.replicas import EnrutadorReplicas
+
+    replicas = [create_engine(f"sqlite:///{tmp_path / f'replica{i}.db'}") for i in range(2)]
+    enrutador = EnrutadorReplicas(replicas, seleccion="round_robin")
+    assert [enrutador.elegir()[0] for _ in range(4)] == [0, 1, 0, 1]
+
+    enrutador = EnrutadorReplicas(replicas, seleccion="menos_conexiones")
+    with replicas[0].connect():
+        assert enrutador.elegir()[0] == 1
+    with replicas[1].connect():
+        assert enrutador.elegir()[0] == 0
+
+def test_fast_serialization_matches_schema(client, auth_headers, db_session):
+    """Prueba que los listados serializados con orjson coincidan con CitaOut"""
+    from fastapi.encoders import jsonable_encoder
+    from app.models.cita import Cita
+    from app.schemas.cita import CitaOut
+
+    future_date = datetime.now(timezone.utc) + timedelta(days=1)
+    while future_date.weekday() >= 5:
+        future_date += timedelta(days=1)
+    future_date = future_date.replace(hour=9, minute=30, second=0, microsecond=0)
+    client.post("/citas/", json={"motivo": "Pediatría", "fecha_hora": future_date.isoformat(), "notas": "Ñandú"}, headers=auth_headers)
+
+    response = client.get("/citas/", headers=auth_headers)
+    assert response.headers["content-type"] == "application/json"
+    esperado = jsonable_encoder([CitaOut.model_validate(c) for c in db_session.query(Cita).all()])
+    assert response.json() == {"success": True, "mensaje": "Citas obtenidas exitosamente", "datos": {"citas": esperado}}
+
+def test_conditional_get_with_etag(client, auth_headers):
+    """Prueba ETag y 304 en GET /citas/ y /citas/hoy"""
+    from app.utils.perfilador import presupuesto_consultas
+
+    response = client.get("/citas/", headers=auth_headers)
+    etag_vacio = response.headers["ETag"]
+    assert etag_vacio.startswith('"citas-')
+    assert response.headers["Cache-Control"] == "private, no-cache"
+
+    # Solo se consulta la versión: ni filas ni serialización
+    with presupuesto_consultas(1):
+        response = client.get("/citas/", headers={**auth_headers, "If-None-Match": etag_vacio})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag_vacio
+
+    future_date = datetime.now(timezone.utc) + timedelta(days=1)
+    while future_date.weekday() >= 5:
+        future_date += timedelta(days=1)
+    future_date = future_date.replace(hour=15, minute=0, second=0, microsecond=0)
+    cita_id = client.post("/citas/", json={"motivo": "Laboratorio", "fecha_hora": future_date.isoformat()}, headers=auth_headers).json()["datos"]["cita"]
+
+    response = client.get("/citas/", headers={**auth_headers, "If-None-Match": etag_vacio})
+    assert response.status_code == 200
+    etag_con_cita = response.headers["ETag"]
+    assert etag_con_cita != etag_vacio
+    assert client.get("/citas/", headers={**auth_headers, "If-None-Match": f"W/{etag_con_cita}"}).status_code == 304
+
+    # Cancelar cambia updated_at y por tanto la versión
+    client.delete(f"/citas/{cita_id}", headers=auth_headers)
+    assert client.get("/citas/", headers={**auth_headers, "If-None-Match": etag_con_cita}).status_code == 200
+
+    # Un ETag de otro listado no sirve para /citas/hoy
+    response = client.get("/citas/hoy", headers={**auth_headers, "If-None-Match": etag_con_cita})
+    assert response.status_code == 200
+    assert response.headers["ETag"].startswith('"hoy-')
+    assert client.get("/citas/hoy", headers={**auth_headers, "If-None-Match": response.headers["ETag"]}).status_code == 304
+
+def test_patient_listing_includes_past_months(client, auth_headers, test_user, db_session):
+    """Prueba que mis citas incluyan las completadas de meses anteriores salvo que se pida `desde`"""
+    from app.models.cita import Cita
+    inicio_mes = datetime.now(timezone.utc).replace(day=1, hour=9, minute=0, second=0, microsecond=0)
+    pasada = inicio_mes - timedelta(days=40)
+    db_session.add_all([
+        Cita(motivo="Laboratorio", fecha_hora=inicio_mes, paciente_id=test_user.id, estado="completada"),
+        Cita(motivo="Laboratorio", fecha_hora=pasada, paciente_id=test_user.id, estado="completada"),
+    ])
+    db_session.commit()
+
+    response = client.get("/citas/", headers=auth_headers)
+    assert sorted(c["fecha_hora"][:10] for c in response.json()["datos"]["citas"]) == [
+        pasada.date().isoformat(), inicio_mes.date().isoformat()
+    ]
+    etag = response.headers["ETag"]
+
+    params = {"desde": inicio_mes.replace(hour=0).isoformat()}
+    response = client.get("/citas/", params=params, headers=auth_headers)
+    assert [c["fecha_hora"][:10] for c in response.json()["datos"]["citas"]] == [inicio_mes.date().isoformat()]
+    # Cada rango tiene su propia versión
+    assert response.headers["ETag"] != etag
+    assert client.get("/citas/", params=params, headers={**auth_headers, "If-None-Match": response.headers["ETag"]}).status_code == 304
+
+def test_msgpack_negotiation(client, auth_headers, admin_headers):
+    """Prueba que Accept: application/msgpack devuelva el mismo sobre con fechas como Timestamp"""
+    msgpack = pytest.importorskip("msgpack")
+
+    future_date = datetime.now(timezone.utc) + timedelta(days=1)
+    while future_date.weekday() >= 5:
+        future_date += timedelta(days=1)
+    future_date = future_date.replace(hour=16, minute=0, second=0, microsecond=0)
+    client.post("/citas/", json={"motivo": "Cardiología", "fecha_hora": future_date.isoformat()}, headers=auth_headers)
+
+    en_json = client.get("/citas/", headers=auth_headers)
+    response = client.get("/citas/", headers={**auth_headers, "Accept": "application/msgpack, application/json;q=0.5"})
+    assert response.headers["content-type"] == "application/msgpack"
+    assert "Accept" in response.headers["Vary"]
+    assert response.headers["ETag"] != en_json.headers["ETag"]
+    sobre = msgpack.unpackb(response.content, timestamp=3)
+    cita = sobre["datos"]["citas"][0]
+    assert sobre["mensaje"] == en_json.json()["mensaje"]
+    assert cita["fecha_hora"] == future_date
+    assert cita["id"] == en_json.json()["datos"]["citas"][0]["id"]
+
+    # JSON sigue siendo el formato por defecto y gana los empates
+    assert client.get("/citas/hoy", headers={**auth_headers, "Accept": "*/*"}).headers["content-type"] == "application/json"
+    response = client.get("/citas/admin", headers={**admin_headers, "Accept": "application/json, application/msgpack"})
+    assert response.headers["content-type"] == "application/json"
+    response = client.get("/citas/admin", headers={**admin_headers, "Accept": "application/x-msgpack"})
+    assert msgpack.unpackb(response.content, timestamp=3)["datos"]["siguiente_cursor"] is None
+
+def test_resource_scheduling(client, auth_headers, admin_headers, db_session):
+    """Prueba que los conflictos se verifiquen por recurso (doctor o sala) con su horario y capacidad"""
+    from app.models.user import User
+
+    doctores = [
+        client.post("/recursos/", json={"nombre": nombre, "tipo": "doctor", "motivo": "Cardiología"}, headers=admin_headers).json()["datos"]["recurso"]["id"]
+        for nombre in ("Dra. Ruiz", "Dr. Soto")
+    ]
+    sala = client.post("/recursos/", json={
+        "nombre": "Sala de extracciones", "tipo": "sala", "motivo": "Laboratorio",
+        "capacidad": 2, "hora_inicio": "09:00:00", "hora_fin": "11:00:00"
+    }, headers=admin_headers).json()["datos"]["recurso"]["id"]
+    assert client.post("/recursos/", json={"nombre": "Sala X", "tipo": "sala", "motivo": "Laboratorio"}, headers=auth_headers).status_code == 403
+
+    pacientes = [User(username=f"paciente{i}", email=f"paciente{i}@example.com", full_name=f"Paciente {i}",
+                      hashed_password="x", role="paciente") for i in range(3)]
+    db_session.add_all(pacientes)
+    db_session.commit()
+
+    fecha = _proximo_dia_laborable()
+    response = client.post("/citas/", json={"motivo": "Cardiología", "fecha_hora": fecha.isoformat()}, headers=auth_headers)
+    assert response.json()["datos"]["recurso_id"] == doctores[0]
+
+    # A la misma hora queda un doctor libre; el tercero choca con el ya asignado del lote
+    response = client.post("/citas/batch", json={"citas": [
+        {"motivo": "Cardiología", "fecha_hora": fecha.isoformat(), "paciente_id": p.id} for p in pacientes[:2]
+    ] + [
+        {"motivo": "Laboratorio", "fecha_hora": (fecha - timedelta(minutes=90)).isoformat(), "paciente_id": pacientes[2].id, "recurso_id": sala}
+    ]}, headers=admin_headers)
+    resultados = response.json()["datos"]["resultados"]
+    assert resultados[0]["recurso_id"] == doctores[1]
+    assert "mismo lote" in resultados[1]["mensaje"]
+    assert resultados[2]["success"] is False and "horario" in resultados[2]["mensaje"]
+
+    # Sin recursos, Medicina General sigue en la agenda general, independiente de Cardiología
+    response = client.post("/citas/", json={"motivo": "Medicina General", "fecha_hora": fecha.isoformat()}, headers=admin_headers)
+    assert response.status_code == 200 and response.json()["datos"]["recurso_id"] is None
+
+    response = client.post("/citas/", json={"motivo": "Laboratorio", "fecha_hora": fecha.isoformat(), "recurso_id": doctores[0]}, headers=auth_headers)
+    assert "no atiende este servicio" in response.json()["mensaje"]
+
+    response = client.get("/citas/disponibilidad", params={"fecha": fecha.date().isoformat(), "motivo": "Cardiología"}, headers=auth_headers)
+    libres = [datetime.fromisoformat(s).strftime("%H:%M") for s in response.json()["datos"]["slots_libres"]]
+    assert "10:00" not in libres and "11:00" in libres
+    response = client.get("/citas/disponibilidad", params={"fecha": fecha.date().isoformat(), "recurso_id": sala}, headers=auth_headers)
+    libres = [datetime.fromisoformat(s).strftime("%H:%M") for s in response.json()["datos"]["slots_libres"]]
+    assert libres[0] == "09:00" and libres[-1] == "11:00"
+
+    # Un recurso inactivo deja de recibir citas y de aparecer para los pacientes
+    client.put(f"/recursos/{doctores[1]}", json={"activo": False}, headers=admin_headers)
+    assert [r["id"] for r in client.get("/recursos/", headers=auth_headers).json()["datos"]["recursos"]] == [doctores[0], sala]
+    assert len(client.get("/recursos/", headers=admin_headers).json()["datos"]["recursos"]) == 3
+
+def test_edit_reassigns_resource_and_slot(client, auth_headers, admin_headers, test_user, db_session):
+    """Prueba que editar servicio u hora vuelva a elegir recurso, horario y plaza como al crear"""
+    from app.models.cita import Cita
+    from app.models.user import User
+
+    doctores = [
+        client.post("/recursos/", json={"nombre": nombre, "tipo": "doctor", "motivo": "Cardiología"}, headers=admin_headers).json()["datos"]["recurso"]["id"]
+        for nombre in ("Dra. Ruiz", "Dr. Soto")
+    ]
+    sala = client.post("/recursos/", json={
+        "nombre": "Sala de extracciones", "tipo": "sala", "motivo": "Laboratorio",
+        "capacidad": 2, "hora_inicio": "09:00:00", "hora_fin": "11:00:00"
+    }, headers=admin_headers).json()["datos"]["recurso"]["id"]
+    otro = User(username="otro", email="otro@example.com", full_name="Otro", hashed_password="x", role="paciente")
+    db_session.add(otro)
+    db_session.commit()
+
+    fecha = _proximo_dia_laborable()
+    cita_id = client.post("/citas/", json={"motivo": "Cardiología", "fecha_hora": fecha.isoformat()}, headers=auth_headers).json()["datos"]["cita"]
+    db_session.add(Cita(motivo="Laboratorio", fecha_hora=fecha, paciente_id=otro.id, recurso_id=sala, plaza=0, estado="programada"))
+    db_session.commit()
+
+    def cita():
+        db_session.expire_all()
+        return db_session.get(Cita, cita_id)
+
+    # Cambiar de servicio cambia de recurso y toma la plaza libre de la sala
+    assert client.put(f"/citas/{cita_id}", json={"motivo": "Laboratorio"}, headers=auth_headers).status_code == 200
+    assert (cita().recurso_id, cita().plaza) == (sala, 1)
+
+    # La sala no atiende por la tarde: la cita no se mueve
+    response = client.put(f"/citas/{cita_id}", json={"fecha_hora": fecha.replace(hour=15).isoformat()}, headers=auth_headers)
+    assert "atiende en ese horario" in response.json()["mensaje"]
+    assert cita().fecha_hora == fecha.replace(tzinfo=None)
+
+    # De vuelta a Cardiología con la Dra. Ruiz ocupada por otra cita: pasa al Dr. Soto
+    db_session.add(Cita(motivo="Cardiología", fecha_hora=fecha, paciente_id=otro.id, recurso_id=doctores[0], estado="programada"))
+    db_session.commit()
+    assert client.put(f"/citas/admin/{cita_id}", json={"motivo": "Cardiología"}, headers=admin_headers).status_code == 200
+    assert (cita().recurso_id, cita().plaza) == (doctores[1], 0)
+
+    # Cambiar solo la hora conserva el doctor si tiene hueco
+    assert client.put(f"/citas/{cita_id}", json={"fecha_hora": (fecha + timedelta(hours=2)).isoformat()}, headers=auth_headers).status_code == 200
+    assert cita().recurso_id == doctores[1]
+
+def test_concurrent_bookings_single_winner(tmp_path):
+    """Prueba que de 500 reservas simultáneas del mismo horario gane exactamente una"""
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from sqlalchemy import create_engine, func, insert, select
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import NullPool
+    from app.database import Base
+    from app.models.cita import Cita
+    from app.models.user import User
+    from app.services import cita_service
+    from app.services.disponibilidad_service import indice_disponibilidad
+    from app.utils.replicas import SesionEnrutada
+
+    reservas = 500
+    # Una conexión por hilo: las reservas compiten de verdad en la base de datos
+    engine = create_engine(f"sqlite:///{tmp_path / 'carrera.db'}", connect_args={"check_same_thread": False, "timeout": 60}, poolclass=NullPool)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {"id": i, "username": f"p{i}", "email": f"p{i}@example.com", "full_name": f"Paciente {i}",
+             "hashed_password": "x", "role": "paciente"} for i in range(1, reservas + 1)
+        ])
+    Sesion = sessionmaker(bind=engine, autoflush=False, class_=SesionEnrutada)
+    indice_disponibilidad.limpiar()
+    fecha = _proximo_dia_laborable(60)
+    salida = threading.Barrier(reservas)
+
+    def reservar(paciente_id):
+        db = Sesion()
+        try:
+            salida.wait()
+            cita, error = cita_service.crear_cita("Cardiología", fecha, paciente_id, None, db)
+            return cita.id if cita else error
+        finally:
+            db.close()
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=reservas) as ejecutor:
+        resultados = list(ejecutor.map(reservar, range(1, reservas + 1)))
+    duracion = time.perf_counter() - inicio
+
+    errores = [r for r in resultados if isinstance(r, str)]
+    assert len(resultados) - len(errores) == 1
+    assert all(e.startswith("Ya existe una cita programada") for e in errores), set(errores)
+    with engine.connect() as conn:
+        assert conn.execute(select(func.count()).select_from(Cita).where(Cita.estado == "programada")).scalar() == 1
+    engine.dispose()
+    indice_disponibilidad.limpiar()
+    print(f"{reservas} reservas simultáneas en {duracion:.2f}s ({reservas / duracion:.0f} reservas/s), 1 aceptada")
+
+def test_idempotency_key_replays_response(client, auth_headers, db_session):
+    """Prueba que un reintento con la misma Idempotency-Key reciba la respuesta original"""
+    from app.models.cita import Cita
+    fecha = _proximo_dia_laborable(70)
+    datos = {"motivo": "Medicina General", "fecha_hora": fecha.isoformat()}
+    cabeceras = {**auth_headers, "Idempotency-Key": "reserva-1"}
+
+    primera = client.post("/citas/", json=datos, headers=cabeceras)
+    assert primera.status_code == 200
+    assert "Idempotent-Replayed" not in primera.headers
+    # Sin la cabecera el reintento chocaría con la cita recién creada
+    repetida = client.post("/citas/", json=datos, headers=cabeceras)
+    assert repetida.status_code == 200
+    assert repetida.headers["Idempotent-Replayed"] == "true"
+    assert repetida.content == primera.content
+    assert db_session.query(Cita).count() == 1
+
+    otra = client.post("/citas/", json={**datos, "notas": "otra"}, headers=cabeceras)
+    assert otra.status_code == 422
+    cita_id = primera.json()["datos"]["cita"]
+    borrado = {**auth_headers, "Idempotency-Key": "cancelar-1"}
+    assert client.delete(f"/citas/{cita_id}", headers=borrado).status_code == 200
+    assert client.delete(f"/citas/{cita_id}", headers=borrado).headers["Idempotent-Replayed"] == "true"
+    assert client.post("/citas/", json=datos, headers={**auth_headers, "Idempotency-Key": "x" * 300}).status_code == 400
+
+def test_idempotency_coalesces_concurrent_duplicates(client, auth_headers, db_session):
+    """Prueba que los duplicados simultáneos esperen a la original en lugar de ejecutarse"""
+    import asyncio
+    import httpx
+    from app.main import app
+    from app.models.cita import Cita
+    fecha = _proximo_dia_laborable(80)
+    datos = {"motivo": "Medicina General", "fecha_hora": fecha.isoformat()}
+    cabeceras = {**auth_headers, "Idempotency-Key": "reserva-simultanea"}
+
+    async def enviar():
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://localhost") as cliente:
+            return await asyncio.gather(*(cliente.post("/citas/", json=datos, headers=cabeceras) for _ in range(5)))
+
+    respuestas = asyncio.run(enviar())
+    assert [r.status_code for r in respuestas] == [200] * 5
+    assert len({r.content for r in respuestas}) == 1
+    assert sum("Idempotent-Replayed" in r.headers for r in respuestas) == 4
+    assert db_session.query(Cita).count() == 1
+
+def test_idempotency_retries_after_concurrent_5xx(auth_headers):
+    """Prueba que los duplicados que esperaban a una original terminada en 500 la reintenten en vez de repetir el error"""
+    import asyncio
+    from starlette.requests import Request
+    from starlette.responses import StreamingResponse
+    from app.utils.idempotencia import AlmacenMemoria, Idempotencia
+    idempotencia = Idempotencia(AlmacenMemoria())
+    ejecuciones = []
+
+    async def call_next(request):
+        ejecuciones.append(request)
+        await asyncio.sleep(0.05)
+        # Como call_next en un middleware: respuesta con el cuerpo en streaming
+        return StreamingResponse(iter([b"{}"]), status_code=500 if len(ejecuciones) == 1 else 200)
+
+    def peticion():
+        scope = {
+            "type": "http", "method": "POST", "path": "/citas/", "query_string": b"",
+            "headers": [(b"authorization", auth_headers["Authorization"].encode()), (b"idempotency-key", b"fallo-1")],
+        }
+        async def recibir():
+            return {"type": "http.request", "body": b"{}", "more_body": False}
+        return Request(scope, recibir)
+
+    async def enviar():
+        return await asyncio.gather(*(idempotencia.procesar(peticion(), call_next) for _ in range(3)))
+
+    respuestas = asyncio.run(enviar())
+    assert sorted(r.status_code for r in respuestas) == [200, 200, 500]
+    assert "Idempotent-Replayed" not in respuestas[0].headers
+    # Uno de los duplicados reintenta; el otro recibe esa respuesta repetida
+    assert len(ejecuciones) == 2
+    assert sum("Idempotent-Replayed" in r.headers for r in respuestas) == 1
+
+def test_idempotency_db_store(setup_database):
+    """Prueba el almacén compartido entre workers: una sola original y reservas abandonadas retomables"""
+    from app.utils.idempotencia import AlmacenDB, RespuestaGuardada
+    from tests.conftest import engine
+    almacen = AlmacenDB(engine)
+
+    assert almacen.reservar("u:k", "h1", 100.0, 30) is None
+    en_curso = almacen.reservar("u:k", "h1", 101.0, 30)
+    assert en_curso.en_curso and en_curso.huella == "h1"
+    almacen.guardar("u:k", RespuestaGuardada("h1", 1000.0, 201, [("content-type", "application/json")], b"{}"))
+    guardada = almacen.reservar("u:k", "h1", 102.0, 30)
+    assert (guardada.estado, guardada.cabeceras, guardada.cuerpo) == (201, [["content-type", "application/json"]], b"{}")
+    # Otra clave cuya original no terminó: pasado el plazo la retoma otro worker
+    assert almacen.reservar("u:j", "h2", 100.0, 30) is None
+    assert almacen.reservar("u:j", "h2", 131.0, 30) is None
+    almacen.liberar("u:j")
+    assert almacen.reservar("u:j", "h2", 132.0, 30) is None
+
+def test_change_feed_stream(client, auth_headers, test_user, test_admin):
+    """Prueba que /citas/stream entregue los cambios de las citas del paciente y no los de otros"""
+    import asyncio
+    import json
+    from starlette.concurrency import run_in_threadpool
+    from app.main import app
+    from app.services import cita_service
+    from app.utils.eventos import broker_citas
+    from tests.conftest import TestingSessionLocal
+    fecha = _proximo_dia_laborable(90)
+
+    def crear(paciente_id, horas):
+        db = TestingSessionLocal()
+        try:
+            return cita_service.crear_cita("Medicina General", fecha + timedelta(hours=horas), paciente_id, None, db)[0].id
+        finally:
+            db.close()
+
+    async def escuchar():
+        # Petición ASGI directa: el cuerpo de la respuesta no termina hasta que el cliente se desconecta
+        entrada, salida = asyncio.Queue(), asyncio.Queue()
+        await entrada.put({"type": "http.request", "body": b"", "more_body": False})
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+            "path": "/citas/stream", "raw_path": b"/citas/stream", "query_string": b"", "root_path": "",
+            "headers": [(b"host", b"localhost"), (b"authorization", auth_headers["Authorization"].encode())],
+            "client": ("127.0.0.1", 50000), "server": ("localhost", 80),
+        }
+        tarea = asyncio.create_task(app(scope, entrada.get, salida.put))
+        inicio = await asyncio.wait_for(salida.get(), 5)
+        assert (await asyncio.wait_for(salida.get(), 5))["body"].startswith(b"retry:")
+        await run_in_threadpool(crear, test_admin.id, 0)
+        propia = await run_in_threadpool(crear, test_user.id, 2)
+        evento = (await asyncio.wait_for(salida.get(), 5))["body"]
+        await entrada.put({"type": "http.disconnect"})
+        await asyncio.wait_for(tarea, 5)
+        return inicio, evento, propia
+
+    inicio, evento, propia = asyncio.run(escuchar())
+    assert inicio["status"] == 200
+    assert dict(inicio["headers"])[b"content-type"].startswith(b"text/event-stream")
+    # El primer evento es el de su cita: el de la otra paciente no le llega
+    assert evento.startswith(b"event: creada\ndata: ")
+    datos = json.loads(evento.split(b"data: ", 1)[1])
+    assert (datos["id"], datos["paciente_id"], datos["estado"]) == (propia, test_user.id, "programada")
+    assert broker_citas.suscritos() == 0
+    assert client.get("/citas/stream").status_code == 401
+
+def test_change_feed_backpressure_and_fanout(tmp_path):
+    """Prueba que un cliente lento se desconecte y que los eventos lleguen a los clientes de otro worker"""
+    import asyncio
+    from app.utils.eventos import BrokerCitas
+    cita = {"id": 1, "paciente_id": 7, "recurso_id": None, "motivo": "Odontología",
+            "fecha_hora": datetime(2030, 1, 7, 10), "estado": "programada", "notas": None}
+
+    async def probar():
+        broker = BrokerCitas(maximo_cola=2, latido=60)
+        lenta = broker.suscribir(7)
+        broker.publicar("creada", [cita] * 3)
+        tramas = [trama async for trama in broker.flujo_sse(lenta)]
+        assert tramas[-1].startswith(b"event: desbordado") and broker.suscritos() == 0
+
+        # Un cliente sin eventos recibe latidos
+        latiendo = BrokerCitas(latido=0.01)
+        flujo = latiendo.flujo_sse(latiendo.suscribir(1))
+        assert (await anext(flujo)).startswith(b"retry:")
+        assert await asyncio.wait_for(anext(flujo), 5) == b": latido\n\n"
+        await flujo.aclose()
+        latiendo.cerrar()
+
+        # Dos "workers" que comparten el directorio de sockets
+        worker_a = BrokerCitas(directorio=str(tmp_path))
+        worker_b = BrokerCitas(directorio=str(tmp_path))
+        admin, paciente_7, paciente_8 = worker_b.suscribir(None), worker_b.suscribir(7), worker_b.suscribir(8)
+        worker_a.publicar("editada", [cita])
+        for suscripcion in (admin, paciente_7):
+            assert (await asyncio.wait_for(suscripcion.cola.get(), 5)).startswith(b"event: editada\ndata: {\"id\":1")
+        assert paciente_8.cola.empty()
+        worker_a.cerrar()
+        worker_b.cerrar()
+        assert list(tmp_path.iterdir()) == []
+
+    asyncio.run(probar())
+
+def test_lifecycle_closes_overdue_and_generates_reminders(db_session, test_user):
+    """Prueba el cierre por trozos de las citas vencidas y que los recordatorios no se dupliquen"""
+    from app.models.cita import Cita
+    from app.models.recordatorio import Recordatorio
+    from app.services.ciclo_service import cerrar_vencidas, generar_recordatorios
+    ahora = datetime(2030, 1, 7, 12)
+    for horas, estado in ((-30, "programada"), (-5, "programada"), (-4, "programada"), (-3, "cancelada"),
+                          (0, "programada"), (5, "programada"), (30, "programada")):
+        db_session.add(Cita(motivo="Medicina General", fecha_hora=ahora + timedelta(hours=horas),
+                            paciente_id=test_user.id, estado=estado))
+    db_session.commit()
+
+    assert cerrar_vencidas(db_session, ahora=ahora, estado="no_asistio", lote=2) == 3
+    estados = [c.estado for c in db_session.query(Cita).order_by(Cita.fecha_hora)]
+    assert estados == ["no_asistio", "no_asistio", "no_asistio", "cancelada", "programada", "programada", "programada"]
+    with pytest.raises(ValueError):
+        cerrar_vencidas(db_session, ahora=ahora, estado="cancelada")
+
+    # Citas de las próximas 24 horas: la de dentro de 30 horas aún no
+    assert generar_recordatorios(db_session, ahora=ahora, lote=1) == 2
+    assert generar_recordatorios(db_session, ahora=ahora, lote=1) == 0
+    # Si la cita cambia de hora se genera otro recordatorio
+    cita = db_session.query(Cita).filter(Cita.fecha_hora == ahora).one()
+    cita.fecha_hora = ahora + timedelta(hours=1)
+    db_session.commit()
+    assert generar_recordatorios(db_session, ahora=ahora) == 1
+    assert db_session.query(Recordatorio).filter(Recordatorio.estado == "pendiente").count() == 3
+
+def test_cancel_and_delete_remove_reminders(client, auth_headers, admin_headers, test_user, db_session):
+    """Prueba que cancelar o eliminar una cita borre sus recordatorios pendientes"""
+    from app.models.cita import Cita
+    from app.models.recordatorio import Recordatorio
+    from app.services.ciclo_service import generar_recordatorios
+    ahora = datetime.now(timezone.utc)
+    citas = [Cita(motivo="Medicina General", fecha_hora=ahora + timedelta(hours=horas),
+                  paciente_id=test_user.id, estado="programada") for horas in (2, 3, 4)]
+    db_session.add_all(citas)
+    db_session.commit()
+    assert generar_recordatorios(db_session, ahora=ahora) == 3
+    ids = [cita.id for cita in citas]
+
+    assert client.delete(f"/citas/{ids[0]}", headers=auth_headers).status_code == 200
+    assert client.delete(f"/citas/admin/{ids[1]}", headers=admin_headers).status_code == 200
+    db_session.expire_all()
+    assert [r.cita_id for r in db_session.query(Recordatorio)] == [ids[2]]
+
+def test_scheduler_runs_each_task_in_one_instance(setup_database):
+    """Prueba que con dos instancias solo el titular del arriendo ejecute la tarea y que otra la tome al expirar"""
+    import asyncio
+    from app.utils.planificador import ArriendoTareas, Planificador
+    from tests.conftest import engine, TestingSessionLocal
+    ejecuciones = []
+    tareas = [("contar", lambda db: ejecuciones.append(db) or len(ejecuciones), 10)]
+    primera = Planificador(tareas, ArriendoTareas(engine, "a"), TestingSessionLocal)
+    segunda = Planificador(tareas, ArriendoTareas(engine, "b"), TestingSessionLocal)
+
+    async def probar():
+        assert await primera.ejecutar_pendientes(100.0) == {"contar": 1}
+        assert await segunda.ejecutar_pendientes(100.0) == {}
+        # Antes del intervalo no se repite; después, el titular renueva y la segunda sigue fuera
+        assert await primera.ejecutar_pendientes(105.0) == {}
+        assert await primera.ejecutar_pendientes(110.0) == {"contar": 2}
+        assert await segunda.ejecutar_pendientes(120.0) == {}
+        # La primera deja de ejecutarse: al expirar su arriendo (3 intervalos) la toma la segunda
+        assert await segunda.ejecutar_pendientes(141.0) == {"contar": 3}
+        assert await primera.ejecutar_pendientes(145.0) == {}
+
+    asyncio.run(probar())
+
+def test_archive_moves_old_citas_and_export_reads_archive(client, admin_headers, test_user, db_session):
+    """Prueba el archivo por trozos de las citas antiguas (sin particiones) y su exportación"""
+    import json
+    from app.models.cita import Cita
+    from app.models.cita_archivada import CitaArchivada
+    from app.models.recordatorio import Recordatorio
+    from app.services.archivo_service import archivar_citas, crear_particiones, sumar_meses
+    ahora = datetime(2030, 3, 15, 12)
+    for fecha in (datetime(2029, 1, 31, 9), datetime(2029, 2, 27, 9), datetime(2029, 3, 1, 9), datetime(2030, 3, 20, 9)):
+        db_session.add(Cita(motivo="Pediatría", fecha_hora=fecha, paciente_id=test_user.id, estado="completada"))
+    db_session.commit()
+    db_session.add(Recordatorio(cita_id=1, paciente_id=test_user.id, fecha_hora=datetime(2029, 1, 31, 9),
+                                created_at=datetime(2029, 1, 30, 9)))
+    db_session.commit()
+
+    assert sumar_meses(datetime(2030, 3, 1), -12) == datetime(2029, 3, 1)
+    assert sumar_meses(datetime(2029, 12, 1), 1) == datetime(2030, 1, 1)
+    # SQLite no tiene particiones: no hay nada que crear y el archivo mueve filas
+    assert crear_particiones(db_session, ahora=ahora) == 0
+    # Sin CITAS_ARCHIVO_MESES el archivo está desactivado
+    assert archivar_citas(db_session, ahora=ahora) == 0
+    assert db_session.query(Cita).count() == 4 and db_session.query(CitaArchivada).count() == 0
+    assert archivar_citas(db_session, ahora=ahora, meses=12, lote=1) == 2
+    assert archivar_citas(db_session, ahora=ahora, meses=12) == 0
+    assert [c.fecha_hora.month for c in db_session.query(Cita).order_by(Cita.fecha_hora)] == [3, 3]
+    assert db_session.query(CitaArchivada).count() == 2
+    assert db_session.query(Recordatorio).count() == 0
+
+    response = client.get("/citas/admin/exportar", params={"origen": "archivo"}, headers=admin_headers)
+    assert response.status_code == 200
+    filas = [json.loads(linea) for linea in response.text.splitlines()]
+    assert [f["fecha_hora"][:10] for f in filas] == ["2029-01-31", "2029-02-27"]
+    activas = client.get("/citas/admin/exportar", headers=admin_headers).text.splitlines()
+    assert len(activas) == 2
+    assert client.get("/citas/admin/exportar", params={"origen": "otra"}, headers=admin_headers).status_code == 422
+
+def test_migrations_match_models(tmp_path, monkeypatch):
+    """Prueba que `alembic upgrade head` deje el esquema igual que los modelos (`alembic check`)"""
+    from pathlib import Path
+    from alembic import command
+    from alembic.config import Config
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'migraciones.db'}")
+    # Sin archivo .ini: env.py no reconfigura el logging de la suite
+    config = Config()
+    config.set_main_option("script_location", str(Path(__file__).resolve().parent.parent / "alembic"))
+    command.upgrade(config, "head")
+    command.check(config)
@@ -13,7 +13,9 @@ def test_create_user_by_admin(client, admin_headers):
     
     response = client.post("/users/admin/crear", json=user_data, headers=admin_headers)
     assert response.status_code == 200
-    assert response.json()["success"] is True
+    usuario = response.json()
+    assert usuario["username"] == "newuser" and usuario["role"] == "doctor"
+    assert "hashed_password" not in usuario
 
 def test_patient_cannot_create_users(client, auth_headers):
     """Prueba que un paciente no pueda crear usuarios"""
@@ -68,3 +70,42 @@ def test_create_user_invalid_role(client, admin_headers):
     
     response = client.post("/users/admin/crear", json=user_data, headers=admin_headers)
     assert response.status_code == 422  # Validation error
+
+def test_bulk_import_users_csv(client, admin_headers, test_user):
+    """Prueba la importación masiva: crea los válidos y reporta el resto por fila"""
+    contenido = (
+        "username,email,password,full_name,role\n"
+        "paciente1,paciente1@example.com,Paciente123,Paciente Uno,paciente\n"
+        "doctor1,doctor1@example.com,Doctor1234,Doctor Uno,doctor\n"
+        "testuser,otro@example.com,Paciente123,Ya Existe,paciente\n"
+        "paciente2,test@example.com,Paciente123,Email Existente,paciente\n"
+        "paciente1,repetido@example.com,Paciente123,Repetido,paciente\n"
+        "malo,malo@example.com,corta,Clave Corta,paciente\n"
+    )
+    response = client.post(
+        "/users/admin/importar",
+        files={"archivo": ("usuarios.csv", contenido, "text/csv")},
+        headers=admin_headers
+    )
+    assert response.status_code == 200
+    datos = response.json()["datos"]
+    assert datos["total"] == 6
+    assert datos["creados"] == 2
+    assert [e["fila"] for e in datos["errores"]] == [3, 4, 5, 6]
+    assert "ya existe" in datos["errores"][0]["error"]
+    assert "email ya está registrado" in datos["errores"][1]["error"]
+    assert "repetido en el archivo" in datos["errores"][2]["error"]
+    assert "password" in datos["errores"][3]["error"]
+
+    login = client.post("/auth/login", data={"username": "doctor1", "password": "Doctor1234"})
+    assert login.status_code == 200
+
+def test_bulk_import_users_jsonl_requires_admin(client, auth_headers):
+    """Prueba que un paciente no pueda importar usuarios"""
+    contenido = '{"username": "nuevo", "email": "nuevo@example.com", "password": "Nuevo1234", "full_name": "Nuevo", "role": "paciente"}\n'
+    response = client.post(
+        "/users/admin/importar",
+        files={"archivo": ("usuarios.jsonl", contenido, "application/x-ndjson")},
+        headers=auth_headers
+    )
+    assert response.status_code == 403
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Ejecuta las tareas periódicas del ciclo de vida de las citas fuera de la API.
+
+Cierra las citas programadas vencidas (CITAS_VENCIDAS_ESTADO) y genera los
+recordatorios de las próximas (RECORDATORIOS_ANTELACION). Pensado para
+desplegarse con PLANIFICADOR=false en los workers web; se pueden lanzar
+varias copias: el arriendo de la tabla liderazgo reparte cada tarea a una sola.
+
+Uso:
+    python worker.py
+    python worker.py --una-vez
+"""
+import argparse
+import asyncio
+import os
+import signal
+import sys
+
+# Agregar el directorio raíz al path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.models.user import User  # noqa: F401  (relaciones de Cita)
+from app.models.recurso import Recurso  # noqa: F401
+from app.utils.planificador import planificador
+
+
+async def ejecutar(una_vez: bool):
+    if una_vez:
+        resultados = await planificador.ejecutar_pendientes()
+        for nombre, total in resultados.items():
+            print(f"{nombre}: {total}")
+        return
+    parar = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for senal in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(senal, parar.set)
+    planificador.iniciar()
+    await parar.wait()
+    await planificador.detener()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--una-vez", action="store_true", help="ejecutar cada tarea una vez y salir")
+    args = parser.parse_args()
+    asyncio.run(ejecutar(args.una_vez))
+
+
+if __name__ == "__main__":
+    main()